@@ -12,6 +12,10 @@ from ...models import (
 from ...migration_service import MigrationService
 from ...security_utils import SecurityUtils, SecurityValidationError
 from ...config import get_config
+from ...bandwidth import BandwidthLease, get_bandwidth_allocator
+from ...compression_planner import CompressionPlanner, CompressionDecision
+from ...checksum_engine import get_checksum_engine
+from ...known_hosts import get_known_hosts_index, scan_host_key
 
 router = APIRouter(
     prefix="/api/migrations",
@@ -177,42 +181,22 @@ async def add_ssh_host_key(target_host: str, ssh_port: int = 22) -> dict:
     }
     
     try:
-        import os
-        from pathlib import Path
+        SecurityUtils.validate_hostname(target_host)
+        SecurityUtils.validate_port(ssh_port)
+        known_hosts = get_known_hosts_index()
         
-        # Ensure .ssh directory exists
-        ssh_dir = Path.home() / ".ssh"
-        ssh_dir.mkdir(mode=0o700, exist_ok=True)
-        
-        known_hosts_file = ssh_dir / "known_hosts"
+        # Check if host key already exists
+        if known_hosts.knows(target_host, ssh_port):
+            result["message"] = f"Host key for {target_host} already exists in known_hosts"
+            result["success"] = True
+            return result
         
         # Use ssh-keyscan to get host key
-        process = await asyncio.create_subprocess_exec(
-            "ssh-keyscan", "-p", str(ssh_port), target_host,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        
-        stdout, stderr = await process.communicate()
+        key_lines = await scan_host_key(target_host, ssh_port)
         
-        if process.returncode == 0 and stdout:
-            host_key = stdout.decode().strip()
-            
-            # Check if host key already exists
-            if known_hosts_file.exists():
-                with open(known_hosts_file, 'r') as f:
-                    existing_keys = f.read()
-                    if target_host in existing_keys:
-                        result["message"] = f"Host key for {target_host} already exists in known_hosts"
-                        result["success"] = True
-                        return result
-            
+        if key_lines:
             # Append new host key
-            with open(known_hosts_file, 'a') as f:
-                f.write(f"{host_key}\n")
-            
-            # Set proper permissions
-            known_hosts_file.chmod(0o600)
+            known_hosts.add(key_lines)
             
             result["success"] = True
             result["host_key_added"] = True
@@ -220,9 +204,8 @@ async def add_ssh_host_key(target_host: str, ssh_port: int = 22) -> dict:
             logger.info(f"✅ Added SSH host key for {target_host}:{ssh_port}")
             
         else:
-            error_msg = stderr.decode() if stderr else "Unknown error"
-            result["message"] = f"Failed to retrieve host key: {error_msg}"
-            logger.error(f"Failed to get host key for {target_host}: {error_msg}")
+            result["message"] = f"Failed to retrieve host key: no key received from {target_host}:{ssh_port}"
+            logger.error(f"Failed to get host key for {target_host}:{ssh_port}")
             
     except Exception as e:
         result["message"] = f"Error adding host key: {e}"
@@ -725,7 +708,8 @@ async def verify_migration_integrity(
     target_host: str,
     target_path: str,
     ssh_user: str = "root",
-    ssh_port: int = 22
+    ssh_port: int = 22,
+    algorithm: str = "sha256"
 ):
     """
     🔐 VERIFY MIGRATION INTEGRITY
@@ -739,17 +723,27 @@ async def verify_migration_integrity(
     try:
         logger.info(f"🔐 Verifying integrity for migration: {migration_id}")
         
-        # Load source checksums
-        checksum_file = f"/tmp/transdock_checksums_{migration_id}.json"
+        # Load source checksums: fresh ones while the source is still here
+        # (cheap, unchanged files come from the checksum cache), else the
+        # checksum file written by generate_source_checksums, or a legacy
+        # JSON export
+        checksum_file = f"/tmp/checksums-{migration_id}.txt"
+        legacy_checksum_file = f"/tmp/transdock_checksums_{migration_id}.json"
         
         import json
-        import os
-        if not os.path.exists(checksum_file):
+        if os.path.isdir(source_path):
+            summary = await generate_source_checksums(source_path, migration_id, algorithm)
+            if summary["error_count"]:
+                raise HTTPException(status_code=500, detail=f"Source checksums failed: {summary['errors'][:10]}")
+            source_checksums = {"checksum_file": checksum_file, "algorithm": algorithm}
+        elif os.path.exists(checksum_file):
+            source_checksums = {"checksum_file": checksum_file, "algorithm": algorithm}
+        elif os.path.exists(legacy_checksum_file):
+            with open(legacy_checksum_file, 'r') as f:
+                source_checksums = json.load(f)
+        else:
             raise HTTPException(status_code=404, detail="Source checksums not found")
         
-        with open(checksum_file, 'r') as f:
-            source_checksums = json.load(f)
-        
         # Verify target checksums
         verification = await verify_target_checksums(
             target_host=target_host,
@@ -760,7 +754,7 @@ async def verify_migration_integrity(
             ssh_port=ssh_port
         )
         
-        if verification["verification_passed"]:
+        if verification["verified"]:
             return {
                 "migration_id": migration_id,
                 "integrity_status": "verified",
@@ -773,16 +767,48 @@ async def verify_migration_integrity(
                 "migration_id": migration_id,
                 "integrity_status": "failed",
                 "verification_details": verification,
-                "message": f"❌ Integrity verification failed: {verification['files_mismatched']} mismatched files",
+                "message": f"❌ Integrity verification failed: {verification['files_mismatched']} mismatched, "
+                           f"{verification['files_missing']} missing files",
                 "recommendation": "IMMEDIATE ROLLBACK RECOMMENDED - Data corruption detected",
                 "critical_warning": "DO NOT use migrated data until integrity issues are resolved"
             }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Integrity verification failed: {e}")
         raise HTTPException(status_code=500, detail=f"Verification failed: {e}") from e
 
 
+@router.post("/compare-trees")
+async def compare_trees(
+    source_path: str,
+    target_host: str,
+    target_path: str,
+    ssh_user: str = "root",
+    ssh_port: int = 22,
+    algorithm: str = "sha256",
+    source_host: Optional[str] = None,
+    source_ssh_user: str = "root",
+    source_ssh_port: int = 22
+):
+    """
+    🌳 COMPARE SOURCE AND TARGET TREES
+
+    Cheap "is the target still identical?" check before a cutover or sync:
+    - Both hosts build a hash tree of directory digests
+    - Only digests of differing directories are exchanged
+    - Returns the exact paths to re-sync
+    """
+    diff = await migration_service.transfer_ops.compare_trees(
+        source_path, target_host, target_path, ssh_user, ssh_port, algorithm,
+        source=(source_host, source_ssh_user, source_ssh_port)
+    )
+    if diff.error:
+        raise HTTPException(status_code=500, detail=f"Tree comparison failed: {diff.error}")
+    return diff.to_dict()
+
+
 # Helper functions for migration operations
 
 class ValidationResult:
@@ -1264,7 +1290,9 @@ async def create_safe_rsync_operation(
     migration_id: str,
     ssh_user: str = "root",
     ssh_port: int = 22,
-    dry_run: bool = True
+    dry_run: bool = True,
+    bandwidth_lease: Optional[BandwidthLease] = None,
+    compression: Optional[CompressionDecision] = None
 ) -> dict:
     """
     🛡️ CREATE SAFE RSYNC OPERATION WITH VALIDATION
@@ -1306,9 +1334,13 @@ async def create_safe_rsync_operation(
             "--exclude=.rsync-backup-*",  # Exclude backup directories
         ]
         
-        # Add bandwidth limit if configured
-        if hasattr(config, 'rsync_bandwidth_limit') and config.rsync_bandwidth_limit:
-            rsync_options.append(f"--bwlimit={config.rsync_bandwidth_limit}")
+        # Replace the default -z with the compression planned for this volume
+        if compression:
+            rsync_options.extend(compression.rsync_args())
+        
+        # Add this transfer's share of the bandwidth budget
+        if bandwidth_lease:
+            rsync_options.extend(bandwidth_lease.rsync_args())
         
         # Add dry run flag if requested
         if dry_run:
@@ -1459,108 +1491,28 @@ async def generate_source_checksums(
     """
     🔐 GENERATE CHECKSUMS FOR SOURCE FILES
     
-    Creates checksums for all files to verify integrity after transfer
+    Creates checksums for all files to verify integrity after transfer.
+    Files are hashed on the checksum engine's process pool and streamed to
+    the checksum file, so the API stays responsive and memory stays flat.
     """
-    import hashlib
-    
-    checksum_result = {
-        "algorithm": algorithm,
-        "checksum_file": f"/tmp/checksums-{migration_id}.txt",
-        "file_count": 0,
-        "total_size": 0,
-        "checksums": {},
-        "errors": []
-    }
+    checksum_file = f"/tmp/checksums-{migration_id}.txt"
     
     try:
-        # Walk through all files
-        for root, _dirs, files in os.walk(source_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                relative_path = os.path.relpath(file_path, source_path)
-                
-                try:
-                    # Calculate checksum
-                    hasher = hashlib.new(algorithm)
-                    with open(file_path, 'rb') as f:
-                        while chunk := f.read(8192):
-                            hasher.update(chunk)
-                    
-                    checksum = hasher.hexdigest()
-                    checksum_result["checksums"][relative_path] = checksum
-                    checksum_result["file_count"] += 1
-                    checksum_result["total_size"] += os.path.getsize(file_path)
-                    
-                except Exception as e:
-                    checksum_result["errors"].append(f"Failed to checksum {relative_path}: {e}")
-        
-        # Save checksums to file
-        with open(checksum_result["checksum_file"], 'w') as f:
-            for path, checksum in checksum_result["checksums"].items():
-                f.write(f"{checksum}  {path}\n")
-        
-        logger.info(f"✅ Generated {checksum_result['file_count']} checksums")
+        summary = await get_checksum_engine().hash_tree(source_path, checksum_file, algorithm)
+        logger.info(f"✅ Generated {summary.file_count} checksums")
+        return summary.to_dict()
         
     except Exception as e:
         logger.error(f"Checksum generation failed: {e}")
-        checksum_result["errors"].append(str(e))
-    
-    return checksum_result
-
-
-async def _verify_single_file_checksum(
-    host_service,
-    host_info,
-    target_path: str,
-    relative_path: str,
-    expected_checksum: str
-) -> dict:
-    """
-    🔐 SAFELY VERIFY CHECKSUM FOR A SINGLE FILE
-    
-    Uses individual secure commands to verify file integrity.
-    Returns detailed result for single file verification.
-    """
-    import shlex
-    
-    result = {
-        "verified": False,
-        "missing": False,
-        "error": None,
-        "actual_checksum": None
-    }
-    
-    try:
-        # Safely escape the file path for shell command
-        safe_file_path = shlex.quote(os.path.join(target_path, relative_path))
-        
-        # Check if file exists first
-        test_cmd = f"test -f {safe_file_path}"
-        test_result = await host_service.run_remote_command(host_info, test_cmd)
-        
-        if test_result[0] != 0:
-            result["missing"] = True
-            return result
-        
-        # Calculate checksum using safe individual command
-        checksum_cmd = f"sha256sum {safe_file_path}"
-        checksum_result = await host_service.run_remote_command(host_info, checksum_cmd)
-        
-        if checksum_result[0] == 0:
-            # Parse checksum output (format: "checksum filename")
-            checksum_output = checksum_result[1].strip()
-            if checksum_output:
-                result["actual_checksum"] = checksum_output.split()[0]
-                result["verified"] = (result["actual_checksum"] == expected_checksum)
-            else:
-                result["error"] = "Empty checksum output"
-        else:
-            result["error"] = f"Checksum command failed: {checksum_result[2]}"
-            
-    except Exception as e:
-        result["error"] = f"Exception during verification: {str(e)}"
-    
-    return result
+        return {
+            "algorithm": algorithm,
+            "checksum_file": checksum_file,
+            "file_count": 0,
+            "total_size": 0,
+            "cache_hits": 0,
+            "error_count": 1,
+            "errors": [str(e)]
+        }
 
 
 async def verify_target_checksums(
@@ -1574,76 +1526,30 @@ async def verify_target_checksums(
     """
     🔐 VERIFY CHECKSUMS ON TARGET AFTER TRANSFER
     
-    Ensures data integrity by comparing checksums using secure individual commands.
-    Avoids remote script execution for improved security.
+    Ensures data integrity by comparing checksums. Relative paths are streamed
+    to a few remote hashing processes, one SSH session each, instead of
+    connecting once per file.
     """
-    from ...host_service import HostService
-    from ...models import HostInfo
-    import shlex
-    
-    host_service = HostService()
-    
-    verification_result = {
-        "verified": False,
-        "files_checked": 0,
-        "files_matched": 0,
-        "files_mismatched": 0,
-        "missing_files": [],
-        "mismatched_files": [],
-        "errors": []
-    }
+    from ...checksum_verifier import ChecksumVerification, RemoteChecksumVerifier, iter_source_checksums
     
     try:
-        host_info = HostInfo(hostname=target_host, ssh_user=ssh_user, ssh_port=ssh_port)
-        
-        # Safely verify each file individually without remote script execution
-        for relative_path, expected_checksum in source_checksums["checksums"].items():
-            verification_result["files_checked"] += 1
-            
-            # Use secure helper function for single file verification
-            file_result = await _verify_single_file_checksum(
-                host_service, host_info, target_path, relative_path, expected_checksum
-            )
-            
-            if file_result["missing"]:
-                verification_result["missing_files"].append(relative_path)
-                logger.warning(f"Missing file on target: {relative_path}")
-            elif file_result["error"]:
-                verification_result["errors"].append(
-                    f"Failed to verify {relative_path}: {file_result['error']}"
-                )
-                logger.error(f"Verification error for {relative_path}: {file_result['error']}")
-            elif file_result["verified"]:
-                verification_result["files_matched"] += 1
-                logger.debug(f"✅ Checksum verified: {relative_path}")
-            else:
-                verification_result["files_mismatched"] += 1
-                verification_result["mismatched_files"].append({
-                    "file": relative_path,
-                    "expected": expected_checksum,
-                    "actual": file_result["actual_checksum"]
-                })
-                logger.warning(f"❌ Checksum mismatch: {relative_path} "
-                             f"(expected: {expected_checksum[:8]}..., actual: {file_result['actual_checksum'][:8]}...)")
-        
-        # Final verification status
-        verification_result["verified"] = (
-            verification_result["files_mismatched"] == 0 and
-            len(verification_result["missing_files"]) == 0 and
-            verification_result["files_matched"] > 0
+        verifier = RemoteChecksumVerifier(target_host, target_path, ssh_user, ssh_port)
+        verification = await verifier.verify(
+            iter_source_checksums(source_checksums), source_checksums.get("algorithm", "sha256")
         )
         
-        if verification_result["verified"]:
-            logger.info(f"✅ All {verification_result['files_matched']} files verified successfully")
+        if verification.verified:
+            logger.info(f"✅ All {verification.files_matched} files verified successfully")
         else:
-            logger.warning(f"❌ Verification failed: {verification_result['files_mismatched']} mismatched, "
-                         f"{len(verification_result['missing_files'])} missing")
+            logger.warning(f"❌ Verification failed: {verification.files_mismatched} mismatched, "
+                         f"{verification.files_missing} missing")
             
     except Exception as e:
         logger.error(f"Checksum verification failed: {e}")
-        verification_result["errors"].append(f"Verification process error: {str(e)}")
+        verification = ChecksumVerification()
+        verification.add_error(f"Verification process error: {str(e)}")
     
-    return verification_result
+    return verification.to_dict()
 
 
 async def resume_interrupted_migration(
@@ -1678,40 +1584,51 @@ async def resume_interrupted_migration(
             resume_result["errors"].append("Source path no longer exists")
             return resume_result
         
-        # Create rsync command for resume (uses --partial)
-        rsync_result = await create_safe_rsync_operation(
-            source_path=checkpoint["source_path"],
-            target_host=checkpoint["target_host"],
-            target_path=checkpoint["target_path"],
-            migration_id=migration_id,
-            ssh_user=checkpoint.get("ssh_user", "root"),
-            ssh_port=checkpoint.get("ssh_port", 22),
-            dry_run=False  # Actual transfer
-        )
+        # Hold a share of the bandwidth budget for the whole transfer
+        async with get_bandwidth_allocator().lease(checkpoint["target_host"], fixed=True) as lease:
+            compression = None
+            if config.migration.adaptive_compression:
+                compression = await CompressionPlanner().plan(
+                    checkpoint["source_path"], checkpoint["target_host"],
+                    checkpoint.get("ssh_user", "root"), checkpoint.get("ssh_port", 22)
+                )
+            
+            # Create rsync command for resume (uses --partial)
+            rsync_result = await create_safe_rsync_operation(
+                source_path=checkpoint["source_path"],
+                target_host=checkpoint["target_host"],
+                target_path=checkpoint["target_path"],
+                migration_id=migration_id,
+                ssh_user=checkpoint.get("ssh_user", "root"),
+                ssh_port=checkpoint.get("ssh_port", 22),
+                dry_run=False,  # Actual transfer
+                bandwidth_lease=lease,
+                compression=compression
+            )
         
-        if rsync_result["errors"]:
-            resume_result["errors"].extend(rsync_result["errors"])
-            return resume_result
+            if rsync_result["errors"]:
+                resume_result["errors"].extend(rsync_result["errors"])
+                return resume_result
         
-        # Execute rsync - use command_args list for security (avoid shell execution)
-        if "command_args" in rsync_result:
-            # Use the safer exec method with argument list
-            process = await asyncio.create_subprocess_exec(
-                *rsync_result["command_args"],
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-        else:
-            # Fallback: parse command string into arguments (for compatibility)
-            import shlex
-            cmd_args = shlex.split(rsync_result["command"])
-            process = await asyncio.create_subprocess_exec(
-                *cmd_args,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
+            # Execute rsync - use command_args list for security (avoid shell execution)
+            if "command_args" in rsync_result:
+                # Use the safer exec method with argument list
+                process = await asyncio.create_subprocess_exec(
+                    *rsync_result["command_args"],
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
+            else:
+                # Fallback: parse command string into arguments (for compatibility)
+                import shlex
+                cmd_args = shlex.split(rsync_result["command"])
+                process = await asyncio.create_subprocess_exec(
+                    *cmd_args,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )
         
-        stdout, stderr = await process.communicate()
+            stdout, stderr = await process.communicate()
         
         if process.returncode == 0:
             resume_result["resume_successful"] = True
@@ -3,6 +3,8 @@ from datetime import datetime, timezone
 
 from ...config import get_config
 from ...migration_service import MigrationService
+from ...ssh_pool import get_ssh_pool
+from ...ssh_sessions import get_ssh_session_pool, paramiko_transport_enabled
 
 router = APIRouter(
     prefix="/api/system",
@@ -38,4 +40,14 @@ async def zfs_status():
     try:
         return await migration_service.get_zfs_status()
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e)) from e 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e)) from e 
+
+
+@router.get("/ssh-pool")
+async def ssh_pool_stats():
+    """Shared SSH connections with their per-host reuse and latency"""
+    stats = get_ssh_pool().stats()
+    stats["transport"] = config.migration.ssh_transport
+    if paramiko_transport_enabled():
+        stats["sessions"] = get_ssh_session_pool().stats()
+    return stats
@@ -0,0 +1,317 @@
+"""
+Bandwidth allocation for TransDock transfers.
+
+One allocator is shared by every migration in the process. Each running
+transfer holds a lease; whenever a lease is taken or released the configured
+budget is divided again among the active leases:
+
+- the global budget (``RSYNC_BANDWIDTH_LIMIT``) caps all transfers together,
+- the per-host budget (``BANDWIDTH_LIMIT_PER_HOST``) caps transfers to one target,
+- within those caps each lease gets a share proportional to its weight, and
+  every priority step multiplies the weight by ``PRIORITY_FACTOR``,
+- a token bucket lets a lease burst above its rate after being idle.
+
+Streamed transfers are throttled chunk by chunk through ``BandwidthLease.throttle``
+and follow rebalancing immediately. rsync can only be given a ``--bwlimit`` when it
+starts, so it takes a fixed lease held until it finishes. Its fair share is
+computed as if the transfer pool were full (``MAX_CONCURRENT_VOLUME_TRANSFERS``
+overall, ``MAX_VOLUME_TRANSFERS_PER_HOST`` per host), so an rsync that starts
+alone does not reserve what the ones starting next will need. Fixed leases
+together reserve at most ``1 - ELASTIC_FLOOR`` of each budget, and streams share
+what they leave, so the transfers together never exceed the budget and streams
+always keep moving. A fixed lease that would get less than ``MIN_FIXED_SHARE``
+of its fair share waits for budget to be released instead of running at a
+crawl for its whole life.
+"""
+
+import asyncio
+import contextvars
+import logging
+import math
+import re
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Weight multiplier per priority step
+PRIORITY_FACTOR = 4.0
+
+# A fixed lease waits rather than start with less than this fraction of its fair share
+MIN_FIXED_SHARE = 0.5
+
+# Fraction of each budget fixed leases never reserve, kept for throttled streams
+ELASTIC_FLOOR = 0.1
+
+# Weight and priority applied to leases taken without explicit values; set once
+# per migration task so every transfer it starts inherits them
+_transfer_class: contextvars.ContextVar[Tuple[float, int]] = contextvars.ContextVar(
+    "transfer_class", default=(1.0, 0)
+)
+
+BANDWIDTH_PATTERN = re.compile(r'^(\d+(?:\.\d+)?)\s*([KMGT]?)(?:I?B)?$', re.IGNORECASE)
+BANDWIDTH_UNITS = {"": 1024, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+
+
+def parse_bandwidth_limit(value: str) -> Optional[float]:
+    """Parse an rsync style limit ("500", "10M", "1.5G") into bytes per second.
+
+    A bare number is KiB/s, as with rsync's --bwlimit. Empty or zero means unlimited.
+    """
+    if not value or not value.strip():
+        return None
+    match = BANDWIDTH_PATTERN.match(value.strip())
+    if not match:
+        logger.warning(f"Ignoring invalid bandwidth limit: {value}")
+        return None
+    rate = float(match.group(1)) * BANDWIDTH_UNITS[match.group(2).upper()]
+    return rate if rate > 0 else None
+
+
+def set_transfer_class(weight: float = 1.0, priority: int = 0):
+    """Set the weight and priority for transfers started from the current task"""
+    _transfer_class.set((max(0.01, weight), priority))
+
+
+class BandwidthLease:
+    """A transfer's share of the bandwidth budget"""
+
+    def __init__(self, allocator: "BandwidthAllocator", host: str, weight: float, priority: int,
+                 fixed: bool = False):
+        self.allocator = allocator
+        self.host = host
+        self.weight = weight
+        self.priority = priority
+        # A fixed lease keeps the rate it was given until released
+        self.fixed = fixed
+        self.rate_bps: Optional[float] = None
+        self._tokens = 0.0
+        self._refilled_at = time.monotonic()
+
+    @property
+    def effective_weight(self) -> float:
+        return self.weight * PRIORITY_FACTOR ** self.priority
+
+    @property
+    def burst_bytes(self) -> float:
+        if self.rate_bps is None:
+            return 0.0
+        return self.rate_bps * self.allocator.burst_seconds
+
+    async def throttle(self, nbytes: int):
+        """Wait until nbytes may be sent at the current rate"""
+        # Fixed leases may hold the whole budget; wait for some to be released
+        while self.rate_bps == 0:
+            await self.allocator.rebalanced()
+        if self.rate_bps is None:
+            return
+        now = time.monotonic()
+        self._tokens = min(self.burst_bytes, self._tokens + (now - self._refilled_at) * self.rate_bps)
+        self._refilled_at = now
+        # Chunks may be larger than the burst; go into debt and sleep it off
+        self._tokens -= nbytes
+        if self._tokens < 0:
+            await asyncio.sleep(-self._tokens / self.rate_bps)
+
+    def rsync_args(self, parts: int = 1) -> List[str]:
+        """--bwlimit for one of parts rsyncs sharing the lease, in rsync's KiB/s units"""
+        if self.rate_bps is None:
+            return []
+        return [f"--bwlimit={max(1, int(self.rate_bps / max(1, parts) / 1024))}"]
+
+
+class BandwidthAllocator:
+    """Divides global and per-host bandwidth budgets among active transfers"""
+
+    def __init__(self, total_bps: Optional[float] = None, per_host_bps: Optional[float] = None,
+                 burst_seconds: float = 2.0, expected_transfers: int = 1,
+                 expected_per_host: int = 1):
+        self.total_bps = total_bps
+        self.per_host_bps = per_host_bps
+        self.burst_seconds = burst_seconds
+        # Transfers a fixed lease's fair share is computed against, overall and per host
+        self.expected_transfers = max(1, expected_transfers)
+        self.expected_per_host = max(1, expected_per_host)
+        self._leases: List[BandwidthLease] = []
+        self._rebalanced: Optional[asyncio.Event] = None
+
+    @property
+    def unlimited(self) -> bool:
+        return self.total_bps is None and self.per_host_bps is None
+
+    def _new_lease(self, host: str, weight: Optional[float], priority: Optional[int],
+                   fixed: bool = False) -> BandwidthLease:
+        default_weight, default_priority = _transfer_class.get()
+        return BandwidthLease(
+            self, host,
+            weight if weight is not None else default_weight,
+            priority if priority is not None else default_priority,
+            fixed
+        )
+
+    def acquire(self, host: str, weight: Optional[float] = None,
+                priority: Optional[int] = None) -> BandwidthLease:
+        """Register a throttled transfer to host and rebalance"""
+        lease = self._new_lease(host, weight, priority)
+        self._leases.append(lease)
+        self._rebalance()
+        return lease
+
+    async def acquire_fixed(self, host: str, weight: Optional[float] = None,
+                            priority: Optional[int] = None) -> BandwidthLease:
+        """Register a transfer whose rate cannot change once it starts, such as rsync.
+
+        Waits while the budget not reserved by other fixed leases is below
+        MIN_FIXED_SHARE of the new lease's fair share.
+        """
+        lease = self._new_lease(host, weight, priority, fixed=True)
+        while True:
+            rate = self._fixed_share(lease)
+            if rate > 0:
+                break
+            await self.rebalanced()
+        lease.rate_bps = None if math.isinf(rate) else rate
+        self._leases.append(lease)
+        self._rebalance()
+        return lease
+
+    def release(self, lease: BandwidthLease):
+        """Unregister a finished transfer and rebalance"""
+        if lease in self._leases:
+            self._leases.remove(lease)
+            self._rebalance()
+
+    @asynccontextmanager
+    async def lease(self, host: str, weight: Optional[float] = None, priority: Optional[int] = None,
+                    fixed: bool = False) -> AsyncIterator[BandwidthLease]:
+        """Hold a lease for the duration of a transfer; fixed for rsync"""
+        lease = await self.acquire_fixed(host, weight, priority) if fixed else self.acquire(host, weight, priority)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    async def rebalanced(self):
+        """Wait until leases are next taken or released"""
+        if self._rebalanced is None:
+            self._rebalanced = asyncio.Event()
+        await self._rebalanced.wait()
+
+    def _reserved(self) -> Tuple[float, Dict[str, float]]:
+        """Rates held by fixed leases, in total and per host"""
+        by_host: Dict[str, float] = {}
+        for lease in self._leases:
+            if lease.fixed and lease.rate_bps is not None:
+                by_host[lease.host] = by_host.get(lease.host, 0.0) + lease.rate_bps
+        return sum(by_host.values()), by_host
+
+    def _fixed_share(self, lease: BandwidthLease) -> float:
+        """The rate a new fixed lease may reserve now, 0 when it must wait"""
+        if self.unlimited:
+            return math.inf
+        budget = self.total_bps if self.total_bps is not None else math.inf
+        host_cap = self.per_host_bps if self.per_host_bps is not None else math.inf
+        active = self._leases + [lease]
+        # Transfers expected but not started count as unit-weight leases on hosts of their own
+        expected = [BandwidthLease(self, f"\0expected-{index}", 1.0, 0)
+                    for index in range(self.expected_transfers - len(active))]
+        fair = self._fair_shares(active + expected, budget, lambda host: host_cap)[lease]
+        on_host = [other for other in active if other.host == lease.host]
+        host_weight = (sum(other.effective_weight for other in on_host)
+                       + max(0, self.expected_per_host - len(on_host)))
+        fair = min(fair, host_cap * lease.effective_weight / host_weight)
+
+        reserved_total, reserved_by_host = self._reserved()
+        share = min(fair, budget * (1 - ELASTIC_FLOOR) - reserved_total,
+                    host_cap * (1 - ELASTIC_FLOOR) - reserved_by_host.get(lease.host, 0.0))
+        return share if share > 0 and share >= fair * MIN_FIXED_SHARE else 0.0
+
+    def _rebalance(self):
+        """Divide the budget fixed leases left among the others and wake waiting transfers"""
+        if self.unlimited:
+            for lease in self._leases:
+                lease.rate_bps = None
+        else:
+            budget = self.total_bps if self.total_bps is not None else math.inf
+            host_cap = self.per_host_bps if self.per_host_bps is not None else math.inf
+            reserved_total, reserved_by_host = self._reserved()
+            elastic = [lease for lease in self._leases if not lease.fixed]
+            shares = self._fair_shares(
+                elastic, max(0.0, budget - reserved_total),
+                lambda host: max(0.0, host_cap - reserved_by_host.get(host, 0.0)))
+            for lease in elastic:
+                lease.rate_bps = None if math.isinf(shares[lease]) else shares[lease]
+
+        if self._rebalanced is not None:
+            self._rebalanced.set()
+            self._rebalanced = None
+
+    @staticmethod
+    def _fair_shares(leases: List[BandwidthLease], budget: float,
+                     host_cap: Callable[[str], float]) -> Dict[BandwidthLease, float]:
+        """Weighted max-min fair share of a budget under per-host caps"""
+        shares: Dict[BandwidthLease, float] = {}
+        active = list(leases)
+        # Hosts whose fair share exceeds their cap are pinned at the cap and the
+        # surplus is divided again among the remaining hosts
+        while active:
+            total_weight = sum(lease.effective_weight for lease in active)
+            by_host: Dict[str, List[BandwidthLease]] = {}
+            for lease in active:
+                by_host.setdefault(lease.host, []).append(lease)
+
+            capped = {
+                host: leases for host, leases in by_host.items()
+                if budget * sum(lease.effective_weight for lease in leases) / total_weight > host_cap(host)
+            }
+            if not capped:
+                for lease in active:
+                    shares[lease] = budget * lease.effective_weight / total_weight
+                break
+
+            for host, leases in capped.items():
+                host_weight = sum(lease.effective_weight for lease in leases)
+                for lease in leases:
+                    shares[lease] = host_cap(host) * lease.effective_weight / host_weight
+                    active.remove(lease)
+                budget -= host_cap(host)
+        return shares
+
+    def get_stats(self) -> Dict:
+        """Current allocation, for status reporting"""
+        return {
+            "total_bps": self.total_bps,
+            "per_host_bps": self.per_host_bps,
+            "active_transfers": len(self._leases),
+            "allocations": [
+                {
+                    "host": lease.host,
+                    "weight": lease.weight,
+                    "priority": lease.priority,
+                    "fixed": lease.fixed,
+                    "rate_bps": lease.rate_bps,
+                }
+                for lease in self._leases
+            ],
+        }
+
+
+_bandwidth_allocator: Optional[BandwidthAllocator] = None
+
+
+def get_bandwidth_allocator() -> BandwidthAllocator:
+    """Get the bandwidth allocator shared by all migrations"""
+    global _bandwidth_allocator
+    if _bandwidth_allocator is None:
+        migration_config = get_config().migration
+        _bandwidth_allocator = BandwidthAllocator(
+            parse_bandwidth_limit(migration_config.rsync_bandwidth_limit),
+            parse_bandwidth_limit(migration_config.bandwidth_limit_per_host),
+            migration_config.bandwidth_burst_seconds,
+            migration_config.max_concurrent_volume_transfers,
+            migration_config.max_volume_transfers_per_host
+        )
+    return _bandwidth_allocator
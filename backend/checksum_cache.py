@@ -0,0 +1,115 @@
+"""
+Persistent checksum cache for TransDock.
+
+Digests are stored in SQLite per (device, inode, algorithm) together with the
+size, mtime and ctime the file had when it was hashed. A lookup only hits when
+all of those still match, so any write, truncate, rename-over or metadata
+change invalidates the entry without bookkeeping; re-hashing a mostly static
+tree then costs one ``stat`` per unchanged file.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+# (st_dev, st_ino, st_size, st_mtime_ns, st_ctime_ns)
+FileKey = Tuple[int, int, int, int, int]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checksums (
+    dev INTEGER NOT NULL,
+    ino INTEGER NOT NULL,
+    algorithm TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    ctime_ns INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    PRIMARY KEY (dev, ino, algorithm)
+)
+"""
+
+
+def file_key(stat_result: os.stat_result) -> FileKey:
+    return (stat_result.st_dev, stat_result.st_ino, stat_result.st_size,
+            stat_result.st_mtime_ns, stat_result.st_ctime_ns)
+
+
+class ChecksumCache:
+    """SQLite backed digests of files that have not changed since they were hashed.
+
+    Safe to use from any thread; calls are serialized on one connection.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(SCHEMA)
+        self._connection.commit()
+
+    def lookup(self, key: FileKey, algorithm: str) -> Optional[str]:
+        """The stored digest if the file is unchanged since it was hashed"""
+        dev, ino, size, mtime_ns, ctime_ns = key
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT digest FROM checksums WHERE dev = ? AND ino = ? AND algorithm = ? "
+                "AND size = ? AND mtime_ns = ? AND ctime_ns = ?",
+                (dev, ino, algorithm, size, mtime_ns, ctime_ns)
+            ).fetchone()
+        return row[0] if row else None
+
+    def store(self, entries: Iterable[Tuple[FileKey, str]], algorithm: str):
+        """Record digests, replacing whatever was stored for the same inodes"""
+        rows = [(dev, ino, algorithm, size, mtime_ns, ctime_ns, digest)
+                for (dev, ino, size, mtime_ns, ctime_ns), digest in entries]
+        if not rows:
+            return
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO checksums "
+                "(dev, ino, algorithm, size, mtime_ns, ctime_ns, digest) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._connection.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM checksums").fetchone()[0]
+
+    def clear(self):
+        with self._lock:
+            self._connection.execute("DELETE FROM checksums")
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_checksum_cache: Optional[ChecksumCache] = None
+
+
+def get_checksum_cache() -> Optional[ChecksumCache]:
+    """Get the shared checksum cache, or None when it is disabled"""
+    global _checksum_cache
+    if _checksum_cache is None:
+        path = get_config().migration.checksum_cache_path
+        if not path:
+            return None
+        try:
+            _checksum_cache = ChecksumCache(path)
+        except (OSError, sqlite3.Error) as e:
+            logger.warning(f"Checksum cache at {path} unavailable, hashing without it: {e}")
+            return None
+    return _checksum_cache
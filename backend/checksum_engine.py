@@ -0,0 +1,289 @@
+"""
+Parallel file checksums for TransDock.
+
+Hashing a large volume is CPU and I/O bound work that must not run on the
+event loop. The engine walks the tree in a thread and hashes files on a
+process pool with large reads. Files at or above ``LARGE_FILE_BYTES`` are
+scheduled first, biggest first, so one huge file does not start last and
+leave the other workers idle; small files follow in batches to keep the
+per-task overhead low. Digests are written to the checksum file as they
+complete, in ``sha256sum`` format, so memory does not grow with the tree.
+Files unchanged since an earlier run take their digest from the checksum
+cache instead of being read again.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import stat
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .checksum_cache import ChecksumCache, FileKey, file_key, get_checksum_cache
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_ALGORITHMS = ("sha256", "blake2b")
+
+# Files this large are hashed one per task, biggest first
+LARGE_FILE_BYTES = 64 * 1024 * 1024
+
+# Small files are sent to the workers in batches of up to this many files or bytes
+BATCH_FILES = 256
+BATCH_BYTES = 64 * 1024 * 1024
+
+# Errors listed in the summary; the count is always complete
+MAX_LISTED_ERRORS = 1000
+
+# New digests are written to the cache in batches of this many
+CACHE_STORE_BATCH = 4096
+
+# (relative path, size, cache key) of a file found by the walk
+WalkEntry = Tuple[str, int, FileKey]
+
+# (relative path, digest or None, size, error or None)
+FileDigest = Tuple[str, Optional[str], int, Optional[str]]
+
+
+def hash_file(path: str, algorithm: str, read_size: int) -> str:
+    """Hash one file with large reads into a reused buffer"""
+    hasher = hashlib.new(algorithm)
+    buffer = bytearray(read_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            count = f.readinto(buffer)
+            if not count:
+                break
+            hasher.update(view[:count])
+    return hasher.hexdigest()
+
+
+def _hash_batch(root: str, batch: List[WalkEntry], algorithm: str, read_size: int) -> List[FileDigest]:
+    """Worker entry point: hash a batch of files relative to root"""
+    results = []
+    for relative_path, size, _ in batch:
+        try:
+            results.append((relative_path, hash_file(os.path.join(root, relative_path), algorithm, read_size),
+                            size, None))
+        except OSError as e:
+            results.append((relative_path, None, size, str(e)))
+    return results
+
+
+def walk_files(root: str, min_size: int = 0, max_size: Optional[int] = None) -> Iterator[WalkEntry]:
+    """Yield (relative path, size, cache key) of regular files under root, without following symlinks"""
+    stack = [""]
+    while stack:
+        relative_dir = stack.pop()
+        try:
+            with os.scandir(os.path.join(root, relative_dir)) as entries:
+                for entry in entries:
+                    relative_path = os.path.join(relative_dir, entry.name) if relative_dir else entry.name
+                    try:
+                        entry_stat = entry.stat(follow_symlinks=False)
+                    except OSError:
+                        continue
+                    if stat.S_ISDIR(entry_stat.st_mode):
+                        stack.append(relative_path)
+                    elif stat.S_ISREG(entry_stat.st_mode):
+                        size = entry_stat.st_size
+                        if size >= min_size and (max_size is None or size < max_size):
+                            yield relative_path, size, file_key(entry_stat)
+        except OSError as e:
+            logger.warning(f"Cannot list {os.path.join(root, relative_dir)}: {e}")
+
+
+def format_checksum_line(digest: str, relative_path: str) -> str:
+    """A checksum line as sha256sum writes it, escaping backslashes and newlines"""
+    if '\\' in relative_path or '\n' in relative_path:
+        return "\\" + digest + "  " + relative_path.replace('\\', '\\\\').replace('\n', '\\n') + "\n"
+    return f"{digest}  {relative_path}\n"
+
+
+def parse_checksum_line(line: str) -> Optional[Tuple[str, str]]:
+    """Parse a sha256sum style line into (relative path, digest)"""
+    line = line.rstrip('\n')
+    escaped = line.startswith('\\')
+    if escaped:
+        line = line[1:]
+    digest, separator, relative_path = line.partition('  ')
+    if not separator:
+        return None
+    if escaped:
+        relative_path = relative_path.replace('\\n', '\n').replace('\\\\', '\\')
+    return relative_path, digest
+
+
+@dataclass
+class ChecksumSummary:
+    """Outcome of hashing a tree into a checksum file"""
+    algorithm: str
+    checksum_file: str
+    file_count: int = 0
+    total_size: int = 0
+    cache_hits: int = 0
+    error_count: int = 0
+    errors: List[str] = field(default_factory=list)
+
+    def add_error(self, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_LISTED_ERRORS:
+            self.errors.append(message)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "algorithm": self.algorithm,
+            "checksum_file": self.checksum_file,
+            "file_count": self.file_count,
+            "total_size": self.total_size,
+            "cache_hits": self.cache_hits,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+class ChecksumEngine:
+    """Hashes directory trees on a shared process pool"""
+
+    def __init__(self, workers: Optional[int] = None, read_size: Optional[int] = None,
+                 cache: Optional[ChecksumCache] = None):
+        migration_config = get_config().migration
+        self.workers = workers or migration_config.checksum_workers or os.cpu_count() or 1
+        self.read_size = read_size or migration_config.checksum_read_size_kb * 1024
+        self.cache = cache
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def hash_tree(self, root: str, checksum_file: str, algorithm: str = "sha256") -> ChecksumSummary:
+        """Hash every regular file under root into checksum_file"""
+        if algorithm not in CHECKSUM_ALGORITHMS:
+            raise ValueError(f"Unsupported checksum algorithm: {algorithm}")
+
+        loop = asyncio.get_running_loop()
+        summary = ChecksumSummary(algorithm=algorithm, checksum_file=checksum_file)
+        # Enough work queued to keep every worker busy while results are written
+        slots = asyncio.Semaphore(self.workers * 2)
+        pending = set()
+        to_cache: List[Tuple[FileKey, str]] = []
+        keys: Dict[str, FileKey] = {}
+
+        def write_line(relative_path: str, digest: str, size: int):
+            output.write(format_checksum_line(digest, relative_path))
+            summary.file_count += 1
+            summary.total_size += size
+
+        def write_results(future: asyncio.Future):
+            slots.release()
+            pending.discard(future)
+            if future.cancelled():
+                return
+            if future.exception():
+                summary.add_error(f"Checksum worker failed: {future.exception()}")
+                return
+            for relative_path, digest, size, error in future.result():
+                key = keys.pop(relative_path, None)
+                if error:
+                    summary.add_error(f"Failed to checksum {relative_path}: {error}")
+                    continue
+                write_line(relative_path, digest, size)
+                if key:
+                    to_cache.append((key, digest))
+
+        async def flush_cache(force: bool = False):
+            if self.cache and to_cache and (force or len(to_cache) >= CACHE_STORE_BATCH):
+                rows = to_cache[:]
+                to_cache.clear()
+                await loop.run_in_executor(None, self.cache.store, rows, algorithm)
+
+        async def submit(batch: List[WalkEntry]):
+            if self.cache:
+                hits, batch = await loop.run_in_executor(None, self._split_cached, batch, algorithm)
+                for relative_path, size, digest in hits:
+                    write_line(relative_path, digest, size)
+                summary.cache_hits += len(hits)
+                for relative_path, _, key in batch:
+                    keys[relative_path] = key
+                await flush_cache()
+            if not batch:
+                return
+            await slots.acquire()
+            future = asyncio.wrap_future(
+                self.executor.submit(_hash_batch, root, batch, algorithm, self.read_size))
+            pending.add(future)
+            future.add_done_callback(write_results)
+
+        with open(checksum_file, 'w') as output:
+            try:
+                large_files = await loop.run_in_executor(
+                    None, lambda: sorted(walk_files(root, min_size=LARGE_FILE_BYTES),
+                                         key=lambda item: item[1], reverse=True))
+                for item in large_files:
+                    await submit([item])
+
+                small_files = walk_files(root, max_size=LARGE_FILE_BYTES)
+                while True:
+                    batch = await loop.run_in_executor(None, self._next_batch, small_files)
+                    if not batch:
+                        break
+                    await submit(batch)
+
+                if pending:
+                    await asyncio.wait(list(pending))
+                await flush_cache(force=True)
+            except BaseException:
+                for future in list(pending):
+                    future.cancel()
+                raise
+
+        logger.info(
+            f"Hashed {summary.file_count} files under {root} with {algorithm} "
+            f"({summary.cache_hits} unchanged since cached, {summary.error_count} errors)")
+        return summary
+
+    def _split_cached(self, batch: List[WalkEntry], algorithm: str
+                      ) -> Tuple[List[Tuple[str, int, str]], List[WalkEntry]]:
+        """Separate files with a valid cached digest from those that must be hashed"""
+        hits, misses = [], []
+        for relative_path, size, key in batch:
+            digest = self.cache.lookup(key, algorithm)
+            if digest:
+                hits.append((relative_path, size, digest))
+            else:
+                misses.append((relative_path, size, key))
+        return hits, misses
+
+    @staticmethod
+    def _next_batch(files: Iterator[WalkEntry]) -> List[WalkEntry]:
+        """Pull the next batch of small files from the walk"""
+        batch, batch_bytes = [], 0
+        for entry in files:
+            batch.append(entry)
+            batch_bytes += entry[1]
+            if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                break
+        return batch
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_checksum_engine: Optional[ChecksumEngine] = None
+
+
+def get_checksum_engine() -> ChecksumEngine:
+    """Get the checksum engine shared by all migrations"""
+    global _checksum_engine
+    if _checksum_engine is None:
+        _checksum_engine = ChecksumEngine(cache=get_checksum_cache())
+    return _checksum_engine
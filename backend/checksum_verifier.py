@@ -0,0 +1,285 @@
+"""
+Batched remote checksum verification for TransDock.
+
+Instead of SSH round trips per file, each verification channel is one SSH
+session running ``xargs -0 <hash program> -z`` in the target directory. The
+relative paths are streamed to its stdin NUL delimited and the digests are
+parsed from its stdout as they arrive. The hash program prints results in
+input order and skips files it cannot read, so every path the output jumps
+over is missing or unreadable; stderr tells which. Large trees are spread
+round-robin over several channels.
+"""
+
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from .checksum_engine import parse_checksum_line
+from .config import get_config
+from .manifest import HASH_PROGRAMS
+from .security_utils import SecurityUtils, SecurityValidationError
+
+logger = logging.getLogger(__name__)
+
+# Per-file entries listed per category; the counts are always complete
+MAX_LISTED_FILES = 1000
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# Backslash escapes GNU coreutils writes inside $'...' besides \ooo octal
+C_ESCAPES = {"a": b"\a", "b": b"\b", "f": b"\f", "n": b"\n", "r": b"\r", "t": b"\t", "v": b"\v"}
+
+
+def unquote_coreutils_name(name: str) -> bytes:
+    """Undo the shell quoting GNU coreutils applies to file names in messages.
+
+    Names that need it are printed as e.g. ``'a b'``, ``"it's"`` or
+    ``'a'$'\\n''b'``; others, and every name on older releases, as is.
+    """
+    out = bytearray()
+    i = 0
+    while i < len(name):
+        char = name[i]
+        if name.startswith("$'", i):
+            i += 2
+            while i < len(name) and name[i] != "'":
+                if name[i] == "\\" and i + 1 < len(name):
+                    octal = name[i + 1:i + 4]
+                    if len(octal) == 3 and all(c in "01234567" for c in octal):
+                        out.append(int(octal, 8) & 0xff)
+                        i += 4
+                    else:
+                        out += C_ESCAPES.get(name[i + 1], name[i + 1].encode())
+                        i += 2
+                else:
+                    out += name[i].encode()
+                    i += 1
+            i += 1
+        elif char in "'\"":
+            end = name.find(char, i + 1)
+            if end < 0:
+                return name.encode()
+            out += name[i + 1:end].encode()
+            i = end + 1
+        elif char == "\\" and i + 1 < len(name):
+            out += name[i + 1].encode()
+            i += 2
+        else:
+            out += char.encode()
+            i += 1
+    return bytes(out)
+
+
+def iter_source_checksums(source_checksums: Dict[str, Any]) -> Iterator[Tuple[str, str]]:
+    """(relative path, digest) pairs from a checksums dict or a checksum file"""
+    if "checksums" in source_checksums:
+        yield from source_checksums["checksums"].items()
+        return
+    with open(source_checksums["checksum_file"], 'r', newline='\n') as f:
+        for line in f:
+            parsed = parse_checksum_line(line)
+            if parsed:
+                yield parsed
+
+
+@dataclass
+class ChecksumVerification:
+    """Per-file outcome of comparing target files against source checksums"""
+    files_checked: int = 0
+    files_matched: int = 0
+    files_mismatched: int = 0
+    files_missing: int = 0
+    missing_files: List[str] = field(default_factory=list)
+    mismatched_files: List[Dict[str, str]] = field(default_factory=list)
+    errors: List[str] = field(default_factory=list)
+    error_count: int = 0
+
+    @property
+    def verified(self) -> bool:
+        return (self.files_mismatched == 0 and self.files_missing == 0
+                and self.error_count == 0 and self.files_matched > 0)
+
+    def add_missing(self, relative_path: str):
+        self.files_missing += 1
+        if len(self.missing_files) < MAX_LISTED_FILES:
+            self.missing_files.append(relative_path)
+
+    def add_mismatch(self, relative_path: str, expected: str, actual: str):
+        self.files_mismatched += 1
+        if len(self.mismatched_files) < MAX_LISTED_FILES:
+            self.mismatched_files.append({"file": relative_path, "expected": expected, "actual": actual})
+
+    def add_error(self, message: str):
+        self.error_count += 1
+        if len(self.errors) < MAX_LISTED_FILES:
+            self.errors.append(message)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "verified": self.verified,
+            "files_checked": self.files_checked,
+            "files_matched": self.files_matched,
+            "files_mismatched": self.files_mismatched,
+            "files_missing": self.files_missing,
+            "missing_files": self.missing_files,
+            "mismatched_files": self.mismatched_files,
+            "error_count": self.error_count,
+            "errors": self.errors,
+        }
+
+
+class _Channel:
+    """One remote hashing process and the paths sent to it but not yet answered"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.in_flight: Deque[Tuple[bytes, str]] = deque()
+        # Paths the output skipped, classified from stderr once the process exits
+        self.unanswered: List[Tuple[bytes, str]] = []
+
+
+class RemoteChecksumVerifier:
+    """Verifies target files against source checksums over a few SSH sessions"""
+
+    def __init__(self, target_host: str, target_path: str, ssh_user: str = "root",
+                 ssh_port: int = 22, channels: Optional[int] = None):
+        self.target_host = target_host
+        self.target_path = target_path
+        self.ssh_user = ssh_user
+        self.ssh_port = ssh_port
+        self.channels = max(1, channels or get_config().migration.checksum_verify_channels)
+
+    def build_command(self, algorithm: str) -> List[str]:
+        """SSH command hashing NUL delimited relative paths read from stdin"""
+        if algorithm not in HASH_PROGRAMS:
+            raise SecurityValidationError(f"Unsupported hash algorithm: {algorithm}")
+        target_path = SecurityUtils.sanitize_path(self.target_path, allow_absolute=True)
+        remote_cmd = (f"cd -- {SecurityUtils.escape_shell_argument(target_path)} && "
+                      f"xargs -0 -r {HASH_PROGRAMS[algorithm]} -z --")
+        return SecurityUtils.build_ssh_command(self.target_host, self.ssh_user, self.ssh_port, remote_cmd)
+
+    async def verify(self, checksums: Iterator[Tuple[str, str]], algorithm: str = "sha256") -> ChecksumVerification:
+        """Hash every listed file on the target and compare with its source digest"""
+        result = ChecksumVerification()
+        cmd = self.build_command(algorithm)
+
+        channels = []
+        try:
+            for _ in range(self.channels):
+                channels.append(_Channel(await asyncio.create_subprocess_exec(
+                    *cmd,
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE
+                )))
+
+            readers = [asyncio.create_task(self._read_results(channel, result)) for channel in channels]
+            stderr_tasks = [asyncio.create_task(channel.process.stderr.read()) for channel in channels]
+            await self._feed(channels, checksums, result)
+
+            await asyncio.gather(*readers)
+            for channel, stderr_task in zip(channels, stderr_tasks):
+                returncode = await channel.process.wait()
+                self._classify_unanswered(channel, (await stderr_task).decode(errors='replace'),
+                                          returncode, result)
+        finally:
+            for channel in channels:
+                if channel.process.returncode is None:
+                    channel.process.kill()
+                    await channel.process.wait()
+
+        logger.info(
+            f"Checksum verification on {self.target_host}:{self.target_path}: "
+            f"{result.files_matched}/{result.files_checked} matched, {result.files_mismatched} mismatched, "
+            f"{result.files_missing} missing, {result.error_count} errors")
+        return result
+
+    async def _feed(self, channels: List[_Channel], checksums: Iterator[Tuple[str, str]],
+                    result: ChecksumVerification):
+        """Send the paths round-robin to the channels"""
+        loop = asyncio.get_running_loop()
+        iterator = iter(checksums)
+        index = 0
+        while True:
+            # The source list may be a file of millions of lines; read it off the loop
+            batch = await loop.run_in_executor(None, self._next_batch, iterator)
+            if not batch:
+                break
+            for relative_path, expected in batch:
+                result.files_checked += 1
+                channel = channels[index % len(channels)]
+                index += 1
+                encoded = relative_path.encode()
+                channel.in_flight.append((encoded, expected))
+                try:
+                    channel.process.stdin.write(encoded + b'\0')
+                    await channel.process.stdin.drain()
+                except (BrokenPipeError, ConnectionResetError):
+                    # The channel died; its reader reports what was left unanswered
+                    pass
+
+        for channel in channels:
+            try:
+                channel.process.stdin.close()
+                await channel.process.stdin.wait_closed()
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    @staticmethod
+    def _next_batch(iterator: Iterator[Tuple[str, str]], size: int = 1024) -> List[Tuple[str, str]]:
+        batch = []
+        for item in iterator:
+            batch.append(item)
+            if len(batch) >= size:
+                break
+        return batch
+
+    async def _read_results(self, channel: _Channel, result: ChecksumVerification):
+        """Match the channel's digests to the paths sent, in order"""
+        partial = b""
+        while True:
+            chunk = await channel.process.stdout.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            records = (partial + chunk).split(b'\0')
+            partial = records.pop()
+            for record in records:
+                digest, _, path = record.partition(b'  ')
+                self._match(channel, path, digest.decode(errors='replace'), result)
+        channel.unanswered.extend(channel.in_flight)
+        channel.in_flight.clear()
+
+    @staticmethod
+    def _match(channel: _Channel, path: bytes, actual: str, result: ChecksumVerification):
+        while channel.in_flight:
+            sent_path, expected = channel.in_flight.popleft()
+            if sent_path != path:
+                channel.unanswered.append((sent_path, expected))
+                continue
+            if actual == expected:
+                result.files_matched += 1
+            else:
+                result.add_mismatch(sent_path.decode(errors='replace'), expected, actual)
+            return
+
+    @staticmethod
+    def _classify_unanswered(channel: _Channel, stderr: str, returncode: int,
+                             result: ChecksumVerification):
+        """Sort skipped paths into missing files and read errors"""
+        if returncode not in (0, 123):
+            # The session itself failed (cd, ssh); nothing it was sent was checked
+            result.add_error(f"Remote checksum process exited {returncode}: {stderr.strip()[-2000:]}")
+        missing = set()
+        for line in stderr.splitlines():
+            if line.endswith("No such file or directory"):
+                name = line.rsplit(': ', 1)[0].split(': ', 1)[-1]
+                # Older coreutils print names unquoted; keep the raw form too
+                missing.update((name.encode(), unquote_coreutils_name(name)))
+        for sent_path, _ in channel.unanswered:
+            relative_path = sent_path.decode(errors='replace')
+            if sent_path in missing:
+                result.add_missing(relative_path)
+            elif returncode in (0, 123):
+                result.add_error(f"Failed to verify {relative_path}: not readable on target")
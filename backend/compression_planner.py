@@ -0,0 +1,343 @@
+"""
+Adaptive compression planning for TransDock.
+
+Compressing is only worth it when the link, not the CPU, is the bottleneck
+and the data actually shrinks. Before a volume is copied the planner reads a
+random sample of its blocks, times the available codecs on it and compares
+the throughput each would reach against the measured link bandwidth:
+
+    throughput(codec) = min(compression speed, link bandwidth / compressed ratio)
+
+The codec with the highest throughput wins; compression is switched off
+when no codec beats sending the data raw by a clear margin.
+"""
+
+import asyncio
+import logging
+import os
+import random
+import shutil
+import subprocess
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from .bandwidth import parse_bandwidth_limit
+from .config import get_config
+from .security_utils import SecurityUtils
+from .utils import format_bytes
+
+logger = logging.getLogger(__name__)
+
+SourceHost = Tuple[Optional[str], str, int]
+
+SAMPLE_BLOCK_SIZE = 64 * 1024
+SAMPLE_MAX_FILES = 2000
+
+# Compression must beat sending raw data by this factor to be enabled
+MIN_SPEEDUP = 1.1
+
+# The smaller link probe carries 1/PROBE_SMALL_FRACTION of the configured probe size
+PROBE_SMALL_FRACTION = 4
+
+# Codec levels considered, as (rsync/tar codec name, level)
+CANDIDATES: List[Tuple[str, int]] = [("zlib", 1), ("zlib", 6), ("zstd", 1), ("zstd", 3), ("lz4", 1)]
+
+
+@dataclass
+class CodecMeasurement:
+    """How well and how fast one codec level compressed the sample"""
+    codec: str
+    level: int
+    ratio: float
+    speed_bps: float
+
+    def throughput(self, link_bps: float) -> float:
+        """Source bytes per second deliverable over the link with this codec"""
+        return min(self.speed_bps, link_bps / max(self.ratio, 0.01))
+
+
+@dataclass
+class CompressionDecision:
+    """Compression chosen for one volume, with the reasoning behind it"""
+    enabled: bool
+    codec: Optional[str] = None
+    level: Optional[int] = None
+    link_bps: Optional[float] = None
+    sampled_bytes: int = 0
+    expected_bps: Optional[float] = None
+    reason: str = ""
+    measurements: List[CodecMeasurement] = field(default_factory=list)
+    # Tar streams compress with external programs on both hosts; only gzip is
+    # assumed to be everywhere, so they compress only when zlib itself pays off
+    tar_stream_codec: Optional[str] = None
+    # Both rsyncs are 3.2 or later: they accept --compress-choice and, without
+    # it, negotiate their own codec (zstd) rather than zlib
+    compress_choice: bool = False
+
+    def rsync_args(self) -> List[str]:
+        """Arguments overriding rsync's default -z"""
+        if not self.enabled:
+            return ["--no-compress"]
+        args = [f"--compress-level={self.level}"]
+        if self.compress_choice or self.codec != "zlib":
+            args.insert(0, f"--compress-choice={self.codec}")
+        return args
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "compression": self.enabled,
+            "codec": self.codec,
+            "level": self.level,
+            "link_bps": round(self.link_bps, 1) if self.link_bps else None,
+            "expected_bps": round(self.expected_bps, 1) if self.expected_bps else None,
+            "sampled_bytes": self.sampled_bytes,
+            "reason": self.reason,
+            "tar_stream_codec": self.tar_stream_codec,
+            "compress_choice": self.compress_choice,
+            "measurements": [
+                {
+                    "codec": m.codec,
+                    "level": m.level,
+                    "ratio": round(m.ratio, 3),
+                    "speed_bps": round(m.speed_bps, 1),
+                }
+                for m in self.measurements
+            ],
+        }
+
+
+class CompressionPlanner:
+    """Chooses per-volume compression from sampled data and measured link bandwidth"""
+
+    def __init__(self):
+        migration_config = get_config().migration
+        self.sample_bytes = migration_config.compression_sample_mb * 1024 * 1024
+        self.probe_bytes = migration_config.link_probe_mb * 1024 * 1024
+        self.probe_ttl = migration_config.link_probe_ttl_seconds
+        self.budget_caps = [
+            limit for limit in (parse_bandwidth_limit(migration_config.rsync_bandwidth_limit),
+                                parse_bandwidth_limit(migration_config.bandwidth_limit_per_host))
+            if limit
+        ]
+
+    async def plan(self, source_path: str, target_host: str, ssh_user: str = "root",
+                   ssh_port: int = 22, source: SourceHost = (None, "root", 22)) -> CompressionDecision:
+        """Decide how to compress the transfer of source_path to target_host"""
+        link_bps = await self.probe_link_bandwidth(target_host, ssh_user, ssh_port)
+        if link_bps is None:
+            return CompressionDecision(
+                enabled=True, codec="zlib", level=6,
+                reason="Link bandwidth could not be measured; keeping rsync's default compression")
+        # The bandwidth budget caps the link as far as this transfer is concerned
+        link_bps = min([link_bps, *self.budget_caps])
+
+        sample = await self.sample_volume(source_path, source)
+        if not sample:
+            return CompressionDecision(
+                enabled=False, link_bps=link_bps, reason="Volume is empty or unreadable; nothing to sample")
+
+        codecs, compress_choice = await self.available_codecs(target_host, ssh_user, ssh_port, source)
+        measurements = await asyncio.to_thread(self.measure_codecs, sample, codecs)
+        decision = self.decide(link_bps, len(sample), measurements)
+        decision.compress_choice = compress_choice
+        return decision
+
+    @staticmethod
+    def decide(link_bps: float, sampled_bytes: int,
+               measurements: List[CodecMeasurement]) -> CompressionDecision:
+        """Pick the codec level with the best throughput, or none"""
+        best = max(measurements, key=lambda m: m.throughput(link_bps), default=None)
+        if best is None or best.throughput(link_bps) < link_bps * MIN_SPEEDUP:
+            if best is None:
+                reason = "No codec available on both hosts"
+            elif best.ratio > 0.9:
+                reason = f"Data is incompressible (best ratio {best.ratio:.2f})"
+            else:
+                reason = (f"Compression cannot keep up with the link: {best.codec}-{best.level} compresses at "
+                          f"{format_bytes(int(best.speed_bps))}/s vs {format_bytes(int(link_bps))}/s link")
+            return CompressionDecision(
+                enabled=False, link_bps=link_bps, sampled_bytes=sampled_bytes,
+                expected_bps=link_bps, reason=reason, measurements=measurements)
+
+        throughput = best.throughput(link_bps)
+        zlib_pays_off = any(m.codec == "zlib" and m.level == 1 and
+                            m.throughput(link_bps) >= link_bps * MIN_SPEEDUP for m in measurements)
+        return CompressionDecision(
+            enabled=True, codec=best.codec, level=best.level, link_bps=link_bps,
+            sampled_bytes=sampled_bytes, expected_bps=throughput, measurements=measurements,
+            tar_stream_codec="gzip" if zlib_pays_off else None,
+            reason=(f"{best.codec}-{best.level} shrinks data to {best.ratio:.0%} at "
+                    f"{format_bytes(int(best.speed_bps))}/s, delivering {format_bytes(int(throughput))}/s "
+                    f"over a {format_bytes(int(link_bps))}/s link"))
+
+    @staticmethod
+    def measure_codecs(sample: bytes, codecs: Set[str]) -> List[CodecMeasurement]:
+        """Compress the sample with every available candidate and time it"""
+        measurements = []
+        for codec, level in CANDIDATES:
+            if codec not in codecs:
+                continue
+            started = time.perf_counter()
+            if codec == "zlib":
+                compressed_size = len(zlib.compress(sample, level))
+            else:
+                compressed_size = _compress_with_program(codec, level, sample)
+                if compressed_size is None:
+                    continue
+            elapsed = max(time.perf_counter() - started, 1e-6)
+            measurements.append(CodecMeasurement(
+                codec=codec, level=level,
+                ratio=compressed_size / len(sample),
+                speed_bps=len(sample) / elapsed))
+        return measurements
+
+    async def available_codecs(self, target_host: str, ssh_user: str, ssh_port: int,
+                               source: SourceHost) -> Tuple[Set[str], bool]:
+        """Codecs rsync supports on both ends and that can be measured here,
+        and whether both ends accept --compress-choice"""
+        source_host, source_ssh_user, source_ssh_port = source
+        if source_host:
+            source_list, source_choice = await _rsync_compress_list(SecurityUtils.build_ssh_command(
+                source_host, source_ssh_user, source_ssh_port, "rsync --version"))
+        else:
+            source_list, source_choice = await _rsync_compress_list(["rsync", "--version"])
+        target_list, target_choice = await _rsync_compress_list(SecurityUtils.build_ssh_command(
+            target_host, ssh_user, ssh_port, "rsync --version"))
+
+        codecs = source_list & target_list
+        # Codecs other than zlib are timed with their command line tools
+        return ({codec for codec in codecs if codec == "zlib" or shutil.which(codec)},
+                source_choice and target_choice)
+
+    async def sample_volume(self, source_path: str, source: SourceHost) -> bytes:
+        """Read a random sample of blocks from the files under source_path"""
+        source_host, source_ssh_user, source_ssh_port = source
+        if not source_host:
+            return await asyncio.to_thread(self._sample_local, source_path)
+
+        # Remote files are sampled from their first block, which is what can be
+        # read in one pass without per-file round trips
+        script = (
+            f"find {SecurityUtils.escape_shell_argument(source_path)} -xdev -type f -size +0 2>/dev/null "
+            f"| head -n {SAMPLE_MAX_FILES} | shuf -n {max(1, self.sample_bytes // SAMPLE_BLOCK_SIZE)} "
+            f"| while IFS= read -r f; do head -c {SAMPLE_BLOCK_SIZE} \"$f\"; done "
+            f"| head -c {self.sample_bytes}"
+        )
+        cmd = SecurityUtils.build_ssh_command(source_host, source_ssh_user, source_ssh_port, script)
+        returncode, stdout, _ = await _exec(cmd)
+        return stdout if returncode == 0 else b""
+
+    def _sample_local(self, source_path: str) -> bytes:
+        files = []
+        for root, _, names in os.walk(source_path):
+            for name in names:
+                files.append(os.path.join(root, name))
+                if len(files) >= SAMPLE_MAX_FILES:
+                    break
+            if len(files) >= SAMPLE_MAX_FILES:
+                break
+
+        random.shuffle(files)
+        # Spread the sample over the files, taking several blocks from each
+        # when there are few of them
+        blocks_per_file = max(1, -(-self.sample_bytes // SAMPLE_BLOCK_SIZE) // max(1, len(files)))
+        blocks = []
+        sampled = 0
+        for path in files:
+            if sampled >= self.sample_bytes:
+                break
+            try:
+                if not os.path.isfile(path) or os.path.islink(path):
+                    continue
+                size = os.path.getsize(path)
+                with open(path, "rb") as f:
+                    for _ in range(min(blocks_per_file, max(1, size // SAMPLE_BLOCK_SIZE))):
+                        f.seek(random.randrange(0, max(1, size - SAMPLE_BLOCK_SIZE)))
+                        block = f.read(SAMPLE_BLOCK_SIZE)
+                        blocks.append(block)
+                        sampled += len(block)
+            except OSError:
+                continue
+        return b"".join(blocks)[:self.sample_bytes]
+
+    async def probe_link_bandwidth(self, target_host: str, ssh_user: str = "root",
+                                   ssh_port: int = 22) -> Optional[float]:
+        """Measure bytes per second to target_host over ssh, cached per host"""
+        cached = _link_probe_cache.get((target_host, ssh_port))
+        if cached and time.monotonic() - cached[1] < self.probe_ttl:
+            return cached[0]
+
+        try:
+            cmd = SecurityUtils.build_ssh_command(target_host, ssh_user, ssh_port, "cat > /dev/null")
+        except Exception as e:
+            logger.warning(f"Cannot probe link to {target_host}: {e}")
+            return None
+
+        # An untimed empty probe opens the pooled master connection so neither
+        # timed probe pays for the handshake. The two payloads differ in size
+        # and the per-command overhead cancels out of the difference between
+        # them; random bytes cannot be shrunk by ssh compression
+        small_bytes = self.probe_bytes // PROBE_SMALL_FRACTION
+        await _timed_exec(cmd, b"")
+        small_time = await _timed_exec(cmd, os.urandom(small_bytes))
+        large_time = await _timed_exec(cmd, os.urandom(self.probe_bytes))
+        if small_time is None or large_time is None:
+            logger.warning(f"Link probe to {target_host} failed")
+            return None
+
+        link_bps = (self.probe_bytes - small_bytes) / max(large_time - small_time, 1e-3)
+        _link_probe_cache[(target_host, ssh_port)] = (link_bps, time.monotonic())
+        logger.info(f"Measured {format_bytes(int(link_bps))}/s to {target_host}")
+        return link_bps
+
+
+# (link bytes per second, measured at) keyed by (host, port)
+_link_probe_cache: Dict[Tuple[str, int], Tuple[float, float]] = {}
+
+
+def _compress_with_program(codec: str, level: int, sample: bytes) -> Optional[int]:
+    """Compressed size of the sample using the codec's command line tool"""
+    try:
+        result = subprocess.run([codec, f"-{level}", "-c"], input=sample,
+                                capture_output=True, timeout=60)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return len(result.stdout) if result.returncode == 0 else None
+
+
+async def _rsync_compress_list(cmd: List[str]) -> Tuple[Set[str], bool]:
+    """Parse the "Compress list" from rsync --version, and whether it has one.
+
+    Only rsync 3.2+ lists codecs and accepts --compress-choice; older rsync only has zlib.
+    """
+    returncode, stdout, _ = await _exec(cmd)
+    if returncode != 0:
+        return set(), False
+    lines = stdout.decode(errors="replace").splitlines()
+    for index, line in enumerate(lines):
+        if line.strip().lower().startswith("compress list"):
+            following = lines[index + 1] if index + 1 < len(lines) else ""
+            return {name for name in following.split() if name in {"zstd", "lz4", "zlib"}}, True
+    return {"zlib"}, False
+
+
+async def _exec(cmd: List[str], stdin_data: Optional[bytes] = None) -> Tuple[int, bytes, bytes]:
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if stdin_data is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate(stdin_data)
+        return process.returncode if process.returncode is not None else 1, stdout, stderr
+    except Exception as e:
+        return 1, b"", str(e).encode()
+
+
+async def _timed_exec(cmd: List[str], stdin_data: bytes) -> Optional[float]:
+    started = time.monotonic()
+    returncode, _, _ = await _exec(cmd, stdin_data)
+    return time.monotonic() - started if returncode == 0 else None
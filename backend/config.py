@@ -43,9 +43,70 @@ class MigrationConfig:
     
     # ZFS settings
     zfs_pool: str = "cache"
+    zfs_replication_passes: int = 2
+    zfs_resume_max_attempts: int = 5
+    zfs_resume_backoff_seconds: int = 5
+    zfs_resume_max_backoff_seconds: int = 300
     
     # RSYNC settings
     rsync_bandwidth_limit: str = ""
+    
+    # Bandwidth allocation shared by all transfers; rsync_bandwidth_limit is the
+    # global budget, these add a per-target-host budget and burst allowance
+    bandwidth_limit_per_host: str = ""
+    bandwidth_burst_seconds: int = 2
+    
+    # Concurrent volume transfer limits (shared by all migrations)
+    max_concurrent_volume_transfers: int = 4
+    max_volume_transfers_per_host: int = 2
+    
+    # Streaming transfer engine settings
+    transfer_buffer_size_mb: int = 256
+    transfer_chunk_size_kb: int = 1024
+    transfer_stall_timeout_seconds: int = 30
+    stream_digest_algorithm: str = "sha256"  # empty disables in-flight stream hashing
+    
+    # Sharded parallel rsync settings
+    rsync_parallel_shards: int = 4
+    rsync_shard_min_size_mb: int = 1024
+    rsync_shard_retries: int = 2
+    
+    # Warm migration: rsync pre-copy passes while containers run
+    rsync_warm_max_passes: int = 3
+    rsync_warm_converge_mb: int = 256
+    rsync_zfs_diff: bool = True  # delta passes of local dataset volumes copy what zfs diff lists
+    
+    # Tar stream transfers for trees of many small files
+    tar_stream_min_files: int = 50000
+    tar_stream_max_avg_file_kb: int = 64
+    tar_stream_compression: str = ""
+    
+    # Adaptive compression from sampled volume data and a link probe
+    adaptive_compression: bool = True
+    compression_sample_mb: int = 8
+    link_probe_mb: int = 8
+    link_probe_ttl_seconds: int = 600
+    
+    # Transfer method planning
+    host_capabilities_ttl_seconds: int = 300
+    remote_transfer_mode: str = "auto"  # auto, direct or relay
+    
+    # Checksum engine (0 workers = one per CPU)
+    checksum_workers: int = 0
+    checksum_read_size_kb: int = 4096
+    checksum_verify_channels: int = 4
+    checksum_cache_path: str = "/tmp/transdock_checksum_cache.sqlite"  # empty disables the cache
+    
+    # SSH connection multiplexing (ControlMaster sockets shared per host)
+    ssh_multiplexing: bool = True
+    ssh_control_dir: str = "/tmp/transdock_ssh"
+    ssh_idle_seconds: int = 300
+    ssh_health_check_seconds: int = 60
+    
+    # In-process SSH sessions for remote commands (subprocess or paramiko)
+    ssh_transport: str = "subprocess"
+    ssh_channels_per_host: int = 8
+    ssh_channel_threads: int = 32
 
 
 @dataclass
@@ -136,9 +197,123 @@ class TransDockConfig:
             "TRANSDOCK_COMPOSE_BASE", self.migration.transdock_compose_base
         )
         self.migration.zfs_pool = self._get_string("ZFS_POOL", self.migration.zfs_pool)
+        self.migration.zfs_replication_passes = self._get_int(
+            "ZFS_REPLICATION_PASSES", self.migration.zfs_replication_passes
+        )
+        self.migration.zfs_resume_max_attempts = self._get_int(
+            "ZFS_RESUME_MAX_ATTEMPTS", self.migration.zfs_resume_max_attempts
+        )
+        self.migration.zfs_resume_backoff_seconds = self._get_int(
+            "ZFS_RESUME_BACKOFF_SECONDS", self.migration.zfs_resume_backoff_seconds
+        )
+        self.migration.zfs_resume_max_backoff_seconds = self._get_int(
+            "ZFS_RESUME_MAX_BACKOFF_SECONDS", self.migration.zfs_resume_max_backoff_seconds
+        )
         self.migration.rsync_bandwidth_limit = self._get_string(
             "RSYNC_BANDWIDTH_LIMIT", self.migration.rsync_bandwidth_limit
         )
+        self.migration.bandwidth_limit_per_host = self._get_string(
+            "BANDWIDTH_LIMIT_PER_HOST", self.migration.bandwidth_limit_per_host
+        )
+        self.migration.bandwidth_burst_seconds = self._get_int(
+            "BANDWIDTH_BURST_SECONDS", self.migration.bandwidth_burst_seconds
+        )
+        self.migration.max_concurrent_volume_transfers = self._get_int(
+            "MAX_CONCURRENT_VOLUME_TRANSFERS", self.migration.max_concurrent_volume_transfers
+        )
+        self.migration.max_volume_transfers_per_host = self._get_int(
+            "MAX_VOLUME_TRANSFERS_PER_HOST", self.migration.max_volume_transfers_per_host
+        )
+        self.migration.transfer_buffer_size_mb = self._get_int(
+            "TRANSFER_BUFFER_SIZE_MB", self.migration.transfer_buffer_size_mb
+        )
+        self.migration.transfer_chunk_size_kb = self._get_int(
+            "TRANSFER_CHUNK_SIZE_KB", self.migration.transfer_chunk_size_kb
+        )
+        self.migration.transfer_stall_timeout_seconds = self._get_int(
+            "TRANSFER_STALL_TIMEOUT_SECONDS", self.migration.transfer_stall_timeout_seconds
+        )
+        self.migration.stream_digest_algorithm = self._get_string(
+            "STREAM_DIGEST_ALGORITHM", self.migration.stream_digest_algorithm
+        ).lower()
+        self.migration.rsync_parallel_shards = self._get_int(
+            "RSYNC_PARALLEL_SHARDS", self.migration.rsync_parallel_shards
+        )
+        self.migration.rsync_shard_min_size_mb = self._get_int(
+            "RSYNC_SHARD_MIN_SIZE_MB", self.migration.rsync_shard_min_size_mb
+        )
+        self.migration.rsync_shard_retries = self._get_int(
+            "RSYNC_SHARD_RETRIES", self.migration.rsync_shard_retries
+        )
+        self.migration.rsync_warm_max_passes = self._get_int(
+            "RSYNC_WARM_MAX_PASSES", self.migration.rsync_warm_max_passes
+        )
+        self.migration.rsync_warm_converge_mb = self._get_int(
+            "RSYNC_WARM_CONVERGE_MB", self.migration.rsync_warm_converge_mb
+        )
+        self.migration.rsync_zfs_diff = self._get_bool(
+            "RSYNC_ZFS_DIFF", self.migration.rsync_zfs_diff
+        )
+        self.migration.tar_stream_min_files = self._get_int(
+            "TAR_STREAM_MIN_FILES", self.migration.tar_stream_min_files
+        )
+        self.migration.tar_stream_max_avg_file_kb = self._get_int(
+            "TAR_STREAM_MAX_AVG_FILE_KB", self.migration.tar_stream_max_avg_file_kb
+        )
+        self.migration.tar_stream_compression = self._get_string(
+            "TAR_STREAM_COMPRESSION", self.migration.tar_stream_compression
+        )
+        self.migration.adaptive_compression = self._get_bool(
+            "ADAPTIVE_COMPRESSION", self.migration.adaptive_compression
+        )
+        self.migration.compression_sample_mb = self._get_int(
+            "COMPRESSION_SAMPLE_MB", self.migration.compression_sample_mb
+        )
+        self.migration.link_probe_mb = self._get_int(
+            "LINK_PROBE_MB", self.migration.link_probe_mb
+        )
+        self.migration.link_probe_ttl_seconds = self._get_int(
+            "LINK_PROBE_TTL_SECONDS", self.migration.link_probe_ttl_seconds
+        )
+        self.migration.host_capabilities_ttl_seconds = self._get_int(
+            "HOST_CAPABILITIES_TTL_SECONDS", self.migration.host_capabilities_ttl_seconds
+        )
+        self.migration.remote_transfer_mode = self._get_string(
+            "REMOTE_TRANSFER_MODE", self.migration.remote_transfer_mode
+        )
+        self.migration.checksum_workers = self._get_int(
+            "CHECKSUM_WORKERS", self.migration.checksum_workers
+        )
+        self.migration.checksum_read_size_kb = self._get_int(
+            "CHECKSUM_READ_SIZE_KB", self.migration.checksum_read_size_kb
+        )
+        self.migration.checksum_verify_channels = self._get_int(
+            "CHECKSUM_VERIFY_CHANNELS", self.migration.checksum_verify_channels
+        )
+        self.migration.checksum_cache_path = self._get_string(
+            "CHECKSUM_CACHE_PATH", self.migration.checksum_cache_path
+        )
+        self.migration.ssh_multiplexing = self._get_bool(
+            "SSH_MULTIPLEXING", self.migration.ssh_multiplexing
+        )
+        self.migration.ssh_control_dir = self._get_string(
+            "SSH_CONTROL_DIR", self.migration.ssh_control_dir
+        )
+        self.migration.ssh_idle_seconds = self._get_int(
+            "SSH_IDLE_SECONDS", self.migration.ssh_idle_seconds
+        )
+        self.migration.ssh_health_check_seconds = self._get_int(
+            "SSH_HEALTH_CHECK_SECONDS", self.migration.ssh_health_check_seconds
+        )
+        self.migration.ssh_transport = self._get_string(
+            "SSH_TRANSPORT", self.migration.ssh_transport
+        ).lower()
+        self.migration.ssh_channels_per_host = self._get_int(
+            "SSH_CHANNELS_PER_HOST", self.migration.ssh_channels_per_host
+        )
+        self.migration.ssh_channel_threads = self._get_int(
+            "SSH_CHANNEL_THREADS", self.migration.ssh_channel_threads
+        )
         
         # ==== SAFETY CONFIG ====
         self.safety.require_explicit_target = self._get_bool(
@@ -269,6 +444,12 @@ class TransDockConfig:
         if not (1 <= self.server.port <= 65535):
             print(f"⚠️  Invalid port: {self.server.port}, using default: 8000")
             self.server.port = 8000
+        
+        # Validate remote transfer mode
+        self.migration.remote_transfer_mode = self.migration.remote_transfer_mode.lower()
+        if self.migration.remote_transfer_mode not in ("auto", "direct", "relay"):
+            print(f"⚠️  Invalid remote transfer mode: {self.migration.remote_transfer_mode}, using auto")
+            self.migration.remote_transfer_mode = "auto"
     
     def get_summary(self) -> dict:
         """Get a summary of configuration (without sensitive data)"""
@@ -290,7 +471,37 @@ class TransDockConfig:
                 "default_target_compose_path": self.migration.default_target_compose_path,
                 "default_target_appdata_path": self.migration.default_target_appdata_path,
                 "zfs_pool": self.migration.zfs_pool,
+                "zfs_replication_passes": self.migration.zfs_replication_passes,
+                "zfs_resume_max_attempts": self.migration.zfs_resume_max_attempts,
                 "rsync_bandwidth_limit": self.migration.rsync_bandwidth_limit,
+                "bandwidth_limit_per_host": self.migration.bandwidth_limit_per_host,
+                "max_concurrent_volume_transfers": self.migration.max_concurrent_volume_transfers,
+                "max_volume_transfers_per_host": self.migration.max_volume_transfers_per_host,
+                "transfer_buffer_size_mb": self.migration.transfer_buffer_size_mb,
+                "transfer_chunk_size_kb": self.migration.transfer_chunk_size_kb,
+                "transfer_stall_timeout_seconds": self.migration.transfer_stall_timeout_seconds,
+                "stream_digest_algorithm": self.migration.stream_digest_algorithm,
+                "rsync_parallel_shards": self.migration.rsync_parallel_shards,
+                "rsync_shard_min_size_mb": self.migration.rsync_shard_min_size_mb,
+                "rsync_warm_max_passes": self.migration.rsync_warm_max_passes,
+                "rsync_warm_converge_mb": self.migration.rsync_warm_converge_mb,
+                "rsync_zfs_diff": self.migration.rsync_zfs_diff,
+                "tar_stream_min_files": self.migration.tar_stream_min_files,
+                "tar_stream_max_avg_file_kb": self.migration.tar_stream_max_avg_file_kb,
+                "tar_stream_compression": self.migration.tar_stream_compression,
+                "adaptive_compression": self.migration.adaptive_compression,
+                "host_capabilities_ttl_seconds": self.migration.host_capabilities_ttl_seconds,
+                "remote_transfer_mode": self.migration.remote_transfer_mode,
+                "checksum_workers": self.migration.checksum_workers,
+                "checksum_verify_channels": self.migration.checksum_verify_channels,
+                "checksum_cache_path": self.migration.checksum_cache_path,
+                "ssh_multiplexing": self.migration.ssh_multiplexing,
+                "ssh_control_dir": self.migration.ssh_control_dir,
+                "ssh_idle_seconds": self.migration.ssh_idle_seconds,
+                "ssh_health_check_seconds": self.migration.ssh_health_check_seconds,
+                "ssh_transport": self.migration.ssh_transport,
+                "ssh_channels_per_host": self.migration.ssh_channels_per_host,
+                "ssh_channel_threads": self.migration.ssh_channel_threads,
             },
             "safety": {
                 "require_explicit_target": self.safety.require_explicit_target,
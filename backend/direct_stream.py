@@ -0,0 +1,248 @@
+"""
+Direct host-to-host streaming for TransDock.
+
+When both ends of a transfer are remote, relaying through the API host moves
+every byte over its NIC twice. If the source host can SSH to the target itself,
+the whole pipeline (``zfs send | ssh target zfs receive``) runs on the source
+instead and TransDock only watches it. Progress is read from the producer's
+stderr (``zfs send -v -P`` prints bytes sent once a second) since no data
+passes through this process.
+
+Killing the local ssh does not stop a pipeline on the source: without a
+terminal sshd sends it no signal. The remote side therefore watches its stdin,
+which TransDock holds open for as long as it follows the stream, and kills its
+own process group (sshd starts each session in a new one) once that closes.
+
+Direct streams bypass the in-process bandwidth throttle, so with ``auto`` mode
+they are only used when no bandwidth limit is configured.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .bandwidth import parse_bandwidth_limit
+from .config import get_config
+from .security_utils import SecurityUtils
+from .transfer_engine import ProgressCallback, StreamResult, TransferMetrics
+
+logger = logging.getLogger(__name__)
+
+SourceHost = Tuple[Optional[str], str, int]
+
+# Parses one stderr line into the cumulative bytes sent so far, or None
+ProgressLineParser = Callable[[str], Optional[int]]
+
+# Keep only the tail of stderr for error reporting
+MAX_STDERR_BYTES = 64 * 1024
+
+# zfs send -v -P prints "HH:MM:SS<tab>bytes<tab>snapshot" every second
+ZFS_SEND_PROGRESS = re.compile(r'^\d{2}:\d{2}:\d{2}\t(\d+)\t')
+
+# Runs the pipeline in the background and kills the session's process group
+# when stdin closes early, i.e. when TransDock cancels or loses the stream.
+# Asynchronous lists get /dev/null as stdin, so the watcher reads a copy on fd 3
+DIRECT_PIPELINE_WRAPPER = """exec 3<&0
+{{ (set -o pipefail) 2>/dev/null && set -o pipefail; {pipeline}; }} </dev/null 3<&- &
+pipeline=$!
+{{ IFS= read -r _ <&3; kill -TERM 0; }} &
+watcher=$!
+wait "$pipeline"
+status=$?
+kill "$watcher" 2>/dev/null
+exit "$status"
+"""
+
+# tar --totals prints this once at the end
+TAR_TOTALS = re.compile(r'^Total bytes written: (\d+)')
+
+# Whether a source host could reach a target host, per
+# (source, source user, source port, target, target user, target port),
+# with the monotonic time it was checked
+_reachability_cache: Dict[Tuple, Tuple[float, bool]] = {}
+
+
+def parse_zfs_send_progress(line: str) -> Optional[int]:
+    match = ZFS_SEND_PROGRESS.match(line)
+    return int(match.group(1)) if match else None
+
+
+def parse_tar_totals(line: str) -> Optional[int]:
+    match = TAR_TOTALS.match(line)
+    return int(match.group(1)) if match else None
+
+
+def _target_ssh_command(target_host: str, ssh_user: str, ssh_port: int, consumer: str) -> str:
+    """Shell words for the ssh the source host runs to reach the target"""
+    # The control sockets of the pool are on this host
+    ssh_cmd = SecurityUtils.build_ssh_command(target_host, ssh_user, ssh_port, consumer, multiplex=False)
+    # The source has no terminal to ask for a password on; fail fast instead
+    ssh_cmd[1:1] = ["-o", "BatchMode=yes", "-o", "ConnectTimeout=10"]
+    return " ".join(SecurityUtils.escape_shell_argument(arg) for arg in ssh_cmd)
+
+
+def build_direct_command(source: SourceHost, producer: List[str], target_host: str,
+                         ssh_user: str, ssh_port: int, consumer: str) -> List[str]:
+    """Command running ``producer | ssh target consumer`` on the source host.
+
+    producer is a list of shell-safe words; consumer is the remote command line
+    for the target.
+    """
+    source_host, source_ssh_user, source_ssh_port = source
+    # pipefail reports a failing producer instead of the consumer's verdict on
+    # a cut-off stream, where the shell supports it
+    pipeline = " ".join(producer) + " | " + _target_ssh_command(target_host, ssh_user, ssh_port, consumer)
+    return SecurityUtils.build_ssh_command(source_host, source_ssh_user, source_ssh_port,
+                                           DIRECT_PIPELINE_WRAPPER.format(pipeline=pipeline))
+
+
+async def can_stream_directly(source: SourceHost, target_host: str, ssh_user: str = "root",
+                              ssh_port: int = 22) -> bool:
+    """Whether transfers from source to target_host should bypass the API host.
+
+    Follows ``REMOTE_TRANSFER_MODE``: ``relay`` never streams directly,
+    ``direct`` always does, ``auto`` does when no bandwidth limit is set and
+    the source can log in to the target without a password.
+    """
+    migration_config = get_config().migration
+    mode = migration_config.remote_transfer_mode
+    if not source[0] or mode == "relay":
+        return False
+    if mode == "direct":
+        return True
+    if parse_bandwidth_limit(migration_config.rsync_bandwidth_limit) or \
+            parse_bandwidth_limit(migration_config.bandwidth_limit_per_host):
+        return False
+
+    key = (*source, target_host, ssh_user, ssh_port)
+    cached = _reachability_cache.get(key)
+    if cached and time.monotonic() - cached[0] < migration_config.host_capabilities_ttl_seconds:
+        return cached[1]
+
+    try:
+        source_host, source_ssh_user, source_ssh_port = source
+        cmd = SecurityUtils.build_ssh_command(
+            source_host, source_ssh_user, source_ssh_port,
+            _target_ssh_command(target_host, ssh_user, ssh_port, "true"))
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await asyncio.wait_for(process.communicate(), timeout=30)
+        reachable = process.returncode == 0
+        if not reachable:
+            logger.info(
+                f"{source[0]} cannot reach {target_host} directly, relaying: "
+                f"{stderr.decode(errors='replace').strip()}")
+    except Exception as e:
+        logger.info(f"Direct reachability check {source[0]} -> {target_host} failed, relaying: {e}")
+        reachable = False
+
+    _reachability_cache[key] = (time.monotonic(), reachable)
+    return reachable
+
+
+class DirectStream:
+    """Run a source-side pipeline and follow its progress from stderr"""
+
+    def __init__(self, progress_parser: Optional[ProgressLineParser] = None,
+                 progress_interval: float = 1.0,
+                 progress_callback: Optional[ProgressCallback] = None,
+                 metrics: Optional[TransferMetrics] = None):
+        self.progress_parser = progress_parser
+        self.progress_interval = progress_interval
+        self.progress_callback = progress_callback
+        self.metrics = metrics or TransferMetrics()
+        self._last_notified = 0.0
+
+    async def run(self, cmd: List[str]) -> StreamResult:
+        """Run the pipeline to completion"""
+        self.metrics.finished_at = None
+        # Resumed attempts report bytes from zero again; add them to what
+        # earlier attempts already moved
+        base_bytes = self.metrics.bytes_transferred
+
+        # Held open until the pipeline ends; closing it early stops the
+        # remote side (see DIRECT_PIPELINE_WRAPPER)
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+
+        tail = b""
+        partial = b""
+        try:
+            while True:
+                chunk = await process.stderr.read(65536)
+                if not chunk:
+                    break
+                tail = (tail + chunk)[-MAX_STDERR_BYTES:]
+                lines = (partial + chunk).split(b'\n')
+                partial = lines.pop()[-MAX_STDERR_BYTES:]
+                for line in lines:
+                    await self._parse_line(line.decode(errors='replace'), base_bytes)
+            if partial:
+                await self._parse_line(partial.decode(errors='replace'), base_bytes)
+            returncode = await process.wait()
+        except BaseException:
+            # A multiplexed ssh hands its stdio to the master, so killing the
+            # client alone would neither close stdin nor end the wait below
+            process.stdin.close()
+            if process.returncode is None:
+                process.kill()
+            await process.wait()
+            raise
+        process.stdin.close()
+
+        self.metrics.finished_at = time.monotonic()
+        self.metrics.instantaneous_bps = 0.0
+        self._update_average()
+        await self._notify()
+
+        return StreamResult(
+            success=returncode == 0,
+            metrics=self.metrics,
+            source_returncode=returncode,
+            source_stderr=tail.decode(errors='replace')
+        )
+
+    async def _parse_line(self, line: str, base_bytes: int):
+        if not self.progress_parser:
+            return
+        sent = self.progress_parser(line)
+        if sent is None:
+            return
+
+        now = time.monotonic()
+        elapsed = now - self.metrics.last_activity_at
+        delivered = base_bytes + sent - self.metrics.bytes_transferred
+        if elapsed > 0 and delivered > 0:
+            self.metrics.instantaneous_bps = delivered / elapsed
+        if delivered > 0:
+            self.metrics.bytes_transferred = base_bytes + sent
+            self.metrics.last_activity_at = now
+        self._update_average()
+
+        if now - self._last_notified >= self.progress_interval:
+            self._last_notified = now
+            await self._notify()
+
+    def _update_average(self):
+        elapsed = self.metrics.elapsed_seconds
+        if elapsed > 0:
+            self.metrics.average_bps = self.metrics.bytes_transferred / elapsed
+
+    async def _notify(self):
+        """Invoke the progress callback, never letting it break the transfer"""
+        if not self.progress_callback:
+            return
+        try:
+            await self.progress_callback(self.metrics)
+        except Exception as e:
+            logger.warning(f"Transfer progress callback failed: {e}")
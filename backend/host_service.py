@@ -2,14 +2,24 @@ import logging
 import os
 import yaml
 import asyncio
+import time
 from typing import List, Dict, Optional, Tuple, Any
 from .models import HostInfo, HostCapabilities, RemoteStack, StackAnalysis, VolumeMount, StorageInfo, StorageValidationResult, MigrationStorageRequirement
 from .security_utils import SecurityUtils, SecurityValidationError
 from .docker_ops import DockerOperations
 from .utils import format_bytes
+from .config import get_config
+from .remote_probe import ProbeBatch, ProbeResult, glob_words
+from .ssh_pool import get_ssh_pool
+from .ssh_sessions import get_ssh_session_pool, paramiko_transport_enabled
 
 logger = logging.getLogger(__name__)
 
+# Probed capabilities per (hostname, ssh_user, ssh_port), with the monotonic time
+# they were probed. Shared by all HostService instances so repeated migrations
+# to the same host don't probe it again over SSH.
+_capabilities_cache: Dict[Tuple[str, str, int], Tuple[float, HostCapabilities]] = {}
+
 
 class HostService:
     """Service for managing remote hosts and stack operations"""
@@ -32,6 +42,8 @@ class HostService:
             "/home/*/appdata",
             "/docker/appdata"
         ]
+        # Paths whose storage is reported when no compose or appdata path is found
+        self.fallback_storage_paths = ["/mnt/cache", "/mnt/user", "/opt", "/home"]
     
     async def run_remote_command(self, host_info: HostInfo, command: str) -> Tuple[int, str, str]:
         """Run a command on a remote host"""
@@ -49,7 +61,13 @@ class HostService:
                 command
             )
             
+            if paramiko_transport_enabled():
+                return await get_ssh_session_pool().run(
+                    host_info.hostname, host_info.ssh_user, host_info.ssh_port, command)
+            
             # Execute command
+            ssh_pool = get_ssh_pool()
+            timing = ssh_pool.begin(ssh_cmd)
             process = await asyncio.create_subprocess_exec(
                 *ssh_cmd,
                 stdout=asyncio.subprocess.PIPE,
@@ -57,6 +75,7 @@ class HostService:
             )
             stdout, stderr = await process.communicate()
             returncode = process.returncode if process.returncode is not None else 1
+            ssh_pool.end(timing, returncode)
             
             return returncode, stdout.decode(), stderr.decode()
             
@@ -67,8 +86,38 @@ class HostService:
             logger.error(f"Failed to run remote command: {e}")
             return 1, "", str(e)
     
-    async def check_host_capabilities(self, host_info: HostInfo) -> HostCapabilities:
-        """Check what capabilities are available on a remote host"""
+    async def check_host_capabilities(self, host_info: HostInfo,
+                                      max_age: Optional[float] = None) -> HostCapabilities:
+        """Check what capabilities are available on a remote host.
+
+        Results are reused for ``max_age`` seconds (the configured
+        ``host_capabilities_ttl_seconds`` by default); pass 0 to force a probe.
+        """
+        if max_age is None:
+            max_age = get_config().migration.host_capabilities_ttl_seconds
+        key = (host_info.hostname, host_info.ssh_user, host_info.ssh_port)
+        cached = _capabilities_cache.get(key)
+        if cached and time.monotonic() - cached[0] < max_age:
+            return cached[1].model_copy(deep=True)
+
+        capabilities = await self._probe_host_capabilities(host_info)
+        # Failed probes are not cached so the next check tries again
+        if capabilities.error:
+            _capabilities_cache.pop(key, None)
+        else:
+            _capabilities_cache[key] = (time.monotonic(), capabilities.model_copy(deep=True))
+        return capabilities
+
+    @staticmethod
+    def invalidate_capabilities(host_info: Optional[HostInfo] = None):
+        """Forget cached capabilities of one host, or of all hosts"""
+        if host_info is None:
+            _capabilities_cache.clear()
+        else:
+            _capabilities_cache.pop((host_info.hostname, host_info.ssh_user, host_info.ssh_port), None)
+
+    async def _probe_host_capabilities(self, host_info: HostInfo) -> HostCapabilities:
+        """Probe Docker, ZFS and storage paths on a remote host in one remote command"""
         capabilities = HostCapabilities(
             hostname=host_info.hostname,
             docker_available=False,
@@ -76,45 +125,46 @@ class HostService:
         )
         
         try:
+            batch = ProbeBatch()
+            batch.add("docker", "docker --version")
+            batch.add("zfs", "zfs version")
+            # Only read when zfs is available; failing without it costs nothing
+            batch.add("zpool", "zpool list -H -o name")
+            compose_probes = self._add_path_probes(batch, "compose", self.common_compose_paths)
+            appdata_probes = self._add_path_probes(batch, "appdata", self.common_appdata_paths)
+            fallback_probes = self._add_path_probes(batch, "fallback", self.fallback_storage_paths)
+            results = await batch.run(lambda command: self.run_remote_command(host_info, command))
+            
             # Check Docker availability and version
-            returncode, stdout, stderr = await self.run_remote_command(
-                host_info, "docker --version"
-            )
-            capabilities.docker_available = returncode == 0
-            if capabilities.docker_available and stdout:
+            docker = results.get("docker")
+            capabilities.docker_available = docker is not None and docker.ok
+            if capabilities.docker_available and docker.stdout:
                 # Extract version from output like "Docker version 20.10.21, build baeda1f"
-                capabilities.docker_version = stdout.strip()
+                capabilities.docker_version = docker.stdout.strip()
             
             # Check ZFS availability and version
-            returncode, stdout, stderr = await self.run_remote_command(
-                host_info, "zfs version"
-            )
-            capabilities.zfs_available = returncode == 0
-            if capabilities.zfs_available and stdout:
+            zfs = results.get("zfs")
+            capabilities.zfs_available = zfs is not None and zfs.ok
+            if capabilities.zfs_available and zfs.stdout:
                 # Extract version from zfs version output
-                capabilities.zfs_version = stdout.strip().split('\n')[0]  # Take first line
+                capabilities.zfs_version = zfs.stdout.strip().split('\n')[0]  # Take first line
             
             # If ZFS is available, get pools
-            if capabilities.zfs_available:
-                returncode, stdout, stderr = await self.run_remote_command(
-                    host_info, "zpool list -H -o name"
-                )
-                if returncode == 0:
-                    capabilities.zfs_pools = [line.strip() for line in stdout.split('\n') if line.strip()]
-            
-            # Discover compose paths
-            capabilities.compose_paths = await self._discover_paths(host_info, self.common_compose_paths)
-            
-            # Discover appdata paths
-            capabilities.appdata_paths = await self._discover_paths(host_info, self.common_appdata_paths)
-            
-            # Get storage information for discovered paths
-            all_paths = list(set(capabilities.compose_paths + capabilities.appdata_paths))
-            if not all_paths:
-                # Add some common paths if none were discovered
-                all_paths = ["/mnt/cache", "/mnt/user", "/opt", "/home"]
-            
-            capabilities.storage_info = await self.get_storage_info(host_info, all_paths)
+            zpool = results.get("zpool")
+            if capabilities.zfs_available and zpool is not None and zpool.ok:
+                capabilities.zfs_pools = zpool.lines
+            
+            # Discover compose and appdata paths with the storage behind them
+            compose_storage = self._parse_path_probes(results, compose_probes)
+            appdata_storage = self._parse_path_probes(results, appdata_probes)
+            capabilities.compose_paths = list(compose_storage)
+            capabilities.appdata_paths = list(appdata_storage)
+            
+            storage = {**compose_storage, **appdata_storage}
+            if not storage:
+                # Report some common paths if none were discovered
+                storage = self._parse_path_probes(results, fallback_probes)
+            capabilities.storage_info = [info for info in storage.values() if info is not None]
             
         except Exception as e:
             logger.error(f"Failed to check host capabilities: {e}")
@@ -122,43 +172,55 @@ class HostService:
         
         return capabilities
     
+    @staticmethod
+    def _path_probe(path: str) -> str:
+        """Shell listing the directories matching path, each followed by a tab and its df line"""
+        if '*' in path:
+            # Validates the wildcard the same way a directory search would
+            SecurityUtils.split_wildcard_path(path)
+            words = glob_words(SecurityUtils.sanitize_path(path, allow_absolute=True))
+        else:
+            words = SecurityUtils.escape_shell_argument(SecurityUtils.sanitize_path(path, allow_absolute=True))
+        return (f"for d in {words}; do [ -d \"$d\" ] || continue; "
+                f"printf '%s\\t' \"$d\"; df -B1 -P -- \"$d\" | tail -n 1; done")
+    
+    def _add_path_probes(self, batch: ProbeBatch, prefix: str, paths: List[str]) -> List[str]:
+        """Add a probe per candidate path; returns the probe names"""
+        names = []
+        for index, path in enumerate(paths):
+            try:
+                probe = self._path_probe(path)
+            except ValueError as e:
+                logger.warning(f"Skipping invalid path: {path} ({e})")
+                continue
+            names.append(f"{prefix}.{index}")
+            batch.add(names[-1], probe)
+        return names
+    
+    def _parse_path_probes(self, results: Dict[str, ProbeResult],
+                           names: List[str]) -> Dict[str, Optional[StorageInfo]]:
+        """Existing directories found by path probes, with their storage when df succeeded"""
+        found: Dict[str, Optional[StorageInfo]] = {}
+        for name in names:
+            result = results.get(name)
+            if result is None:
+                continue
+            for line in result.stdout.split('\n'):
+                path, separator, df_line = line.partition('\t')
+                if separator and path not in found:
+                    found[path] = self._parse_df_line(path, df_line)
+        return found
+    
     async def _discover_paths(self, host_info: HostInfo, paths: List[str]) -> List[str]:
         """Discover which paths exist on the remote host"""
-        existing_paths = []
-        
-        for path in paths:
-            # Handle wildcard paths
-            if '*' in path:
-                try:
-                    # Securely split the path
-                    base_path, pattern = SecurityUtils.split_wildcard_path(path)
-                    
-                    # Sanitize the base path
-                    sanitized_base_path = SecurityUtils.sanitize_path(base_path, allow_absolute=True)
-                    
-                    # Build a safer find command
-                    find_cmd = (
-                        f"find {SecurityUtils.escape_shell_argument(sanitized_base_path)} "
-                        f"-maxdepth 1 -type d -name '{SecurityUtils.escape_shell_argument(pattern)}' 2>/dev/null || true"
-                    )
-                    
-                    returncode, stdout, stderr = await self.run_remote_command(host_info, find_cmd)
-                    if returncode == 0 and stdout.strip():
-                        existing_paths.extend([line.strip() for line in stdout.split('\n') if line.strip()])
-                except ValueError as e:
-                    logger.warning(f"Skipping invalid wildcard path: {path} ({e})")
-            else:
-                # Check if directory exists
-                try:
-                    sanitized_path = SecurityUtils.sanitize_path(path, allow_absolute=True)
-                    test_cmd = f"test -d {SecurityUtils.escape_shell_argument(sanitized_path)} && echo 'exists' || echo 'not_found'"
-                    returncode, stdout, stderr = await self.run_remote_command(host_info, test_cmd)
-                    if returncode == 0 and 'exists' in stdout:
-                        existing_paths.append(path)
-                except ValueError as e:
-                    logger.warning(f"Skipping invalid path: {path} ({e})")
-        
-        return existing_paths
+        batch = ProbeBatch()
+        names = self._add_path_probes(batch, "path", paths)
+        try:
+            results = await batch.run(lambda command: self.run_remote_command(host_info, command))
+        except RuntimeError as e:
+            logger.error(f"Failed to discover paths: {e}")
+            return []
+        return list(self._parse_path_probes(results, names))
     
     async def list_remote_stacks(self, host_info: HostInfo, compose_path: str) -> List[RemoteStack]:
         """List compose stacks on a remote host"""
@@ -424,45 +486,55 @@ class HostService:
             logger.error(f"Failed to stop remote stack: {e}")
             return False
     
+    @staticmethod
+    def _parse_df_line(path: str, line: str) -> Optional[StorageInfo]:
+        """StorageInfo from a data line of ``df -B1 -P``"""
+        # Parse df output (filesystem, total, used, available, use%, mount)
+        fields = line.split()
+        if len(fields) < 6:
+            return None
+        try:
+            return StorageInfo(
+                path=path,
+                total_bytes=int(fields[1]),
+                used_bytes=int(fields[2]),
+                available_bytes=int(fields[3]),
+                filesystem=fields[0],
+                mount_point=fields[5]
+            )
+        except ValueError:
+            return None
+    
     async def get_storage_info(self, host_info: HostInfo, paths: List[str]) -> List[StorageInfo]:
         """Get storage information for specified paths on a remote host"""
-        storage_info = []
-        
+        batch = ProbeBatch()
+        safe_paths = {}
         for path in paths:
             try:
                 # Validate and sanitize path
                 safe_path = SecurityUtils.sanitize_path(path, allow_absolute=True)
-                
-                # Get filesystem information using df
-                df_cmd = f"df -B1 {SecurityUtils.escape_shell_argument(safe_path)} 2>/dev/null || echo 'error'"
-                returncode, stdout, stderr = await self.run_remote_command(host_info, df_cmd)
-                
-                if returncode == 0 and 'error' not in stdout:
-                    lines = stdout.strip().split('\n')
-                    if len(lines) >= 2:
-                        # Parse df output (filesystem, total, used, available, use%, mount)
-                        fields = lines[1].split()
-                        if len(fields) >= 6:
-                            filesystem = fields[0]
-                            total_bytes = int(fields[1])
-                            used_bytes = int(fields[2])
-                            available_bytes = int(fields[3])
-                            mount_point = fields[5] if len(fields) > 5 else safe_path
-                            
-                            storage_info.append(StorageInfo(
-                                path=safe_path,
-                                total_bytes=total_bytes,
-                                used_bytes=used_bytes,
-                                available_bytes=available_bytes,
-                                filesystem=filesystem,
-                                mount_point=mount_point
-                            ))
-                            
-                            logger.info(f"Storage info for {safe_path}: {format_bytes(available_bytes)} available")
-                
             except Exception as e:
                 logger.error(f"Failed to get storage info for {path}: {e}")
                 continue
+            name = f"df.{len(safe_paths)}"
+            safe_paths[name] = safe_path
+            batch.add(name, f"df -B1 -P -- {SecurityUtils.escape_shell_argument(safe_path)}")
+        
+        try:
+            results = await batch.run(lambda command: self.run_remote_command(host_info, command))
+        except RuntimeError as e:
+            logger.error(f"Failed to get storage info: {e}")
+            return []
+        
+        storage_info = []
+        for name, safe_path in safe_paths.items():
+            result = results.get(name)
+            if result is None or not result.ok or not result.lines:
+                continue
+            info = self._parse_df_line(safe_path, result.lines[-1])
+            if info:
+                storage_info.append(info)
+                logger.info(f"Storage info for {safe_path}: {format_bytes(info.available_bytes)} available")
         
         return storage_info
     
@@ -0,0 +1,229 @@
+"""
+known_hosts lookups and host key scanning for TransDock.
+
+Checking whether a host is known used to read the whole known_hosts file and
+search it for the host name as a substring on every remote command, which
+both costs a file read per call and matches the wrong hosts (``db`` in
+``db2``), while never matching hashed entries. ``KnownHostsIndex`` parses the
+file once into a dict of plain host names, the hashed ``|1|salt|hash``
+entries and any wildcard lines, and parses it again only when its mtime,
+size or inode changes. Names are looked up the way ssh does: ``host`` for
+port 22 and ``[host]:port`` otherwise.
+
+Host keys are fetched with ``ssh-keyscan`` as an asyncio subprocess, one
+process per port for any number of hosts, so scanning never blocks the event
+loop and a fleet is scanned in parallel.
+"""
+
+import asyncio
+import base64
+import binascii
+import fnmatch
+import hashlib
+import hmac
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+HASHED_PREFIX = "|1|"
+KEYSCAN_TIMEOUT_SECONDS = 10
+
+# (hostname, port)
+HostPort = Tuple[str, int]
+
+
+def known_hosts_name(host: str, port: int = 22) -> str:
+    """The name ssh looks up in known_hosts for a host and port"""
+    host = host.lower()
+    return host if int(port) == 22 else f"[{host}]:{port}"
+
+
+def _parse_hashed(pattern: str) -> Optional[Tuple[bytes, bytes]]:
+    parts = pattern[len(HASHED_PREFIX):].split("|")
+    if len(parts) != 2:
+        return None
+    try:
+        return base64.b64decode(parts[0]), base64.b64decode(parts[1])
+    except (binascii.Error, ValueError):
+        return None
+
+
+class KnownHostsIndex:
+    """Parsed known_hosts file, reloaded when the file changes"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._signature: Optional[Tuple[int, int, int]] = None
+        # Plain host name -> key lines
+        self._plain: Dict[str, List[str]] = {}
+        # (salt, hash, key line) of hashed entries
+        self._hashed: List[Tuple[bytes, bytes, str]] = []
+        # (positive patterns, negated patterns, key line) of wildcard and negated entries
+        self._patterns: List[Tuple[List[str], List[str], str]] = []
+        # Host name -> key lines of every name looked up since the file was parsed
+        self._resolved: Dict[str, List[str]] = {}
+
+    def _current(self):
+        """Reload the file if it changed since it was parsed"""
+        try:
+            stat_result = os.stat(self.path)
+            signature = (stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino)
+        except FileNotFoundError:
+            signature = None
+        with self._lock:
+            if not self._loaded or signature != self._signature:
+                self._parse(signature)
+
+    def _parse(self, signature: Optional[Tuple[int, int, int]]):
+        plain: Dict[str, List[str]] = defaultdict(list)
+        hashed, patterns = [], []
+        if signature is not None:
+            try:
+                with open(self.path, 'r', errors='replace') as f:
+                    lines = f.readlines()
+            except OSError as e:
+                logger.warning(f"Cannot read {self.path}: {e}")
+                lines = []
+            for line in lines:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+                fields = line.split()
+                if fields[0].startswith("@"):
+                    # Revoked keys do not make a host known; CA lines are trusted for their patterns
+                    if fields[0] == "@revoked" or len(fields) < 2:
+                        continue
+                    fields = fields[1:]
+                host_field = fields[0]
+                if host_field.startswith(HASHED_PREFIX):
+                    parsed = _parse_hashed(host_field)
+                    if parsed:
+                        hashed.append((parsed[0], parsed[1], line))
+                    continue
+                names = [name.lower() for name in host_field.split(",") if name]
+                if any(name.startswith("!") or "*" in name or "?" in name for name in names):
+                    patterns.append(([name for name in names if not name.startswith("!")],
+                                     [name[1:] for name in names if name.startswith("!")], line))
+                else:
+                    for name in names:
+                        plain[name].append(line)
+        self._plain, self._hashed, self._patterns = dict(plain), hashed, patterns
+        self._resolved = {}
+        self._signature = signature
+        self._loaded = True
+
+    def _resolve(self, name: str) -> List[str]:
+        lines = list(self._plain.get(name, ()))
+        encoded = name.encode()
+        for salt, digest, line in self._hashed:
+            if hmac.compare_digest(hmac.new(salt, encoded, hashlib.sha1).digest(), digest):
+                lines.append(line)
+        for positive, negated, line in self._patterns:
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in negated):
+                continue
+            if any(fnmatch.fnmatchcase(name, pattern) for pattern in positive):
+                lines.append(line)
+        return lines
+
+    def lookup(self, host: str, port: int = 22) -> List[str]:
+        """The known_hosts lines that match a host, empty when it is unknown"""
+        self._current()
+        name = known_hosts_name(host, port)
+        with self._lock:
+            lines = self._resolved.get(name)
+            if lines is None:
+                lines = self._resolved[name] = self._resolve(name)
+            return list(lines)
+
+    def knows(self, host: str, port: int = 22) -> bool:
+        return bool(self.lookup(host, port))
+
+    def add(self, key_lines: List[str]):
+        """Append host key lines to the file"""
+        key_lines = [line.strip() for line in key_lines if line.strip()]
+        if not key_lines:
+            return
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, mode=0o700, exist_ok=True)
+            needs_newline = False
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                with open(self.path, 'rb') as f:
+                    f.seek(-1, os.SEEK_END)
+                    needs_newline = f.read(1) != b"\n"
+            with open(self.path, 'a') as f:
+                f.write(("\n" if needs_newline else "") + "\n".join(key_lines) + "\n")
+            os.chmod(self.path, 0o600)
+            # The next lookup reparses, whatever the mtime resolution
+            self._loaded = False
+
+
+async def scan_host_keys(targets: List[HostPort],
+                         timeout: int = KEYSCAN_TIMEOUT_SECONDS) -> Dict[HostPort, List[str]]:
+    """Fetch the host keys of many hosts with ssh-keyscan, in parallel.
+
+    Returns the known_hosts lines found per (host, port); hosts that did not
+    answer have no lines.
+    """
+    by_port: Dict[int, List[str]] = defaultdict(list)
+    for host, port in targets:
+        if host not in by_port[int(port)]:
+            by_port[int(port)].append(host)
+
+    async def scan(port: int, hosts: List[str]) -> List[str]:
+        process = await asyncio.create_subprocess_exec(
+            "ssh-keyscan", "-T", str(timeout), "-p", str(port), "--", *hosts,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            # ssh-keyscan applies the timeout per connection; allow for slow DNS on top
+            stdout, _ = await asyncio.wait_for(process.communicate(), timeout=timeout * 3)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            logger.warning(f"ssh-keyscan of {len(hosts)} hosts on port {port} timed out")
+            return []
+        return stdout.decode(errors='replace').splitlines()
+
+    results: Dict[HostPort, List[str]] = {(host, int(port)): [] for host, port in targets}
+    scans = await asyncio.gather(*(scan(port, hosts) for port, hosts in by_port.items()),
+                                 return_exceptions=True)
+    for (port, hosts), lines in zip(by_port.items(), scans):
+        if isinstance(lines, BaseException):
+            logger.error(f"ssh-keyscan on port {port} failed: {lines}")
+            continue
+        names = {known_hosts_name(host, port): host for host in hosts}
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 3 or line.startswith("#"):
+                continue
+            host = names.get(fields[0].lower())
+            if host is not None:
+                results[(host, port)].append(line.strip())
+    return results
+
+
+async def scan_host_key(host: str, port: int = 22, timeout: int = KEYSCAN_TIMEOUT_SECONDS) -> List[str]:
+    """The known_hosts lines of one host's keys, empty when it could not be scanned"""
+    return (await scan_host_keys([(host, port)], timeout))[(host, int(port))]
+
+
+_known_hosts_indexes: Dict[str, KnownHostsIndex] = {}
+
+
+def get_known_hosts_index(path: Optional[str] = None) -> KnownHostsIndex:
+    """Get the shared index of a known_hosts file (the user's by default)"""
+    path = os.path.abspath(os.path.expanduser(path or "~/.ssh/known_hosts"))
+    index = _known_hosts_indexes.get(path)
+    if index is None:
+        index = _known_hosts_indexes[path] = KnownHostsIndex(path)
+    return index
@@ -20,6 +20,8 @@ from .config import get_config
 from .migration_service import MigrationService
 from .host_service import HostService
 from .security_utils import SecurityValidationError
+from .ssh_pool import get_ssh_pool
+from .ssh_sessions import get_ssh_session_pool, paramiko_transport_enabled
 
 # Import routers
 from .api.routers import (
@@ -51,12 +53,17 @@ async def lifespan(app: FastAPI):
     """
     # Startup
     logger.info("Starting TransDock API service...")
+    get_ssh_pool().start()
+    if paramiko_transport_enabled():
+        get_ssh_session_pool().start()
     
     yield
     
     # Shutdown
     logger.info("Shutting down TransDock API service...")
-    # Add any cleanup code here
+    await get_ssh_pool().shutdown()
+    if paramiko_transport_enabled():
+        await get_ssh_session_pool().shutdown()
 
 
 # Create FastAPI app
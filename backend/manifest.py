@@ -0,0 +1,274 @@
+"""
+Manifest based transfer verification for TransDock.
+
+Each side of a transfer lists its files in one streaming pass: ``find``
+prints size, mtime, mode and relative path for every regular file and
+``sort`` orders the records by path (an external merge sort, so memory stays
+bounded however many files there are). The target's listing comes from a
+single SSH invocation. The two sorted streams are compared as a merge-join
+while they are read, so only the current record of each side is held here.
+
+With a hash algorithm the listing gets a second section with the content
+hash of every file, in the same order, compared the same way.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .security_utils import SecurityUtils, SecurityValidationError
+
+logger = logging.getLogger(__name__)
+
+SourceHost = Tuple[Optional[str], str, int]
+
+# Hash programs by algorithm name; each prints "<hash>  <name>" per file
+HASH_PROGRAMS = {
+    "md5": "md5sum",
+    "sha1": "sha1sum",
+    "sha256": "sha256sum",
+    "sha512": "sha512sum",
+    "blake2b": "b2sum",
+}
+
+# Paths listed per category; the counts are always complete
+MAX_LISTED_PATHS = 1000
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+# $1 is the root directory, $2 the hash program (empty for none). Records are
+# NUL terminated: "size mtime mode path" sorted by path, then an empty record
+# and "hash  path" in the same order when hashing.
+MANIFEST_SCRIPT = (
+    'cd -- "$1" || exit 2; '
+    "find . -xdev -type f -printf '%s %T@ %m %P\\0' | LC_ALL=C sort -z -t ' ' -k4 || exit 3; "
+    '[ -n "$2" ] || exit 0; '
+    "printf '\\0'; "
+    "find . -xdev -type f -printf '%P\\0' | LC_ALL=C sort -z | xargs -0 -r \"$2\" -z -- || exit 4"
+)
+
+
+@dataclass
+class ManifestEntry:
+    """One file of a manifest"""
+    path: bytes
+    size: int
+    mtime: int
+    mode: str
+
+
+@dataclass
+class ManifestDiff:
+    """Differences between a source and a target manifest"""
+    hash_algorithm: Optional[str] = None
+    files_compared: int = 0
+    bytes_compared: int = 0
+    files_matched: int = 0
+    missing_count: int = 0
+    extra_count: int = 0
+    mismatched_count: int = 0
+    hash_mismatched_count: int = 0
+    missing: List[str] = field(default_factory=list)
+    extra: List[str] = field(default_factory=list)
+    mismatched: List[Dict[str, Any]] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def matched(self) -> bool:
+        return (self.error is None and not self.missing_count and not self.extra_count
+                and not self.mismatched_count and not self.hash_mismatched_count)
+
+    def add_missing(self, path: bytes):
+        self.missing_count += 1
+        if len(self.missing) < MAX_LISTED_PATHS:
+            self.missing.append(_display_path(path))
+
+    def add_extra(self, path: bytes):
+        self.extra_count += 1
+        if len(self.extra) < MAX_LISTED_PATHS:
+            self.extra.append(_display_path(path))
+
+    def add_mismatch(self, path: bytes, reasons: Dict[str, Any]):
+        if "hash" in reasons:
+            self.hash_mismatched_count += 1
+        else:
+            self.mismatched_count += 1
+        if len(self.mismatched) < MAX_LISTED_PATHS:
+            self.mismatched.append({"path": _display_path(path), **reasons})
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the diff for API responses"""
+        return {
+            "matched": self.matched,
+            "hash_algorithm": self.hash_algorithm,
+            "files_compared": self.files_compared,
+            "bytes_compared": self.bytes_compared,
+            "files_matched": self.files_matched,
+            "missing_count": self.missing_count,
+            "extra_count": self.extra_count,
+            "mismatched_count": self.mismatched_count,
+            "hash_mismatched_count": self.hash_mismatched_count,
+            "missing": self.missing,
+            "extra": self.extra,
+            "mismatched": self.mismatched,
+            "truncated": (max(self.missing_count, self.extra_count) > MAX_LISTED_PATHS or
+                          self.mismatched_count + self.hash_mismatched_count > MAX_LISTED_PATHS),
+            "error": self.error,
+        }
+
+
+def _display_path(path: bytes) -> str:
+    return path.decode(errors='replace')
+
+
+def build_manifest_command(path: str, hash_algorithm: Optional[str] = None,
+                           host: SourceHost = (None, "root", 22)) -> List[str]:
+    """Command printing the manifest of path, on a remote host when one is given"""
+    path = SecurityUtils.sanitize_path(path, allow_absolute=True)
+    if hash_algorithm and hash_algorithm not in HASH_PROGRAMS:
+        raise SecurityValidationError(f"Unsupported hash algorithm: {hash_algorithm}")
+    hash_program = HASH_PROGRAMS[hash_algorithm] if hash_algorithm else ""
+
+    args = ["sh", "-c", MANIFEST_SCRIPT, "manifest", path, hash_program]
+    hostname, ssh_user, ssh_port = host
+    if not hostname:
+        return args
+    return SecurityUtils.build_ssh_command(
+        hostname, ssh_user, ssh_port,
+        " ".join(SecurityUtils.escape_shell_argument(arg) for arg in args))
+
+
+class ManifestStream:
+    """Reads a manifest process's NUL terminated records one at a time"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self._records: List[bytes] = []
+        self._partial = b""
+        self._eof = False
+
+    async def next_record(self) -> Optional[bytes]:
+        """The next record, b"" at a section boundary, None at the end"""
+        while not self._records:
+            if self._eof:
+                return None
+            chunk = await self.process.stdout.read(READ_CHUNK_SIZE)
+            if not chunk:
+                self._eof = True
+                if self._partial:
+                    self._records.append(self._partial)
+                    self._partial = b""
+                continue
+            records = (self._partial + chunk).split(b'\0')
+            self._partial = records.pop()
+            # Reversed so records can be popped from the end in order
+            self._records = records[::-1]
+        return self._records.pop()
+
+    async def entries(self) -> AsyncIterator[ManifestEntry]:
+        """Metadata records of the first section"""
+        while True:
+            record = await self.next_record()
+            if not record:
+                return
+            size, mtime, mode, path = record.split(b' ', 3)
+            # Whole seconds: tar and some filesystems drop the fraction
+            yield ManifestEntry(path=path, size=int(size), mtime=int(mtime.split(b'.')[0]),
+                                mode=mode.decode())
+
+    async def hashes(self) -> AsyncIterator[Tuple[bytes, str]]:
+        """(path, hash) records of the hash section"""
+        while True:
+            record = await self.next_record()
+            if record is None:
+                return
+            digest, _, path = record.partition(b'  ')
+            yield path, digest.decode(errors='replace')
+
+
+async def _advance(iterator: AsyncIterator) -> Any:
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+async def _diff_entries(source: ManifestStream, target: ManifestStream, diff: ManifestDiff):
+    """Merge-join the metadata sections"""
+    source_entries, target_entries = source.entries(), target.entries()
+    source_entry, target_entry = await _advance(source_entries), await _advance(target_entries)
+    while source_entry or target_entry:
+        if target_entry is None or (source_entry and source_entry.path < target_entry.path):
+            diff.add_missing(source_entry.path)
+            source_entry = await _advance(source_entries)
+        elif source_entry is None or target_entry.path < source_entry.path:
+            diff.add_extra(target_entry.path)
+            target_entry = await _advance(target_entries)
+        else:
+            diff.files_compared += 1
+            diff.bytes_compared += source_entry.size
+            reasons = {}
+            for attribute in ("size", "mtime", "mode"):
+                source_value, target_value = getattr(source_entry, attribute), getattr(target_entry, attribute)
+                if source_value != target_value:
+                    reasons[attribute] = {"source": source_value, "target": target_value}
+            if reasons:
+                diff.add_mismatch(source_entry.path, reasons)
+            else:
+                diff.files_matched += 1
+            source_entry, target_entry = await _advance(source_entries), await _advance(target_entries)
+
+
+async def _diff_hashes(source: ManifestStream, target: ManifestStream, diff: ManifestDiff):
+    """Merge-join the hash sections; paths on one side only were already reported"""
+    source_hashes, target_hashes = source.hashes(), target.hashes()
+    source_item, target_item = await _advance(source_hashes), await _advance(target_hashes)
+    while source_item or target_item:
+        if target_item is None or (source_item and source_item[0] < target_item[0]):
+            source_item = await _advance(source_hashes)
+        elif source_item is None or target_item[0] < source_item[0]:
+            target_item = await _advance(target_hashes)
+        else:
+            if source_item[1] != target_item[1]:
+                diff.add_mismatch(source_item[0], {"hash": {"source": source_item[1], "target": target_item[1]}})
+            source_item, target_item = await _advance(source_hashes), await _advance(target_hashes)
+
+
+async def diff_manifests(source_cmd: List[str], target_cmd: List[str],
+                         hash_algorithm: Optional[str] = None) -> ManifestDiff:
+    """Run both manifest commands and diff their output as it streams in"""
+    diff = ManifestDiff(hash_algorithm=hash_algorithm)
+    processes = []
+    try:
+        for cmd in (source_cmd, target_cmd):
+            processes.append(await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            ))
+        source, target = (ManifestStream(process) for process in processes)
+        stderr_tasks = [asyncio.create_task(process.stderr.read()) for process in processes]
+
+        await _diff_entries(source, target, diff)
+        if hash_algorithm:
+            await _diff_hashes(source, target, diff)
+
+        for side, process, stderr_task in zip(("source", "target"), processes, stderr_tasks):
+            returncode = await process.wait()
+            stderr = (await stderr_task).decode(errors='replace').strip()
+            # Unreadable files fail the hash section, and the verification with it
+            if returncode != 0:
+                diff.error = f"{side} manifest failed (exit {returncode}): {stderr[-2000:]}"
+            elif stderr:
+                logger.warning(f"{side} manifest reported: {stderr[-2000:]}")
+    except Exception as e:
+        diff.error = str(e)
+    finally:
+        for process in processes:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    return diff
@@ -0,0 +1,337 @@
+"""
+Hash tree comparison for TransDock.
+
+Each side hashes its files once and builds a tree of directory digests on
+its own host: a directory's digest is the hash of its children's names and
+digests (file content hashes and subdirectory digests), so two directories
+with equal digests hold identical files. The hosts then only send digests
+on request. The root digests are compared first and the comparison only
+descends, one level per round trip, into directories whose digests differ,
+so an unchanged tree costs one exchange and a changed one yields the exact
+files to re-sync without listing the rest.
+
+Only directories that contain files take part; empty directories and file
+metadata are not compared (see ``manifest`` for that).
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .manifest import HASH_PROGRAMS, SourceHost
+from .security_utils import SecurityUtils, SecurityValidationError
+
+logger = logging.getLogger(__name__)
+
+# Paths listed per category in API responses; the counts are always complete
+MAX_LISTED_PATHS = 1000
+
+ROOT_ID = "0"
+
+# $1 is the root directory, $2 the hash program. Builds the tree in a
+# temporary directory, prints "ready<TAB>root digest", then answers batches
+# of directory ids (one per line, ended by an empty line) with one line per
+# child: "parent<TAB>d<TAB>id<TAB>digest<TAB>name" or
+# "parent<TAB>f<TAB>hash<TAB>name", and "." after each batch, or "error"
+# when the batch could not be listed. Newlines in names travel as NUL so
+# every record is one line. A batch's ids are written to a file rather than
+# passed to awk as an argument, which the kernel caps at 128 KiB.
+#
+# The tree is built in the background while stdin is watched: the client
+# sends nothing before "ready", so end of input during the build means it
+# went away, and the whole session is stopped. A failed build prints
+# "failed" instead of "ready" and the client then closes its input to
+# collect the exit status. The script must run in its own process group
+# (sshd gives every session one; locally it is started in a new session).
+#
+# nodes holds "D<TAB>id<TAB>parent<TAB>depth<TAB>name" for every directory
+# with files and "F<TAB>parent<TAB>hash<TAB>name" for every file. Digests
+# are computed bottom-up one depth at a time: each directory's listing of
+# child lines is written to l/<id> and all listings of a depth are hashed by
+# a single hash program run.
+MERKLE_SCRIPT = r'''
+cd -- "$1" || exit 2
+tree=$(mktemp -d) || exit 3
+trap 'rm -rf -- "$tree"' EXIT
+trap 'exit 130' INT TERM HUP
+build() {
+find . -xdev -type f -printf '%P\0' | LC_ALL=C sort -z | xargs -0 -r "$2" -z -- > "$tree/hashes" || exit 4
+tr '\n\0' '\0\n' < "$tree/hashes" | LC_ALL=C awk '
+    function dir_id(path,    parent, parent_id) {
+        if (path in ids) return ids[path]
+        parent = parent_path(path)
+        parent_id = dir_id(parent)
+        ids[path] = next_id++
+        depth[path] = depth[parent] + 1
+        print "D\t" ids[path] "\t" parent_id "\t" depth[path] "\t" substr(path, length(parent) + (parent != "") + 1)
+        return ids[path]
+    }
+    function parent_path(path,    i) {
+        i = length(path)
+        while (i > 0 && substr(path, i, 1) != "/") i--
+        return i ? substr(path, 1, i - 1) : ""
+    }
+    BEGIN { ids[""] = 0; depth[""] = 0; next_id = 1 }
+    $0 == "" { next }
+    {
+        sep = index($0, "  ")
+        path = substr($0, sep + 2)
+        dir = parent_path(path)
+        print "F\t" dir_id(dir) "\t" substr($0, 1, sep - 1) "\t" substr(path, length(dir) + (dir != "") + 1)
+    }
+' > "$tree/nodes" || exit 3
+level=$(awk -F '\t' '$1 == "D" && $4 > m { m = $4 } END { print m + 0 }' "$tree/nodes")
+: > "$tree/digests"
+while [ "$level" -ge 0 ]; do
+    rm -rf -- "$tree/l" && mkdir -- "$tree/l" || exit 3
+    LC_ALL=C awk -F '\t' -v level="$level" -v out="$tree/l" '
+        function emit(parent, line) {
+            if (parent != current) {
+                if (current != "") close(out "/" current)
+                current = parent
+            }
+            print line >> (out "/" parent)
+        }
+        BEGIN { depth[0] = 0 }
+        FILENAME == ARGV[1] { digest[$1] = $2; next }
+        $1 == "D" {
+            depth[$2] = $4
+            if ($4 == level + 1) emit($3, "d " digest[$2] " " substr($0, length($1 $2 $3 $4) + 5))
+            next
+        }
+        $1 == "F" && depth[$2] == level { emit($2, "f " $3 " " substr($0, length($1 $2 $3) + 4)) }
+    ' "$tree/digests" "$tree/nodes" || exit 3
+    (cd -- "$tree/l" && find . -type f -printf '%P\0' | xargs -0 -r "$2" --) |
+        awk '{ print $2 "\t" $1 }' >> "$tree/digests" || exit 3
+    level=$((level - 1))
+done
+printf 'ready\t%s\n' "$(awk -F '\t' '$1 == "0" { print $2 }' "$tree/digests")"
+}
+{ (build "$@") || { status=$?; echo failed; exit "$status"; }; } &
+builder=$!
+if ! IFS= read -r id; then
+    kill -0 "$builder" 2>/dev/null && kill -TERM 0
+    wait "$builder"
+    exit $?
+fi
+wait "$builder" || exit $?
+while :; do
+    {
+        while [ -n "$id" ]; do
+            printf '%s\n' "$id"
+            IFS= read -r id || id=
+        done
+    } > "$tree/want" || exit 3
+    [ -s "$tree/want" ] || exit 0
+    LC_ALL=C awk -F '\t' '
+        FILENAME == ARGV[1] { wanted[$1] = 1; next }
+        FILENAME == ARGV[2] { digest[$1] = $2; next }
+        $1 == "D" && ($3 in wanted) { print $3 "\td\t" $2 "\t" digest[$2] "\t" substr($0, length($1 $2 $3 $4) + 5) }
+        $1 == "F" && ($2 in wanted) { print $2 "\tf\t" $3 "\t" substr($0, length($1 $2 $3) + 4) }
+    ' "$tree/want" "$tree/digests" "$tree/nodes" || { echo error; exit 5; }
+    echo .
+    IFS= read -r id || exit 0
+done
+'''
+
+
+@dataclass
+class MerkleNode:
+    """A child of a directory in a hash tree"""
+    kind: str  # "f" or "d"
+    name: str
+    digest: str
+    node_id: Optional[str] = None
+
+
+@dataclass
+class MerkleDiff:
+    """Files that differ between a source and a target tree"""
+    hash_algorithm: str
+    source_digest: Optional[str] = None
+    target_digest: Optional[str] = None
+    directories_compared: int = 0
+    changed: List[str] = field(default_factory=list)
+    # Directories end with "/" and stand for everything beneath them
+    missing: List[str] = field(default_factory=list)
+    extra: List[str] = field(default_factory=list)
+    error: Optional[str] = None
+
+    @property
+    def identical(self) -> bool:
+        return (self.error is None and self.source_digest is not None
+                and self.source_digest == self.target_digest
+                and not self.changed and not self.missing and not self.extra)
+
+    @property
+    def resync_paths(self) -> List[str]:
+        """Source paths to copy again to make the target identical"""
+        return self.changed + self.missing
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize the diff for API responses"""
+        return {
+            "identical": self.identical,
+            "hash_algorithm": self.hash_algorithm,
+            "source_digest": self.source_digest,
+            "target_digest": self.target_digest,
+            "directories_compared": self.directories_compared,
+            "changed_count": len(self.changed),
+            "missing_count": len(self.missing),
+            "extra_count": len(self.extra),
+            "changed": self.changed[:MAX_LISTED_PATHS],
+            "missing": self.missing[:MAX_LISTED_PATHS],
+            "extra": self.extra[:MAX_LISTED_PATHS],
+            "truncated": max(len(self.changed), len(self.missing), len(self.extra)) > MAX_LISTED_PATHS,
+            "error": self.error,
+        }
+
+
+def build_merkle_command(path: str, hash_algorithm: str = "sha256",
+                         host: SourceHost = (None, "root", 22)) -> List[str]:
+    """Command building and serving the hash tree of path, on a remote host when one is given"""
+    path = SecurityUtils.sanitize_path(path, allow_absolute=True)
+    if hash_algorithm not in HASH_PROGRAMS:
+        raise SecurityValidationError(f"Unsupported hash algorithm: {hash_algorithm}")
+
+    args = ["sh", "-c", MERKLE_SCRIPT, "merkle", path, HASH_PROGRAMS[hash_algorithm]]
+    hostname, ssh_user, ssh_port = host
+    if not hostname:
+        return args
+    return SecurityUtils.build_ssh_command(
+        hostname, ssh_user, ssh_port,
+        " ".join(SecurityUtils.escape_shell_argument(arg) for arg in args))
+
+
+class MerkleTree:
+    """A hash tree built by one host, queried a level at a time"""
+
+    def __init__(self, cmd: List[str]):
+        self.cmd = cmd
+        self.root_digest: Optional[str] = None
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+
+    async def build(self):
+        """Start the process and wait until its tree is ready"""
+        self._process = await asyncio.create_subprocess_exec(
+            *self.cmd,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        self._stderr_task = asyncio.create_task(self._process.stderr.read())
+        line = await self._process.stdout.readline()
+        if not line.startswith(b"ready\t"):
+            # The script waits on stdin until told the client is gone
+            self._process.stdin.close()
+            await self._fail("building the hash tree")
+        self.root_digest = line.rstrip(b"\n").split(b"\t", 1)[1].decode()
+
+    async def children(self, node_ids: List[str]) -> Dict[str, List[MerkleNode]]:
+        """The children of each of the given directories"""
+        self._process.stdin.write("".join(f"{node_id}\n" for node_id in node_ids).encode() + b"\n")
+        await self._process.stdin.drain()
+
+        children: Dict[str, List[MerkleNode]] = {}
+        while True:
+            line = await self._process.stdout.readline()
+            if not line:
+                await self._fail("listing directories")
+            line = line.rstrip(b"\n")
+            if line == b".":
+                return children
+            if line == b"error":
+                await self._fail("listing directories")
+            parent, kind, rest = line.split(b"\t", 2)
+            if kind == b"d":
+                node_id, digest, name = rest.split(b"\t", 2)
+            else:
+                digest, name = rest.split(b"\t", 1)
+                node_id = None
+            children.setdefault(parent.decode(), []).append(MerkleNode(
+                kind=kind.decode(),
+                name=name.replace(b"\0", b"\n").decode(errors='replace'),
+                digest=digest.decode(),
+                node_id=node_id.decode() if node_id else None
+            ))
+
+    async def _fail(self, action: str):
+        returncode = await self._process.wait()
+        stderr = (await self._stderr_task).decode(errors='replace').strip()
+        raise RuntimeError(f"Failed {action} (exit {returncode}): {stderr[-2000:]}")
+
+    async def close(self):
+        """End the session; the host removes its tree on exit"""
+        if self._process is None:
+            return
+        if self._process.returncode is None:
+            try:
+                self._process.stdin.close()
+                await asyncio.wait_for(self._process.wait(), timeout=30)
+            except (BrokenPipeError, ConnectionResetError, asyncio.TimeoutError):
+                pass
+        if self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        if self._stderr_task:
+            await self._stderr_task
+
+
+async def diff_trees(source_cmd: List[str], target_cmd: List[str],
+                     hash_algorithm: str = "sha256") -> MerkleDiff:
+    """Build both trees and descend into the directories whose digests differ"""
+    diff = MerkleDiff(hash_algorithm=hash_algorithm)
+    source, target = MerkleTree(source_cmd), MerkleTree(target_cmd)
+    builds = [asyncio.create_task(source.build()), asyncio.create_task(target.build())]
+    try:
+        # A failed build stops the other one rather than waiting for its whole tree
+        await asyncio.wait(builds, return_when=asyncio.FIRST_EXCEPTION)
+        for build in builds:
+            if build.done() and build.exception():
+                raise build.exception()
+        diff.source_digest, diff.target_digest = source.root_digest, target.root_digest
+
+        # (relative path with trailing "/", source id, target id) of differing directories
+        pending: List[Tuple[str, str, str]] = []
+        if source.root_digest != target.root_digest:
+            pending.append(("", ROOT_ID, ROOT_ID))
+        while pending:
+            source_children, target_children = await asyncio.gather(
+                source.children([source_id for _, source_id, _ in pending]),
+                target.children([target_id for _, _, target_id in pending]))
+            next_level = []
+            for prefix, source_id, target_id in pending:
+                diff.directories_compared += 1
+                found = len(diff.changed) + len(diff.missing) + len(diff.extra) + len(next_level)
+                source_nodes = {(node.kind, node.name): node for node in source_children.get(source_id, [])}
+                target_nodes = {(node.kind, node.name): node for node in target_children.get(target_id, [])}
+                for kind, name in sorted(source_nodes.keys() | target_nodes.keys(), key=lambda key: key[1]):
+                    path = prefix + name + ("/" if kind == "d" else "")
+                    source_node, target_node = source_nodes.get((kind, name)), target_nodes.get((kind, name))
+                    if source_node and target_node:
+                        if source_node.digest == target_node.digest:
+                            continue
+                        if kind == "d":
+                            next_level.append((path, source_node.node_id, target_node.node_id))
+                        else:
+                            diff.changed.append(path)
+                    elif source_node:
+                        diff.missing.append(path)
+                    else:
+                        diff.extra.append(path)
+                if len(diff.changed) + len(diff.missing) + len(diff.extra) + len(next_level) == found:
+                    # Equal listings hash to equal digests; one side answered incompletely
+                    raise RuntimeError(f"Directory /{prefix} differs but its listings do not")
+            pending = next_level
+    except Exception as e:
+        diff.error = str(e)
+    finally:
+        for build in builds:
+            build.cancel()
+        await asyncio.gather(*builds, return_exceptions=True)
+        await asyncio.gather(source.close(), target.close())
+
+    return diff
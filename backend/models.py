@@ -6,7 +6,11 @@ from .utils import format_bytes
 
 class TransferMethod(str, Enum):
     ZFS_SEND = "zfs_send"
+    ZFS_INCREMENTAL = "zfs_incremental"
     RSYNC = "rsync"
+    RSYNC_ZFS_DIFF = "rsync_zfs_diff"
+    TAR_STREAM = "tar_stream"
+    LOCAL_COPY = "local_copy"
 
 
 class IdentifierType(str, Enum):
@@ -152,6 +156,9 @@ class ContainerMigrationRequest(BaseModel):
     ssh_user: str = Field(default="root", description="SSH username for target machine")
     ssh_port: int = Field(default=22, description="SSH port for target machine")
     force_rsync: bool = Field(default=False, description="Force rsync even if target has ZFS")
+    warm_migration: bool = Field(default=True, description="Pre-copy volumes with rsync before stopping containers")
+    transfer_weight: float = Field(default=1.0, gt=0, description="Share of the bandwidth budget relative to other transfers")
+    transfer_priority: int = Field(default=0, ge=-3, le=3, description="Bandwidth priority; each step multiplies the weight by 4")
 
 
 class MigrationRequest(BaseModel):
@@ -239,6 +246,20 @@ class MigrationStatus(BaseModel):
     # Container-specific information
     containers: Optional[List[Dict[str, Any]]] = None
     networks: Optional[List[Dict[str, Any]]] = None
+    # Live transfer engine metrics keyed by volume/dataset
+    transfer_metrics: Optional[Dict[str, Dict[str, Any]]] = None
+    # Negotiated zfs send flags keyed by volume
+    send_flags: Optional[Dict[str, List[str]]] = None
+    # End-to-end zfs send stream digests keyed by volume, one per replication pass
+    stream_digests: Optional[Dict[str, List[Dict[str, Any]]]] = None
+    # Per-volume transfer state keyed by volume source path
+    volume_progress: Optional[Dict[str, Dict[str, Any]]] = None
+    # Per-volume transfer decisions (compression, method) and their reasoning
+    transfer_plan: Optional[Dict[str, Dict[str, Any]]] = None
+    # Window during which the migrated containers are not running anywhere
+    downtime_started_at: Optional[str] = None
+    downtime_ended_at: Optional[str] = None
+    downtime_seconds: Optional[float] = None
 
 
 class MigrationResponse(BaseModel):
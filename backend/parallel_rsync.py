@@ -0,0 +1,290 @@
+"""
+Sharded parallel rsync for TransDock.
+
+A single rsync process checksums and compresses on one core, which cannot
+saturate a fast link on trees with millions of files. This module splits the
+source tree into size-balanced shards and runs one rsync per shard into the
+same target, each fed its file list through ``--files-from``. Failed shards
+are retried on their own, and a final delete-only pass removes files that no
+longer exist on the source.
+"""
+
+import asyncio
+import heapq
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from .bandwidth import get_bandwidth_allocator
+from .config import get_config
+from .rsync_progress import RSYNC_PROGRESS_ARGS, RsyncProgress, RsyncProgressCallback, run_rsync
+from .security_utils import SecurityUtils, SecurityValidationError, RsyncConfig
+
+logger = logging.getLogger(__name__)
+
+# rsync exit code for "some source files vanished before they could be
+# transferred", expected when copying a tree that is still in use
+RSYNC_VANISHED_FILES = 24
+
+SourceHost = Tuple[Optional[str], str, int]
+
+
+@dataclass
+class RsyncShard:
+    """A subset of top-level entries transferred by one rsync process"""
+    index: int
+    paths: List[str] = field(default_factory=list)
+    size_bytes: int = 0
+    state: str = "pending"
+    attempts: int = 0
+    error: Optional[str] = None
+    bytes_transferred: int = 0
+    instantaneous_bps: float = 0.0
+    changed_files: Optional[int] = None
+    changed_bytes: Optional[int] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "index": self.index,
+            "entries": len(self.paths),
+            "size_bytes": self.size_bytes,
+            "bytes_transferred": self.bytes_transferred,
+            "state": self.state,
+            "attempts": self.attempts,
+            "error": self.error,
+        }
+
+
+def plan_shards(entries: Dict[str, int], shard_count: int) -> List[RsyncShard]:
+    """Distribute entries over shards, largest first onto the lightest shard"""
+    shards = [RsyncShard(index=i) for i in range(max(1, shard_count))]
+    heap = [(0, shard.index) for shard in shards]
+    for path, size in sorted(entries.items(), key=lambda item: item[1], reverse=True):
+        load, index = heapq.heappop(heap)
+        shards[index].paths.append(path)
+        shards[index].size_bytes += size
+        heapq.heappush(heap, (load + size, index))
+    return [shard for shard in shards if shard.paths]
+
+
+class ShardedRsync:
+    """Runs one rsync per shard of a source tree, in parallel"""
+
+    def __init__(self, shard_count: Optional[int] = None, retries: Optional[int] = None,
+                 min_size_bytes: Optional[int] = None):
+        migration_config = get_config().migration
+        self.shard_count = shard_count or migration_config.rsync_parallel_shards
+        self.retries = retries if retries is not None else migration_config.rsync_shard_retries
+        self.min_size_bytes = min_size_bytes if min_size_bytes is not None \
+            else migration_config.rsync_shard_min_size_mb * 1024 * 1024
+
+    async def plan(self, source_path: str,
+                   source: SourceHost = (None, "root", 22)) -> Optional[List[RsyncShard]]:
+        """Split a tree into shards, or return None when it is not worth sharding"""
+        if self.shard_count < 2:
+            return None
+
+        sizes = await self._measure_tree(source_path, source)
+        if not sizes:
+            return None
+
+        top_level = {path: size for path, size in sizes.items() if '/' not in path}
+        total = sum(top_level.values())
+        if total < self.min_size_bytes or len(sizes) < 2:
+            return None
+
+        # Directories bigger than a fair share are split into their children
+        # so one huge directory cannot serialize the whole transfer
+        fair_share = total / self.shard_count
+        units: Dict[str, int] = {}
+        for path, size in top_level.items():
+            children = {child: child_size for child, child_size in sizes.items()
+                        if child.startswith(f"{path}/")}
+            if size > fair_share and children:
+                units.update(children)
+            else:
+                units[path] = size
+
+        shards = plan_shards(units, self.shard_count)
+        if len(shards) < 2:
+            return None
+
+        logger.info(
+            f"Sharded {source_path} ({total} bytes, {len(units)} entries) into {len(shards)} rsync shards")
+        return shards
+
+    async def run(self, shards: List[RsyncShard], source_path: str, target_host: str, target_path: str,
+                  ssh_user: str = "root", ssh_port: int = 22, source: SourceHost = (None, "root", 22),
+                  progress_callback: Optional[RsyncProgressCallback] = None,
+                  extra_args: Optional[List[str]] = None) -> bool:
+        """Transfer all shards in parallel, then sweep deletions"""
+        async def publish():
+            if progress_callback:
+                try:
+                    await progress_callback(self._merge_progress(shards))
+                except Exception as e:
+                    logger.warning(f"Shard progress callback failed: {e}")
+
+        async def run_shard(shard: RsyncShard) -> bool:
+            file_list = b"".join(path.encode() + b"\0" for path in shard.paths)
+
+            async def track(progress: RsyncProgress):
+                shard.bytes_transferred = progress.bytes_transferred
+                shard.instantaneous_bps = progress.instantaneous_bps
+                shard.changed_files = progress.changed_files
+                shard.changed_bytes = progress.changed_bytes
+                await publish()
+
+            while shard.attempts <= self.retries:
+                shard.attempts += 1
+                shard.state = "running"
+                await publish()
+                returncode, stderr = await self._run_rsync(
+                    lease.rsync_args(len(shards)),
+                    source_path, target_host, target_path, ssh_user, ssh_port, source,
+                    ["-r", "--from0", "--files-from=-", *(extra_args or [])], file_list, track
+                )
+                shard.instantaneous_bps = 0.0
+                if returncode in (0, RSYNC_VANISHED_FILES):
+                    shard.state = "completed"
+                    shard.error = None
+                    await publish()
+                    return True
+                shard.error = stderr.strip()[-500:]
+                logger.warning(
+                    f"rsync shard {shard.index} of {source_path} failed "
+                    f"(attempt {shard.attempts}/{self.retries + 1}): {shard.error}")
+            shard.state = "failed"
+            await publish()
+            return False
+
+        # One lease for the whole tree, its rate split evenly over the shards,
+        # so a sharded volume weighs the same as any other transfer
+        async with get_bandwidth_allocator().lease(target_host, fixed=True) as lease:
+            results = await asyncio.gather(*(run_shard(shard) for shard in shards))
+            if not all(results):
+                failed = [str(shard.index) for shard in shards if shard.state == "failed"]
+                logger.error(f"rsync shards {', '.join(failed)} of {source_path} failed")
+                return False
+
+            # Shards only delete inside the entries they own; a delete-only pass
+            # catches top-level entries removed from the source
+            returncode, stderr = await self._run_rsync(
+                lease.rsync_args(),
+                source_path, target_host, target_path, ssh_user, ssh_port, source,
+                ["--delete", "--existing", "--ignore-existing"]
+            )
+        if returncode not in (0, RSYNC_VANISHED_FILES):
+            logger.error(f"rsync deletion sweep of {target_path} failed: {stderr}")
+            return False
+        return True
+
+    @staticmethod
+    def _merge_progress(shards: List[RsyncShard]) -> RsyncProgress:
+        """Combine shard progress into one whole-transfer view"""
+        total = sum(shard.size_bytes for shard in shards)
+        # A retried shard restarts its byte count, and compression or skipped
+        # files make rsync's count drift from du's, so clamp to the shard size
+        done = sum(shard.size_bytes if shard.state == "completed"
+                   else min(shard.bytes_transferred, shard.size_bytes) for shard in shards)
+        rate = sum(shard.instantaneous_bps for shard in shards if shard.state == "running")
+        summarized = all(shard.changed_bytes is not None for shard in shards)
+        return RsyncProgress(
+            bytes_transferred=done,
+            estimated_total_bytes=total,
+            rsync_percent=int(done / total * 100) if total else 100,
+            instantaneous_bps=rate,
+            eta_seconds=round((total - done) / rate, 1) if rate > 0 else None,
+            changed_files=sum(shard.changed_files or 0 for shard in shards) if summarized else None,
+            changed_bytes=sum(shard.changed_bytes for shard in shards) if summarized else None,
+            shards=[shard.to_dict() for shard in shards],
+        )
+
+    async def _measure_tree(self, source_path: str, source: SourceHost) -> Dict[str, int]:
+        """Apparent sizes of entries up to two levels below the source path"""
+        source_host, source_ssh_user, source_ssh_port = source
+        if source_host:
+            cmd = SecurityUtils.build_ssh_command(
+                source_host, source_ssh_user, source_ssh_port,
+                f"du -0 -a -b -x -d 2 {SecurityUtils.escape_shell_argument(source_path)}")
+        else:
+            cmd = ["du", "-0", "-a", "-b", "-x", "-d", "2", source_path]
+
+        returncode, stdout, stderr = await self._exec(cmd)
+        # du exits 1 when some entries are unreadable but still reports the rest
+        if returncode not in (0, 1) or not stdout:
+            logger.warning(f"Failed to measure {source_path} for sharding: {stderr.decode(errors='replace')}")
+            return {}
+
+        prefix = source_path.rstrip('/') + '/'
+        sizes = {}
+        for record in stdout.split(b"\0"):
+            size, _, path = record.decode(errors='surrogateescape').partition('\t')
+            if path.startswith(prefix) and size.isdigit():
+                sizes[path[len(prefix):]] = int(size)
+        return sizes
+
+    async def _run_rsync(self, bwlimit_args: List[str], source_path: str, target_host: str,
+                         target_path: str, ssh_user: str, ssh_port: int, source: SourceHost,
+                         extra_args: List[str], stdin_data: Optional[bytes] = None,
+                         progress_callback: Optional[RsyncProgressCallback] = None) -> Tuple[int, str]:
+        """Run one rsync, locally or on the source host"""
+        try:
+            cmd = build_rsync_argv(source_path, target_host, target_path, ssh_user, ssh_port,
+                                   [*extra_args, *RSYNC_PROGRESS_ARGS, *bwlimit_args], source)
+        except SecurityValidationError as e:
+            return 1, str(e)
+        return await run_rsync(cmd, progress_callback, stdin_data)
+
+    @staticmethod
+    async def _exec(cmd: List[str]) -> Tuple[int, bytes, bytes]:
+        """Run a command, capturing its output"""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            stdout, stderr = await process.communicate()
+            returncode = process.returncode if process.returncode is not None else 1
+            return returncode, stdout, stderr
+        except Exception as e:
+            logger.error(f"Command failed: {' '.join(cmd)} - {e}")
+            return 1, b"", str(e).encode()
+
+
+def build_rsync_argv(source_path: str, target_host: str, target_path: str,
+                     ssh_user: str = "root", ssh_port: int = 22,
+                     extra_args: Optional[List[str]] = None,
+                     source: SourceHost = (None, "root", 22),
+                     delete: bool = True) -> List[str]:
+    """Build an rsync argv that copies source_path/ into target_host:target_path/.
+
+    With a remote source the rsync runs on the source host over ssh and
+    pushes straight to the target. ``delete`` adds ``--delete``.
+    """
+    source_host, source_ssh_user, source_ssh_port = source
+    extra_args = list(extra_args or [])
+    if not source_host:
+        return SecurityUtils.build_rsync_command(RsyncConfig(
+            source=f"{source_path.rstrip('/')}/",
+            hostname=target_host,
+            username=ssh_user,
+            port=ssh_port,
+            target=f"{target_path.rstrip('/')}/",
+            additional_args=extra_args,
+            delete=delete
+        ))
+
+    SecurityUtils.validate_hostname(target_host)
+    SecurityUtils.validate_username(ssh_user)
+    SecurityUtils.validate_port(ssh_port)
+    if delete and "--delete" not in extra_args:
+        extra_args.append("--delete")
+    rsync_cmd = " ".join([
+        "rsync", "-avzP", *extra_args,
+        "-e", SecurityUtils.escape_shell_argument(f"ssh -p {ssh_port}"),
+        SecurityUtils.escape_shell_argument(f"{source_path.rstrip('/')}/"),
+        SecurityUtils.escape_shell_argument(f"{ssh_user}@{target_host}:{target_path.rstrip('/')}/"),
+    ])
+    return SecurityUtils.build_ssh_command(source_host, source_ssh_user, source_ssh_port, rsync_cmd)
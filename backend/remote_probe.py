@@ -0,0 +1,102 @@
+"""
+Batched read-only probes for TransDock.
+
+Discovering what a host offers takes many small commands (tool versions,
+pools, which candidate directories exist, free space under each), and
+running each over its own SSH session made a capability check cost a dozen
+or more round trips. A ``ProbeBatch`` composes them into one ``sh`` script
+run in a single remote command. Each probe runs in its own subshell with
+stdin and stderr detached, and its output is followed by a marker line
+carrying a random boundary, the probe's name and its exit status, so
+arbitrary probe output cannot be mistaken for the framing.
+"""
+
+import re
+import secrets
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Tuple
+
+from .security_utils import SecurityUtils
+
+PROBE_NAME = re.compile(r'^[A-Za-z0-9_.:-]+$')
+
+# (exit code, stdout, stderr) of a remote command
+CommandRunner = Callable[[str], Awaitable[Tuple[int, str, str]]]
+
+
+@dataclass
+class ProbeResult:
+    """Output of one probe"""
+    name: str
+    returncode: int
+    stdout: str
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+    @property
+    def lines(self) -> List[str]:
+        return [line.strip() for line in self.stdout.split('\n') if line.strip()]
+
+
+def glob_words(path: str) -> str:
+    """Shell words for a path whose ``*`` expand as globs and everything else is quoted"""
+    return "*".join(SecurityUtils.escape_shell_argument(part) if part else "" for part in path.split("*"))
+
+
+def parse_probe_output(stdout: str, boundary: str) -> Dict[str, ProbeResult]:
+    """Split batch output into the results of the probes that finished"""
+    results = {}
+    marker = boundary + " "
+    buffer: List[str] = []
+    for line in stdout.split("\n"):
+        if not line.startswith(marker):
+            buffer.append(line)
+            continue
+        fields = line[len(marker):].split(" ")
+        if len(fields) == 2 and fields[1].isdigit():
+            # The newline printed before the marker ends the last buffered line
+            results[fields[0]] = ProbeResult(name=fields[0], returncode=int(fields[1]),
+                                             stdout="\n".join(buffer))
+        buffer = []
+    return results
+
+
+class ProbeBatch:
+    """Read-only commands run together in one remote invocation"""
+
+    def __init__(self):
+        self._probes: List[Tuple[str, str]] = []
+
+    def add(self, name: str, command: str) -> "ProbeBatch":
+        """Add a probe; command is a shell command line, name must be unique"""
+        if not PROBE_NAME.match(name) or any(existing == name for existing, _ in self._probes):
+            raise ValueError(f"Invalid or duplicate probe name: {name}")
+        self._probes.append((name, command))
+        return self
+
+    def __len__(self) -> int:
+        return len(self._probes)
+
+    def script(self, boundary: str) -> str:
+        """The sh script running every probe and framing its output"""
+        return "\n".join(
+            f"( {command}\n) </dev/null 2>/dev/null; printf '\\n%s %s %s\\n' '{boundary}' '{name}' \"$?\""
+            for name, command in self._probes
+        )
+
+    async def run(self, runner: CommandRunner) -> Dict[str, ProbeResult]:
+        """Run the batch through runner; probes missing from the result did not finish.
+
+        Raises RuntimeError when no probe finished, as when the host is unreachable.
+        """
+        if not self._probes:
+            return {}
+        boundary = f"transdock-probe-{secrets.token_hex(8)}"
+        command = "sh -c " + SecurityUtils.escape_shell_argument(self.script(boundary))
+        returncode, stdout, stderr = await runner(command)
+        results = parse_probe_output(stdout, boundary)
+        if not results:
+            raise RuntimeError(f"Remote probe failed (exit {returncode}): {stderr.strip()[-2000:]}")
+        return results
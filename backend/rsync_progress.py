@@ -0,0 +1,235 @@
+"""
+Live rsync progress for TransDock.
+
+rsync is run with ``--info=progress2`` so it reports one whole-transfer
+progress line (bytes, percent, rate, ETA) instead of a line per file. Its
+stdout is parsed incrementally as it arrives, so nothing but the current
+partial line is held in memory no matter how large the tree is.
+"""
+
+import asyncio
+import logging
+import re
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .utils import format_bytes
+
+logger = logging.getLogger(__name__)
+
+# Whole-transfer progress instead of per-file progress, and no file names
+# from -v, so stdout stays a trickle of progress lines. --stats adds a short
+# summary at exit reporting how much data actually changed.
+RSYNC_PROGRESS_ARGS = ["--info=progress2,name0", "--stats"]
+
+# Partial lines longer than this are not progress output and are dropped
+MAX_LINE_LENGTH = 4096
+
+# Keep only the tail of stderr for error reporting
+MAX_STDERR_BYTES = 64 * 1024
+
+PROGRESS_LINE = re.compile(
+    r'^\s*(?P<bytes>[\d,.]+)\s+(?P<percent>\d+)%\s+'
+    r'(?P<rate>[\d,.]+)(?P<unit>[kMGT]?B)/s\s+(?P<time>\d+:\d{2}:\d{2})'
+    r'(?:\s+\(xfr#(?P<xfr>\d+),\s+(?:ir|to)-chk=(?P<remaining>\d+)/(?P<total>\d+)\))?'
+)
+
+STATS_LINES = {
+    "changed_files": re.compile(r'^Number of regular files transferred:\s*(?P<value>[\d,.]+)'),
+    "changed_bytes": re.compile(r'^Total transferred file size:\s*(?P<value>[\d,.]+)'),
+}
+
+RATE_UNITS = {"B": 1, "kB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3, "TB": 1024 ** 4}
+
+
+@dataclass
+class RsyncProgress:
+    """Whole-transfer progress of an rsync run"""
+    bytes_transferred: int = 0
+    estimated_total_bytes: Optional[int] = None
+    rsync_percent: int = 0
+    instantaneous_bps: float = 0.0
+    eta_seconds: Optional[float] = None
+    files_transferred: int = 0
+    files_remaining: Optional[int] = None
+    files_total: Optional[int] = None
+    # From --stats, only known once rsync exits
+    changed_files: Optional[int] = None
+    changed_bytes: Optional[int] = None
+    shards: Optional[List[Dict[str, Any]]] = None
+
+    @property
+    def percent_complete(self) -> float:
+        # rsync's own percentage is relative to the files it has scanned so
+        # far, so a known total size gives the more honest figure
+        if self.estimated_total_bytes:
+            return min(100.0, self.bytes_transferred / self.estimated_total_bytes * 100)
+        return float(self.rsync_percent)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize progress for status reporting"""
+        data = {
+            "bytes_transferred": self.bytes_transferred,
+            "bytes_transferred_human": format_bytes(self.bytes_transferred),
+            "estimated_total_bytes": self.estimated_total_bytes,
+            "percent_complete": round(self.percent_complete, 1),
+            "instantaneous_bps": round(self.instantaneous_bps, 1),
+            "rate_human": f"{format_bytes(int(self.instantaneous_bps))}/s",
+            "eta_seconds": self.eta_seconds,
+            "files_transferred": self.files_transferred,
+            "files_remaining": self.files_remaining,
+            "files_total": self.files_total,
+            "changed_files": self.changed_files,
+            "changed_bytes": self.changed_bytes,
+        }
+        if self.shards is not None:
+            data["shards"] = self.shards
+        return data
+
+
+RsyncProgressCallback = Callable[[RsyncProgress], Awaitable[None]]
+
+
+def _parse_number(value: str) -> int:
+    return int(value.replace(',', '').replace('.', ''))
+
+
+def parse_progress_line(line: str) -> Optional[RsyncProgress]:
+    """Parse one --info=progress2 line, or return None for any other output"""
+    match = PROGRESS_LINE.match(line)
+    if not match:
+        return None
+
+    hours, minutes, seconds = (int(part) for part in match.group("time").split(':'))
+    rate = float(match.group("rate").replace(',', '')) * RATE_UNITS.get(match.group("unit"), 1)
+    progress = RsyncProgress(
+        bytes_transferred=_parse_number(match.group("bytes")),
+        rsync_percent=int(match.group("percent")),
+        instantaneous_bps=rate,
+        eta_seconds=float(hours * 3600 + minutes * 60 + seconds),
+    )
+    if match.group("xfr"):
+        progress.files_transferred = int(match.group("xfr"))
+        progress.files_remaining = int(match.group("remaining"))
+        progress.files_total = int(match.group("total"))
+    return progress
+
+
+class RsyncProgressParser:
+    """Incremental parser for rsync's progress output.
+
+    rsync rewrites its progress line with carriage returns, so both ``\\r`` and
+    ``\\n`` end a record. Only the unfinished tail of the stream is buffered.
+    """
+
+    def __init__(self):
+        self._partial = b""
+        self.latest: Optional[RsyncProgress] = None
+
+    def feed(self, data: bytes) -> Optional[RsyncProgress]:
+        """Consume a chunk of stdout, returning the newest progress it contained"""
+        records = (self._partial + data).replace(b'\r', b'\n').split(b'\n')
+        self._partial = records.pop()
+        if len(self._partial) > MAX_LINE_LENGTH:
+            self._partial = b""
+
+        newest = None
+        for record in records:
+            line = record.decode(errors='replace')
+            progress = parse_progress_line(line)
+            if progress:
+                newest = progress
+                self.latest = progress
+            else:
+                self._parse_stats_line(line)
+        return newest
+
+    def _parse_stats_line(self, line: str):
+        """Pick the change summary out of --stats output"""
+        for attribute, pattern in STATS_LINES.items():
+            match = pattern.match(line)
+            if match:
+                if self.latest is None:
+                    self.latest = RsyncProgress()
+                setattr(self.latest, attribute, _parse_number(match.group("value")))
+
+    def finish(self) -> Optional[RsyncProgress]:
+        """Parse whatever is left once stdout closes"""
+        if self._partial:
+            self.feed(b"\n")
+        return self.latest
+
+
+async def run_rsync(cmd: List[str], progress_callback: Optional[RsyncProgressCallback] = None,
+                    stdin_data: Optional[bytes] = None) -> Tuple[int, str]:
+    """Run an rsync command, streaming its progress to a callback.
+
+    Returns the exit code and the tail of stderr.
+    """
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if stdin_data is not None else asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+    except Exception as e:
+        logger.error(f"Command failed: {' '.join(cmd)} - {e}")
+        return 1, str(e)
+
+    async def feed_stdin():
+        try:
+            process.stdin.write(stdin_data)
+            await process.stdin.drain()
+            process.stdin.close()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    async def read_stderr() -> bytes:
+        tail = b""
+        while True:
+            chunk = await process.stderr.read(65536)
+            if not chunk:
+                return tail
+            tail = (tail + chunk)[-MAX_STDERR_BYTES:]
+
+    async def read_progress():
+        parser = RsyncProgressParser()
+        while True:
+            chunk = await process.stdout.read(65536)
+            if not chunk:
+                break
+            progress = parser.feed(chunk)
+            if progress and progress_callback:
+                await _notify(progress_callback, progress)
+        progress = parser.finish()
+        if progress and progress_callback:
+            await _notify(progress_callback, progress)
+
+    stdin_task = asyncio.create_task(feed_stdin()) if stdin_data is not None else None
+    stderr_task = asyncio.create_task(read_stderr())
+    try:
+        await read_progress()
+        if stdin_task:
+            await stdin_task
+        stderr = await stderr_task
+        returncode = await process.wait()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+        raise
+    finally:
+        for task in (stdin_task, stderr_task):
+            if task and not task.done():
+                task.cancel()
+
+    return returncode, stderr.decode(errors='replace')
+
+
+async def _notify(progress_callback: RsyncProgressCallback, progress: RsyncProgress):
+    """Invoke the progress callback, never letting it break the transfer"""
+    try:
+        await progress_callback(progress)
+    except Exception as e:
+        logger.warning(f"Rsync progress callback failed: {e}")
@@ -7,6 +7,8 @@ from dataclasses import dataclass
 from typing import List, Optional, Tuple
 from urllib.parse import unquote
 
+from .ssh_pool import get_ssh_pool
+
 
 class SecurityValidationError(Exception):
     """Exception raised when security validation fails."""
@@ -22,6 +24,8 @@ class RsyncConfig:
     port: int
     target: str
     additional_args: Optional[List[str]] = None
+    # Off for file-list transfers, where --delete would remove unlisted siblings
+    delete: bool = True
 
 
 class SecurityUtils:
@@ -31,6 +35,10 @@ class SecurityUtils:
     HOSTNAME_PATTERN = re.compile(r'^[a-zA-Z0-9.-]+$')
     USERNAME_PATTERN = re.compile(r'^[a-zA-Z0-9._-]+$')
     DATASET_NAME_PATTERN = re.compile(r'^[a-zA-Z0-9/_. -]+$')
+    # "<version>-<checksum>-<length>-<hex nvlist>", as printed by zfs get
+    RESUME_TOKEN_PATTERN = re.compile(r'^[0-9a-f]+(-[0-9a-f]+){3}$')
+    # Tokens grow with the names in the stream; well under any ARG_MAX
+    MAX_RESUME_TOKEN_LENGTH = 65536
 
     @staticmethod
     def validate_hostname(hostname: str) -> str:
@@ -91,6 +99,23 @@ class SecurityUtils:
 
         return name
 
+    @staticmethod
+    def validate_zfs_resume_token(token: str) -> str:
+        """Validate a receive_resume_token for ``zfs send -t``.
+
+        Tokens routinely exceed the generic 512 character argument limit, so
+        they are checked against their own format instead.
+        """
+        if not token or len(token) > SecurityUtils.MAX_RESUME_TOKEN_LENGTH:
+            raise SecurityValidationError(
+                f"Invalid resume token length: {len(token or '')}")
+
+        if not SecurityUtils.RESUME_TOKEN_PATTERN.match(token):
+            raise SecurityValidationError(
+                f"Invalid resume token format: {token[:50]}...")
+
+        return token
+
     @staticmethod
     def sanitize_path(
             path: str,
@@ -212,17 +237,27 @@ class SecurityUtils:
             hostname: str,
             username: str,
             port: int,
-            remote_command: str) -> List[str]:
-        """Build a secure SSH command with proper escaping."""
+            remote_command: str,
+            multiplex: bool = True) -> List[str]:
+        """Build a secure SSH command with proper escaping.
+
+        The command shares the pooled connection to the host unless multiplex
+        is False, as for an ssh that runs on another host.
+        """
         # Validate inputs
         hostname = SecurityUtils.validate_hostname(hostname)
         username = SecurityUtils.validate_username(username)
         port = SecurityUtils.validate_port(port)
 
+        pool_options = []
+        if multiplex:
+            pool_options = get_ssh_pool().ssh_options(hostname, username, port)
+
         # Build command - remote command should NOT be escaped as single argument
         # SSH handles the remote command directly
         return [
             "ssh",
+            *pool_options,
             "-p", str(port),
             f"{username}@{hostname}",
             remote_command
@@ -246,7 +281,7 @@ class SecurityUtils:
             cmd.extend(config.additional_args)
 
         # Add --delete if not already present in additional_args
-        if not has_delete_flag:
+        if config.delete and not has_delete_flag:
             cmd.append("--delete")
 
         # Add SSH specification
@@ -272,7 +307,8 @@ class SecurityUtils:
             'receive',
             'clone',
             'set',
-                'get']:
+            'get',
+                'diff']:
             raise SecurityValidationError(f"Invalid ZFS command: {command}")
 
         validated_args = ["zfs", command]
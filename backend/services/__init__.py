@@ -14,6 +14,10 @@ from .snapshot_service import SnapshotService
 from .system_info_service import SystemInfoService
 from .container_migration_service import ContainerMigrationService
 from .compose_stack_service import ComposeStackService
+from .replication_service import ReplicationService
+from .delta_sync_service import DeltaSyncService, DatasetDelta
+from .transfer_planner import TransferPlanner, VolumeTransferPlan
+from .volume_transfer_pool import VolumeTransferPool, get_volume_transfer_pool
 
 __all__ = [
     "MigrationOrchestrator",
@@ -21,5 +25,12 @@ __all__ = [
     "SnapshotService",
     "SystemInfoService", 
     "ContainerMigrationService",
-    "ComposeStackService"
+    "ComposeStackService",
+    "ReplicationService",
+    "DeltaSyncService",
+    "DatasetDelta",
+    "TransferPlanner",
+    "VolumeTransferPlan",
+    "VolumeTransferPool",
+    "get_volume_transfer_pool"
 ]
\ No newline at end of file
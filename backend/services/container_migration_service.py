@@ -1,6 +1,7 @@
 import asyncio
+import functools
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from ..models import (
     ContainerMigrationRequest, MigrationStatus, VolumeMount, 
     TransferMethod, HostInfo, IdentifierType
@@ -12,8 +13,17 @@ from ..zfs_operations.services.snapshot_service import SnapshotService as NewSna
 
 from ..transfer_ops import TransferOperations
 from ..host_service import HostService
-from .migration_orchestrator import MigrationOrchestrator
+from ..config import get_config
+from ..bandwidth import set_transfer_class
+from ..compression_planner import CompressionPlanner, CompressionDecision
+from .migration_orchestrator import MigrationOrchestrator, PhaseProgressReporter
 from .container_discovery_service import ContainerDiscoveryService
+from .replication_service import ReplicationService
+from .delta_sync_service import DatasetDelta, DeltaSyncService
+from .transfer_planner import TransferPlanner, VolumeTransferPlan, is_local_host
+from .volume_transfer_pool import (
+    VolumeTransferJob, VolumeTransferResult, get_volume_transfer_pool
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +42,10 @@ class ContainerMigrationService:
         self.host_service = host_service
         self.orchestrator = orchestrator
         self.discovery_service = discovery_service
+        self.replication_service = ReplicationService(transfer_ops, host_service)
+        self.transfer_planner = TransferPlanner(transfer_ops, host_service, self.replication_service)
+        self.delta_sync_service = DeltaSyncService(transfer_ops, self.replication_service)
+        self.transfer_pool = get_volume_transfer_pool()
         self._service_factory = create_default_service_factory()
         self._dataset_service = None
         self._snapshot_service = None
@@ -68,6 +82,174 @@ class ContainerMigrationService:
             # This shouldn't happen, but just in case there's an issue with the callback itself
             logger.error(f"Error in migration completion handler for {migration_id}: {e}")
     
+    async def _run_volume_transfers(self, migration_id: str, phase: str, jobs: List[VolumeTransferJob],
+                                    reporter: Optional[PhaseProgressReporter] = None):
+        """Run volume transfers through the shared pool, failing on the first error"""
+        async def _record(result: VolumeTransferResult):
+            await self.orchestrator.update_volume_progress(
+                migration_id, result.key, {**result.to_dict(), "phase": phase}
+            )
+
+        results = await self.transfer_pool.run(jobs, on_update=_record)
+        if reporter:
+            await reporter.flush()
+        failed = [result for result in results.values() if result.state == "failed"]
+        if failed:
+            raise Exception("Volume transfer failed: " + "; ".join(
+                f"{result.key}: {result.error}" for result in failed
+            ))
+    
+    @staticmethod
+    def _volume_target_path(request: ContainerMigrationRequest, volume: VolumeMount) -> str:
+        """Target path a volume is copied to"""
+        return f"{request.target_base_path}/{volume.source.split('/')[-1]}"
+    
+    async def _plan_compression(self, migration_id: str, request: ContainerMigrationRequest,
+                                volumes: List[VolumeMount]) -> Dict[str, CompressionDecision]:
+        """Choose compression for each volume copied with rsync or tar from a sample of its data"""
+        if not volumes or not get_config().migration.adaptive_compression:
+            return {}
+        
+        await self.orchestrator.update_status(
+            migration_id, "planning", 12, f"Sampling {len(volumes)} volumes to choose compression"
+        )
+        planner = CompressionPlanner()
+        decisions = {}
+        for volume in volumes:
+            decision = await planner.plan(
+                volume.source, request.target_host, request.ssh_user, request.ssh_port
+            )
+            decisions[volume.source] = decision
+            await self.orchestrator.update_transfer_plan(migration_id, volume.source, decision.to_dict())
+            logger.info(f"Compression for {volume.source}: {decision.reason}")
+        return decisions
+    
+    async def _file_transfer_job(self, request: ContainerMigrationRequest, volume: VolumeMount,
+                                 progress_callback,
+                                 compression: Optional[CompressionDecision] = None,
+                                 delta: Optional[DatasetDelta] = None,
+                                 plan: Optional[VolumeTransferPlan] = None) -> VolumeTransferJob:
+        """Build the transfer job for a volume without a ZFS path: a local copy, rsync or a tar stream.
+        
+        With a delta that has a base snapshot, the first pass copies that snapshot,
+        so the target matches the base of the first zfs diff exactly; later passes
+        copy only what zfs diff reports.
+        """
+        target_path = self._volume_target_path(request, volume)
+        if delta and delta.snapshots and delta.passes:
+            run = functools.partial(
+                self.delta_sync_service.sync, delta, request.target_host, target_path,
+                request.ssh_user, request.ssh_port,
+                progress_callback=progress_callback, compression=compression
+            )
+            return VolumeTransferJob(key=volume.source, host=request.target_host,
+                                     method=TransferMethod.RSYNC_ZFS_DIFF.value, run=run)
+        method = await self.transfer_planner.file_transfer_method(request, volume, plan)
+        # Copies from a source path given last: the volume, or the mounted base snapshot
+        if method == TransferMethod.LOCAL_COPY:
+            copy = functools.partial(
+                self.transfer_ops.transfer_via_local_copy,
+                target_path=target_path, progress_callback=progress_callback
+            )
+        elif method == TransferMethod.TAR_STREAM:
+            copy = functools.partial(
+                self.transfer_ops.transfer_via_tar_stream,
+                target_host=request.target_host, target_path=target_path,
+                ssh_user=request.ssh_user, ssh_port=request.ssh_port,
+                progress_callback=progress_callback,
+                codec=(compression.tar_stream_codec or "") if compression else None
+            )
+        else:
+            copy = functools.partial(
+                self.transfer_ops.transfer_via_rsync,
+                target_host=request.target_host, target_path=target_path,
+                ssh_user=request.ssh_user, ssh_port=request.ssh_port,
+                progress_callback=progress_callback,
+                compression=compression
+            )
+        if delta and delta.snapshots:
+            run = functools.partial(self.delta_sync_service.seed, delta, copy)
+        else:
+            run = functools.partial(copy, volume.source)
+        return VolumeTransferJob(key=volume.source, host=request.target_host, method=method.value, run=run)
+    
+    async def _warm_rsync_precopy(self, migration_id: str, request: ContainerMigrationRequest,
+                                  volumes: List[VolumeMount],
+                                  compression_plans: Dict[str, CompressionDecision],
+                                  deltas: Dict[str, DatasetDelta],
+                                  transfer_plans: Dict[str, VolumeTransferPlan]):
+        """Copy volumes while the containers run, repeating delta passes until they converge.
+        
+        A volume converges once a pass changes less than the configured threshold;
+        the final pass after the containers stop then only has to move that much.
+        Volumes in deltas are snapshotted before the first pass, so later passes
+        copy only what zfs diff reports.
+        """
+        migration_config = get_config().migration
+        max_passes = max(1, migration_config.rsync_warm_max_passes)
+        converge_bytes = migration_config.rsync_warm_converge_mb * 1024 * 1024
+        
+        pending = list(volumes)
+        for pass_number in range(1, max_passes + 1):
+            pass_message = (
+                f"Pre-copying {len(pending)} volumes while containers run "
+                f"(pass {pass_number}/{max_passes})"
+            )
+            pass_start = 20 + 5 * (pass_number - 1) // max_passes
+            await self.orchestrator.update_status(migration_id, "pre-copying", pass_start, pass_message)
+            reporter = self.orchestrator.phase_progress_reporter(
+                migration_id, "pre-copying", pass_message,
+                pass_start, 20 + 5 * pass_number // max_passes, [volume.source for volume in pending]
+            )
+            
+            last_progress = {}
+            
+            def track(volume_source: str):
+                publish = reporter.callback(volume_source)
+                
+                async def _update(progress):
+                    last_progress[volume_source] = progress
+                    await publish(progress)
+                return _update
+            
+            if pass_number == 1:
+                for volume_source, delta in list(deltas.items()):
+                    if not await self.delta_sync_service.mark(delta):
+                        del deltas[volume_source]
+            
+            # The first pass into an empty target may be a tar stream, and copies
+            # the base snapshot of volumes with a delta; later delta passes are rsync
+            await self._run_volume_transfers(migration_id, f"pre-copy pass {pass_number}", [
+                await self._file_transfer_job(
+                    request, volume, track(volume.source), compression_plans.get(volume.source),
+                    deltas.get(volume.source), transfer_plans.get(volume.source)
+                )
+                for volume in pending
+            ], reporter)
+            
+            still_changing = []
+            for volume in pending:
+                progress = last_progress.get(volume.source)
+                # Only rsync reports how much changed; a tar stream pass never converges
+                delta = getattr(progress, "changed_bytes", None)
+                converged = delta is not None and delta <= converge_bytes
+                await self.orchestrator.update_volume_progress(migration_id, volume.source, {
+                    "pre_copy_passes": pass_number,
+                    "last_delta_bytes": delta,
+                    "converged": converged,
+                })
+                if not converged:
+                    still_changing.append(volume)
+            
+            pending = still_changing
+            if not pending:
+                logger.info(f"Migration {migration_id}: pre-copy converged after {pass_number} passes")
+                return
+        
+        logger.info(
+            f"Migration {migration_id}: {len(pending)} volumes still changing after {max_passes} "
+            f"pre-copy passes, the final pass will copy the rest")
+    
     async def start_container_migration(self, request: ContainerMigrationRequest) -> str:
         """Start a container-based migration"""
         migration_id = self.orchestrator.create_migration_id()
@@ -153,6 +335,8 @@ class ContainerMigrationService:
                                          containers: List[ContainerInfo], volumes: List[VolumeMount],
                                          networks: List[Dict[str, Any]]):
         """Execute the complete container migration process"""
+        # Every transfer started from this task inherits the migration's bandwidth class
+        set_transfer_class(request.transfer_weight, request.transfer_priority)
         try:
             # Step 1: Validate target host and storage
             await self.orchestrator.update_status(migration_id, "validating", 10, "Validating target host and storage")
@@ -187,9 +371,68 @@ class ContainerMigrationService:
                 error_messages = [f"{location}: {result.error_message}" for location, result in failed_validations.items()]
                 raise Exception(f"Storage validation failed: {'; '.join(error_messages)}")
 
-            # Step 2: Stop containers - only if not a file-based discovery
+            # Step 2: Replicate ZFS-backed volumes while the containers keep running.
+            # Only volumes the planner resolved to a dataset on both ends qualify;
+            # the rest are copied file by file after stop.
+            await self.orchestrator.update_status(migration_id, "planning", 11, "Choosing transfer methods")
+            transfer_plans = await self.transfer_planner.plan(request, volumes)
+            replications = {}
+            for plan in transfer_plans.values():
+                await self.orchestrator.update_transfer_plan(migration_id, plan.volume_source, plan.to_dict())
+                if plan.replication:
+                    replications[plan.volume_source] = plan.replication
+                    await self.orchestrator.update_send_flags(
+                        migration_id, plan.volume_source, plan.replication.send_flags
+                    )
+
+            rsync_volumes = [volume for volume in volumes if volume.source not in replications]
+            compression_plans = await self._plan_compression(migration_id, request, [
+                volume for volume in rsync_volumes
+                if transfer_plans[volume.source].method != TransferMethod.LOCAL_COPY
+            ])
+
+            if replications:
+                pre_stop_passes = max(1, get_config().migration.zfs_replication_passes)
+                for pass_number in range(1, pre_stop_passes + 1):
+                    pass_message = (
+                        f"Replicating {len(replications)} ZFS datasets while containers run "
+                        f"(pass {pass_number}/{pre_stop_passes})"
+                    )
+                    pass_start = 15 + 5 * (pass_number - 1) // pre_stop_passes
+                    await self.orchestrator.update_status(migration_id, "replicating", pass_start, pass_message)
+                    reporter = self.orchestrator.phase_progress_reporter(
+                        migration_id, "replicating", pass_message,
+                        pass_start, 15 + 5 * pass_number // pre_stop_passes, list(replications)
+                    )
+                    await self._run_volume_transfers(migration_id, f"pre-copy pass {pass_number}", [
+                        VolumeTransferJob(
+                            key=replication.volume_source,
+                            host=request.target_host,
+                            method=transfer_plans[replication.volume_source].method.value,
+                            run=functools.partial(
+                                self.replication_service.replicate, replication, target_host_info,
+                                reporter.callback(replication.volume_source)
+                            )
+                        )
+                        for replication in replications.values()
+                    ], reporter)
+
+            # Warm rsync pre-copy of the remaining volumes while the containers
+            # run, so the copy after they stop only moves the last delta
+            deltas: Dict[str, DatasetDelta] = {}
+            if rsync_volumes and request.warm_migration and request.identifier_type != IdentifierType.PROJECT:
+                if is_local_host(request.source_host):
+                    deltas = await self.delta_sync_service.plan([
+                        volume for volume in rsync_volumes
+                        if transfer_plans[volume.source].method != TransferMethod.LOCAL_COPY
+                    ])
+                await self._warm_rsync_precopy(
+                    migration_id, request, rsync_volumes, compression_plans, deltas, transfer_plans)
+
+            # Step 3: Stop containers - only if not a file-based discovery
             if request.identifier_type != IdentifierType.PROJECT:
-                await self.orchestrator.update_status(migration_id, "stopping", 20, "Stopping containers")
+                await self.orchestrator.update_status(migration_id, "stopping", 25, "Stopping containers")
+                await self.orchestrator.start_downtime(migration_id)
                 
                 # Stop containers using unified Docker API
                 success = await self.docker_ops.stop_containers(
@@ -199,38 +442,51 @@ class ContainerMigrationService:
                 if not success:
                     raise Exception("Failed to stop containers")
 
-            # Step 3: Create snapshots and migrate data
+            # Step 4: Send final increments and migrate remaining data
             await self.orchestrator.update_status(migration_id, "migrating", 30, "Migrating container data")
             
-            # Determine transfer method - simplified for now
-            # TODO: Implement proper ZFS checking with new service layer
-            target_has_zfs = False  # Disable ZFS for now until proper implementation
-            source_has_zfs = False
-
-            use_zfs = target_has_zfs and source_has_zfs and not request.force_rsync
-            transfer_method = TransferMethod.ZFS_SEND if use_zfs else TransferMethod.RSYNC
+            transfer_method = TransferMethod.ZFS_SEND if replications else TransferMethod.RSYNC
 
             # Create volume mapping and transfer data
             volume_mapping = {}
             snapshots = []
+            transfer_jobs = []
+            reporter = self.orchestrator.phase_progress_reporter(
+                migration_id, "migrating", "Migrating container data", 30, 60,
+                [volume.source for volume in volumes]
+            )
 
             for volume in volumes:
-                target_path = f"{request.target_base_path}/{volume.source.split('/')[-1]}"
+                target_path = self._volume_target_path(request, volume)
                 volume_mapping[volume.source] = target_path
 
-                if use_zfs:
-                    # ZFS migration - TODO: Implement with new service layer
-                    raise Exception("ZFS migration not yet implemented with new service layer")
+                replication = replications.get(volume.source)
+                if replication:
+                    # Final increment: only what changed since the last pre-stop pass
+                    transfer_jobs.append(VolumeTransferJob(
+                        key=volume.source,
+                        host=request.target_host,
+                        method=TransferMethod.ZFS_INCREMENTAL.value,
+                        run=functools.partial(
+                            self.replication_service.replicate, replication, target_host_info,
+                            reporter.callback(volume.source)
+                        )
+                    ))
                 else:
-                    # Rsync migration
-                    success = await self.transfer_ops.transfer_via_rsync(
-                        volume.source, request.target_host, target_path,
-                        request.ssh_user, request.ssh_port
-                    )
-                    if not success:
-                        raise Exception(f"Failed to rsync data for {volume.source}")
+                    # Rsync or tar stream migration
+                    transfer_jobs.append(await self._file_transfer_job(
+                        request, volume, reporter.callback(volume.source),
+                        compression_plans.get(volume.source), deltas.get(volume.source),
+                        transfer_plans.get(volume.source)
+                    ))
 
-            # Step 4: Pull images on target
+            await self._run_volume_transfers(migration_id, "final", transfer_jobs, reporter)
+            for replication in replications.values():
+                snapshots.extend(replication.snapshots)
+            for delta in deltas.values():
+                snapshots.extend(delta.snapshots)
+
+            # Step 5: Pull images on target
             await self.orchestrator.update_status(migration_id, "preparing", 60, "Pulling container images on target")
             
             unique_images = list(set(container.image for container in containers))
@@ -241,7 +497,7 @@ class ContainerMigrationService:
                 if not success:
                     logger.warning(f"Failed to pull image {image}, container creation may fail")
 
-            # Step 5: Create networks on target
+            # Step 6: Create networks on target
             await self.orchestrator.update_status(migration_id, "networks", 70, "Creating networks on target")
             
             for network_dict in networks:
@@ -253,7 +509,7 @@ class ContainerMigrationService:
                 if not success:
                     logger.warning(f"Failed to create network {network_info.name}")
 
-            # Step 6: Recreate containers on target
+            # Step 7: Recreate containers on target
             await self.orchestrator.update_status(migration_id, "recreating", 80, "Recreating containers on target")
             
             success = await self.docker_ops.recreate_containers_on_target(
@@ -263,7 +519,7 @@ class ContainerMigrationService:
             if not success:
                 raise Exception("Failed to recreate containers on target")
 
-            # Step 7: Connect containers to additional networks
+            # Step 8: Connect containers to additional networks
             await self.orchestrator.update_status(migration_id, "connecting", 90, "Connecting containers to networks")
             
             for container in containers:
@@ -275,7 +531,9 @@ class ContainerMigrationService:
                     if not success:
                         logger.warning(f"Failed to connect {container.name} to additional networks")
 
-            # Step 8: Complete migration
+            await self.orchestrator.end_downtime(migration_id)
+
+            # Step 9: Complete migration
             await self.orchestrator.update_status(migration_id, "completed", 100, "Container migration completed successfully")
 
             # Update migration status with final information
@@ -284,9 +542,15 @@ class ContainerMigrationService:
                 migration_status.transfer_method = transfer_method
                 migration_status.volume_mapping = volume_mapping
                 migration_status.snapshots = snapshots
+                migration_status.stream_digests = {
+                    replication.volume_source: replication.stream_digests
+                    for replication in replications.values() if replication.stream_digests
+                } or None
 
             logger.info(f"Container migration {migration_id} completed successfully")
 
         except Exception as e:
+            # A failure after the containers stopped must not leave the downtime window open
+            await self.orchestrator.end_downtime(migration_id)
             await self.orchestrator.update_error(migration_id, str(e))
             logger.exception(f"Container migration {migration_id} failed")
\ No newline at end of file
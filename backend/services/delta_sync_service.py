@@ -0,0 +1,128 @@
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from ..compression_planner import CompressionDecision
+from ..config import get_config
+from ..models import VolumeMount
+from ..rsync_progress import RsyncProgressCallback
+from ..transfer_ops import TransferOperations
+from ..zfs_operations.factories.service_factory import create_default_service_factory
+from ..zfs_operations.services.snapshot_service import SnapshotService as NewSnapshotService
+from ..zfs_operations.core.value_objects.dataset_name import DatasetName
+from .replication_service import ReplicationService
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DatasetDelta:
+    """zfs diff state for a volume copied file by file from a local dataset"""
+    volume_source: str
+    source_dataset: str
+    snapshots: List[str] = field(default_factory=list)
+    passes: int = 0
+
+
+class DeltaSyncService:
+    """Rsync delta passes driven by zfs diff.
+
+    Volumes that are dataset mountpoints on the local source but cannot be
+    replicated with zfs send are still copied with rsync. The dataset is
+    snapshotted before the first full pass, which copies that snapshot rather
+    than the live tree: a file created and deleted again between two
+    snapshots never shows up in zfs diff, so the target must start out
+    exactly at the first snapshot. Every later pass snapshots the dataset
+    again and copies only what zfs diff reports between the two snapshots,
+    so a delta costs time in proportion to the changes, not the tree.
+    """
+
+    def __init__(self, transfer_ops: TransferOperations, replication_service: ReplicationService):
+        self.transfer_ops = transfer_ops
+        self.replication_service = replication_service
+        self._service_factory = create_default_service_factory()
+        self._snapshot_service = None
+        self._snapshot_prefix = f"transdock_{datetime.now().strftime('%Y%m%d_%H%M%S')}_delta"
+
+    async def _get_snapshot_service(self) -> NewSnapshotService:
+        """Get the snapshot service instance"""
+        if self._snapshot_service is None:
+            self._snapshot_service = await self._service_factory.create_snapshot_service()
+        return self._snapshot_service
+
+    async def plan(self, volumes: List[VolumeMount]) -> Dict[str, DatasetDelta]:
+        """Find volumes that are mountpoints of local datasets"""
+        if not volumes or not get_config().migration.rsync_zfs_diff:
+            return {}
+
+        source_mounts = await self.replication_service._list_mountpoints()
+        deltas = {}
+        for volume in volumes:
+            source_dataset = source_mounts.get(volume.source.rstrip('/'))
+            if source_dataset:
+                deltas[volume.source] = DatasetDelta(volume_source=volume.source, source_dataset=source_dataset)
+
+        if deltas:
+            logger.info(f"Delta passes for {len(deltas)} of {len(volumes)} rsync volumes will use zfs diff")
+        return deltas
+
+    async def mark(self, delta: DatasetDelta) -> bool:
+        """Snapshot the dataset as the base the full pass copies and the next delta diffs from"""
+        return await self._create_snapshot(delta) is not None
+
+    async def seed(self, delta: DatasetDelta, copy: Callable[[str], Awaitable[bool]]) -> bool:
+        """Run the first full pass, copy(source_path), from the mounted base snapshot"""
+        base = delta.snapshots[0]
+        mount_point = await self.transfer_ops.mount_snapshot_for_rsync(base)
+        if not mount_point:
+            return False
+        try:
+            success = await copy(mount_point)
+        finally:
+            await self.transfer_ops.cleanup_rsync_mount(mount_point, base)
+        if success:
+            delta.passes += 1
+        return success
+
+    async def sync(self, delta: DatasetDelta, target_host: str, target_path: str,
+                   ssh_user: str = "root", ssh_port: int = 22,
+                   progress_callback: Optional[RsyncProgressCallback] = None,
+                   compression: Optional[CompressionDecision] = None) -> bool:
+        """Snapshot the dataset and copy what changed since the last synced snapshot"""
+        base = delta.snapshots[-1]
+        snapshot_name = await self._create_snapshot(delta)
+        if not snapshot_name:
+            return False
+
+        success = await self.transfer_ops.transfer_via_zfs_diff(
+            base, snapshot_name, delta.volume_source.rstrip('/'), target_host, target_path,
+            ssh_user, ssh_port, progress_callback=progress_callback, compression=compression
+        )
+        if success:
+            delta.passes += 1
+        else:
+            # A retry must diff from the last snapshot the target is known to match
+            await self._destroy_snapshot(delta, snapshot_name)
+        return success
+
+    async def _create_snapshot(self, delta: DatasetDelta) -> Optional[str]:
+        snapshot_service = await self._get_snapshot_service()
+        new_snapshot = f"{self._snapshot_prefix}{len(delta.snapshots) + 1}"
+        result = await snapshot_service.create_snapshot(DatasetName.from_string(delta.source_dataset), new_snapshot)
+        if not result.is_success:
+            logger.error(f"Failed to snapshot {delta.source_dataset}: {result.error}")
+            return None
+
+        full_name = f"{delta.source_dataset}@{new_snapshot}"
+        delta.snapshots.append(full_name)
+        return full_name
+
+    async def _destroy_snapshot(self, delta: DatasetDelta, full_name: str):
+        snapshot_service = await self._get_snapshot_service()
+        result = await snapshot_service.destroy_snapshot(
+            DatasetName.from_string(delta.source_dataset), full_name.split('@', 1)[1])
+        if not result.is_success:
+            logger.warning(f"Failed to destroy snapshot {full_name}: {result.error}")
+            return
+        delta.snapshots.remove(full_name)
@@ -1,8 +1,11 @@
 import asyncio
+import time
 import uuid
+from datetime import datetime, timezone
 import logging
-from typing import Dict, List, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional
 from ..models import MigrationStatus
+from ..utils import format_bytes
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +48,85 @@ class MigrationOrchestrator:
                 self.active_migrations[migration_id].error = error
                 logger.error(f"Migration {migration_id} failed: {error}")
     
+    async def update_transfer_metrics(self, migration_id: str, transfer_key: str, metrics: Dict[str, Any]):
+        """Record live transfer engine metrics for one transfer of a migration"""
+        async with self._migration_lock:
+            if migration_id in self.active_migrations:
+                migration = self.active_migrations[migration_id]
+                if migration.transfer_metrics is None:
+                    migration.transfer_metrics = {}
+                migration.transfer_metrics[transfer_key] = metrics
+    
+    async def update_volume_progress(self, migration_id: str, volume: str, progress: Dict[str, Any]):
+        """Record the transfer state of one volume of a migration"""
+        async with self._migration_lock:
+            if migration_id in self.active_migrations:
+                migration = self.active_migrations[migration_id]
+                if migration.volume_progress is None:
+                    migration.volume_progress = {}
+                migration.volume_progress.setdefault(volume, {}).update(progress)
+    
+    async def update_transfer_plan(self, migration_id: str, volume: str, plan: Dict[str, Any]):
+        """Record transfer decisions for one volume of a migration"""
+        async with self._migration_lock:
+            if migration_id in self.active_migrations:
+                migration = self.active_migrations[migration_id]
+                if migration.transfer_plan is None:
+                    migration.transfer_plan = {}
+                migration.transfer_plan.setdefault(volume, {}).update(plan)
+    
+    async def update_send_flags(self, migration_id: str, transfer_key: str, send_flags: List[str]):
+        """Record the zfs send flags chosen for one transfer of a migration"""
+        async with self._migration_lock:
+            if migration_id in self.active_migrations:
+                migration = self.active_migrations[migration_id]
+                if migration.send_flags is None:
+                    migration.send_flags = {}
+                migration.send_flags[transfer_key] = list(send_flags)
+    
+    async def start_downtime(self, migration_id: str):
+        """Mark the moment a migration's containers stop serving"""
+        async with self._migration_lock:
+            if migration_id in self.active_migrations:
+                migration = self.active_migrations[migration_id]
+                migration.downtime_started_at = datetime.now(timezone.utc).isoformat()
+                migration.downtime_ended_at = None
+                migration.downtime_seconds = None
+    
+    async def end_downtime(self, migration_id: str):
+        """Mark the moment a migration's containers serve again and record the downtime, once"""
+        async with self._migration_lock:
+            if migration_id in self.active_migrations:
+                migration = self.active_migrations[migration_id]
+                if not migration.downtime_started_at or migration.downtime_ended_at:
+                    return
+                ended_at = datetime.now(timezone.utc)
+                started_at = datetime.fromisoformat(migration.downtime_started_at)
+                migration.downtime_ended_at = ended_at.isoformat()
+                migration.downtime_seconds = round((ended_at - started_at).total_seconds(), 1)
+                logger.info(f"Migration {migration_id}: downtime {migration.downtime_seconds}s")
+    
+    def phase_progress_reporter(self, migration_id: str, status: str, message: str,
+                                start_progress: int, end_progress: int,
+                                transfer_keys: List[str]) -> "PhaseProgressReporter":
+        """Build a reporter that maps transfer progress onto a range of overall progress"""
+        return PhaseProgressReporter(
+            self, migration_id, status, message, start_progress, end_progress, transfer_keys
+        )
+    
+    async def emit_progress(self, migration_id: str, status: str, progress: int, message: str):
+        """Broadcast migration progress to WebSocket clients, if the broadcaster is running"""
+        try:
+            # Imported lazily: the API layer depends on the services, not the reverse
+            from ..api.websocket import emit_migration_progress, event_broadcaster
+        except Exception as e:
+            logger.debug(f"WebSocket events unavailable: {e}")
+            return
+        if not event_broadcaster.running:
+            # Without the worker nothing drains the event queue
+            return
+        await emit_migration_progress(migration_id, progress, status, message)
+    
     async def register_migration(self, migration_id: str, status: MigrationStatus):
         """Register a new migration"""
         async with self._migration_lock:
@@ -95,4 +177,81 @@ class MigrationOrchestrator:
                 "running": running,
                 "completed": completed,
                 "failed": failed
-            }
\ No newline at end of file
+            }
+
+class PhaseProgressReporter:
+    """Publishes the progress of a set of concurrent transfers as overall migration progress.
+
+    Transfers report many times a second; updates are coalesced so the status
+    lock and WebSocket clients see at most one update per interval.
+    """
+    
+    def __init__(self, orchestrator: MigrationOrchestrator, migration_id: str, status: str, message: str,
+                 start_progress: int, end_progress: int, transfer_keys: List[str], interval: float = 1.0):
+        self.orchestrator = orchestrator
+        self.migration_id = migration_id
+        self.status = status
+        self.message = message
+        self.start_progress = start_progress
+        self.end_progress = end_progress
+        self.transfer_keys = list(transfer_keys)
+        self.interval = interval
+        self._latest: Dict[str, Any] = {}
+        self._changed: set = set()
+        self._last_publish = 0.0
+        self._publish_lock = asyncio.Lock()
+    
+    def callback(self, transfer_key: str) -> Callable[[Any], Awaitable[None]]:
+        """Progress callback for one transfer; accepts TransferMetrics or RsyncProgress"""
+        async def _update(progress: Any):
+            self._latest[transfer_key] = progress
+            self._changed.add(transfer_key)
+            await self._publish()
+        return _update
+    
+    async def flush(self):
+        """Publish any pending update regardless of the interval"""
+        await self._publish(force=True)
+    
+    async def _publish(self, force: bool = False):
+        if not force and (self._publish_lock.locked() or
+                          time.monotonic() - self._last_publish < self.interval):
+            return
+        async with self._publish_lock:
+            self._last_publish = time.monotonic()
+            changed, self._changed = self._changed, set()
+            for transfer_key in changed:
+                await self.orchestrator.update_transfer_metrics(
+                    self.migration_id, transfer_key, self._latest[transfer_key].to_dict()
+                )
+            
+            progress = self._overall_progress()
+            message = self._describe()
+            await self.orchestrator.update_status(self.migration_id, self.status, progress, message)
+            await self.orchestrator.emit_progress(self.migration_id, self.status, progress, message)
+    
+    def _overall_progress(self) -> int:
+        """Mean completion of all transfers, scaled into this phase's range"""
+        if not self.transfer_keys:
+            return self.end_progress
+        total = 0.0
+        for transfer_key in self.transfer_keys:
+            progress = self._latest.get(transfer_key)
+            if progress is None:
+                continue
+            if getattr(progress, "finished_at", None) is not None:
+                total += 100.0
+            else:
+                total += progress.percent_complete or 0.0
+        fraction = total / (100.0 * len(self.transfer_keys))
+        return int(self.start_progress + (self.end_progress - self.start_progress) * fraction)
+    
+    def _describe(self) -> str:
+        """Human readable summary of bytes moved, rate and ETA"""
+        transferred = sum(p.bytes_transferred for p in self._latest.values())
+        rate = sum(p.instantaneous_bps for p in self._latest.values())
+        etas = [p.eta_seconds for p in self._latest.values() if p.eta_seconds is not None]
+        message = f"{self.message}: {format_bytes(transferred)} transferred at {format_bytes(int(rate))}/s"
+        if etas:
+            message += f", ETA {int(max(etas))}s"
+        return message
@@ -0,0 +1,232 @@
+import logging
+import os
+import shlex
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..models import VolumeMount, HostInfo
+from ..security_utils import SecurityUtils, SecurityValidationError
+from ..transfer_engine import ProgressCallback
+from ..transfer_ops import TransferOperations
+from ..host_service import HostService
+from ..zfs_operations.factories.service_factory import create_default_service_factory
+from ..zfs_operations.services.snapshot_service import SnapshotService as NewSnapshotService
+from ..zfs_operations.core.value_objects.dataset_name import DatasetName
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DatasetReplication:
+    """Replication state for a volume backed by a ZFS dataset on both ends"""
+    volume_source: str
+    source_dataset: str
+    target_dataset: str
+    send_flags: List[str] = field(default_factory=list)
+    snapshots: List[str] = field(default_factory=list)
+    passes: int = 0
+    bytes_sent: int = 0
+    # End-to-end digests of the streams sent, one per verified pass
+    stream_digests: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class ReplicationService:
+    """Multi-pass ZFS replication: a full send followed by incremental sends.
+
+    Each pass snapshots the source dataset and sends only what changed since the
+    newest snapshot (or bookmark) the target already has, so the final pass run
+    after the containers stop is small.
+    """
+
+    def __init__(self, transfer_ops: TransferOperations, host_service: HostService):
+        self.transfer_ops = transfer_ops
+        self.host_service = host_service
+        self._service_factory = create_default_service_factory()
+        self._snapshot_service = None
+        self._snapshot_prefix = f"transdock_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+
+    async def _get_snapshot_service(self) -> NewSnapshotService:
+        """Get the snapshot service instance"""
+        if self._snapshot_service is None:
+            self._snapshot_service = await self._service_factory.create_snapshot_service()
+        return self._snapshot_service
+
+    async def plan_replications(self, volumes: List[VolumeMount], target_host_info: HostInfo,
+                                target_base_path: str) -> Dict[str, DatasetReplication]:
+        """Find volumes that are dataset mountpoints locally and can land in a dataset on the target"""
+        source_mounts = await self._list_mountpoints()
+        target_mounts = await self._list_mountpoints(target_host_info)
+
+        target_parent = target_mounts.get(target_base_path.rstrip('/'))
+        if not target_parent:
+            logger.info(f"{target_host_info.hostname}:{target_base_path} is not a ZFS dataset, "
+                        f"volumes will be transferred with rsync")
+            return {}
+
+        replications = {}
+        for volume in volumes:
+            source_dataset = source_mounts.get(volume.source.rstrip('/'))
+            if not source_dataset:
+                continue
+            target_dataset = f"{target_parent}/{os.path.basename(volume.source.rstrip('/'))}"
+            try:
+                SecurityUtils.validate_dataset_name(source_dataset)
+                SecurityUtils.validate_dataset_name(target_dataset)
+            except SecurityValidationError as e:
+                logger.warning(f"Skipping ZFS replication for {volume.source}: {e}")
+                continue
+            send_flags = await self.transfer_ops.negotiate_send_flags(
+                source_dataset, target_host_info.hostname, target_dataset,
+                target_host_info.ssh_user, target_host_info.ssh_port
+            )
+            replications[volume.source] = DatasetReplication(
+                volume_source=volume.source,
+                source_dataset=source_dataset,
+                target_dataset=target_dataset,
+                send_flags=send_flags
+            )
+            volume.is_dataset = True
+            volume.dataset_path = source_dataset
+
+        logger.info(f"Planned ZFS replication for {len(replications)} of {len(volumes)} volumes")
+        return replications
+
+    async def replicate(self, replication: DatasetReplication, target_host_info: HostInfo,
+                        progress_callback: Optional[ProgressCallback] = None) -> bool:
+        """Run one replication pass: snapshot the source and send the delta to the target"""
+        base = await self.find_common_base(replication, target_host_info)
+        if base is None and await self._dataset_exists(replication.target_dataset, target_host_info) \
+                and not await self.transfer_ops.get_receive_resume_token(
+                    target_host_info.hostname, replication.target_dataset,
+                    target_host_info.ssh_user, target_host_info.ssh_port):
+            # A dataset holding only interrupted receive state is safe to reuse
+            logger.error(
+                f"Target dataset {replication.target_dataset} already exists but shares no "
+                f"snapshot with {replication.source_dataset}; refusing to overwrite it")
+            return False
+
+        snapshot_name = await self._create_pass_snapshot(replication)
+        if not snapshot_name:
+            return False
+
+        pass_start_bytes = replication.bytes_sent
+        last_metrics = []
+
+        async def _track(metrics):
+            replication.bytes_sent = pass_start_bytes + metrics.bytes_transferred
+            last_metrics[:] = [metrics]
+            if progress_callback:
+                await progress_callback(metrics)
+
+        logger.info(
+            f"Replication pass {replication.passes + 1} for {replication.source_dataset}: "
+            f"{'incremental from ' + base if base else 'full send'}")
+        success = await self.transfer_ops.transfer_via_zfs_send(
+            snapshot_name, target_host_info.hostname, replication.target_dataset,
+            target_host_info.ssh_user, target_host_info.ssh_port,
+            progress_callback=_track, incremental_base=base,
+            send_flags=replication.send_flags
+        )
+        if success:
+            replication.passes += 1
+            metrics = last_metrics[0] if last_metrics else None
+            if metrics and metrics.stream_digest_verified:
+                replication.stream_digests.append({
+                    "snapshot": snapshot_name,
+                    "base": base,
+                    "algorithm": metrics.stream_digest_algorithm,
+                    "digest": metrics.stream_digest,
+                    "bytes": metrics.bytes_transferred,
+                    # After a resume the digest covers the final attempt's stream only
+                    "resumed": metrics.resume_count > 0,
+                })
+        return success
+
+    async def find_common_base(self, replication: DatasetReplication,
+                               target_host_info: HostInfo) -> Optional[str]:
+        """Find the newest source snapshot or bookmark whose GUID exists on the target"""
+        target_entries = await self._list_lineage(
+            replication.target_dataset, target_host_info, types="snapshot")
+        if not target_entries:
+            return None
+        target_guids = {guid for _, guid in target_entries}
+
+        source_entries = await self._list_lineage(replication.source_dataset)
+        # Entries come back oldest first; at equal GUIDs prefer the snapshot,
+        # which allows -I, over its bookmark
+        for name, guid in reversed(source_entries):
+            if guid in target_guids and '@' in name:
+                return name
+        for name, guid in reversed(source_entries):
+            if guid in target_guids:
+                return name
+        return None
+
+    async def _create_pass_snapshot(self, replication: DatasetReplication) -> Optional[str]:
+        """Create the snapshot for the next pass, bookmarking the previous one"""
+        snapshot_service = await self._get_snapshot_service()
+        dataset_name = DatasetName.from_string(replication.source_dataset)
+        new_snapshot = f"{self._snapshot_prefix}_pass{len(replication.snapshots) + 1}"
+
+        if replication.snapshots:
+            previous_snapshot = replication.snapshots[-1].split('@', 1)[1]
+            result = await snapshot_service.create_incremental_snapshot(
+                dataset_name, previous_snapshot, new_snapshot)
+        else:
+            result = await snapshot_service.create_snapshot(dataset_name, new_snapshot)
+
+        if not result.is_success:
+            logger.error(f"Failed to snapshot {replication.source_dataset}: {result.error}")
+            return None
+
+        full_name = f"{replication.source_dataset}@{new_snapshot}"
+        replication.snapshots.append(full_name)
+        return full_name
+
+    async def _run_zfs(self, host_info: Optional[HostInfo], *args: str) -> Tuple[int, str, str]:
+        """Run a read-only zfs command locally or on a remote host"""
+        try:
+            cmd = SecurityUtils.validate_zfs_command_args(*args)
+        except SecurityValidationError as e:
+            return 1, "", str(e)
+        if host_info:
+            return await self.host_service.run_remote_command(host_info, " ".join(cmd))
+        return await self.transfer_ops.run_command(shlex.split(" ".join(cmd)))
+
+    async def _list_mountpoints(self, host_info: Optional[HostInfo] = None) -> Dict[str, str]:
+        """Map mountpoints to dataset names"""
+        returncode, stdout, stderr = await self._run_zfs(
+            host_info, "list", "-H", "-t", "filesystem", "-o", "name,mountpoint")
+        if returncode != 0:
+            location = host_info.hostname if host_info else "localhost"
+            logger.info(f"No ZFS datasets available on {location}: {stderr.strip()}")
+            return {}
+
+        mounts = {}
+        for line in stdout.splitlines():
+            parts = line.split('\t')
+            if len(parts) >= 2 and parts[1].startswith('/'):
+                mounts[parts[1].rstrip('/') or '/'] = parts[0]
+        return mounts
+
+    async def _list_lineage(self, dataset: str, host_info: Optional[HostInfo] = None,
+                            types: str = "snapshot,bookmark") -> List[Tuple[str, str]]:
+        """List (name, guid) of a dataset's snapshots and bookmarks, oldest first"""
+        returncode, stdout, _ = await self._run_zfs(
+            host_info, "list", "-H", "-p", "-d", "1", "-t", types,
+            "-o", "name,guid", "-s", "createtxg", dataset)
+        if returncode != 0:
+            return []
+
+        entries = []
+        for line in stdout.splitlines():
+            parts = line.split('\t')
+            if len(parts) >= 2:
+                entries.append((parts[0], parts[1]))
+        return entries
+
+    async def _dataset_exists(self, dataset: str, host_info: Optional[HostInfo] = None) -> bool:
+        """Check whether a dataset exists"""
+        returncode, _, _ = await self._run_zfs(host_info, "list", "-H", "-o", "name", dataset)
+        return returncode == 0
@@ -0,0 +1,184 @@
+import logging
+import socket
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from ..models import ContainerMigrationRequest, HostInfo, TransferMethod, VolumeMount
+from ..tar_stream import FileTreeProfile
+from ..transfer_ops import TransferOperations
+from ..host_service import HostService
+from .replication_service import DatasetReplication, ReplicationService
+
+logger = logging.getLogger(__name__)
+
+LOCAL_HOSTNAMES = {"localhost", "127.0.0.1", "::1"}
+
+# Pool features a send stream needs on the receiving pool whenever they are
+# active on the sending one, whatever the send flags. Features that only matter
+# for particular flags (--raw, --compressed, --large-block) are handled when the
+# flags are negotiated.
+STREAM_FEATURES = ["feature@large_dnode"]
+
+
+def is_local_host(hostname: Optional[str]) -> bool:
+    """Whether hostname refers to the machine TransDock runs on"""
+    if not hostname:
+        return True
+    return hostname in LOCAL_HOSTNAMES or hostname in (socket.gethostname(), socket.getfqdn())
+
+
+@dataclass
+class VolumeTransferPlan:
+    """The transfer method chosen for one volume and why"""
+    volume_source: str
+    method: TransferMethod
+    reason: str
+    replication: Optional[DatasetReplication] = None
+    incremental_base: Optional[str] = None
+    # File count and size of the tree, kept so later passes need not walk it again
+    tree_profile: Optional[FileTreeProfile] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "method": self.method.value,
+            "method_reason": self.reason,
+            "source_dataset": self.replication.source_dataset if self.replication else None,
+            "target_dataset": self.replication.target_dataset if self.replication else None,
+            "incremental_base": self.incremental_base,
+        }
+
+
+class TransferPlanner:
+    """Chooses a transfer method for each volume of a migration.
+
+    Volumes that are dataset mountpoints on a local ZFS source go by zfs send
+    when the target has ZFS, the target base path is a dataset and the target
+    pool can receive the stream; incrementally when the target already holds a
+    common snapshot. Everything else is copied locally when source and target
+    are the same host, otherwise with rsync or a tar stream.
+    """
+
+    def __init__(self, transfer_ops: TransferOperations, host_service: HostService,
+                 replication_service: ReplicationService):
+        self.transfer_ops = transfer_ops
+        self.host_service = host_service
+        self.replication_service = replication_service
+
+    async def plan(self, request: ContainerMigrationRequest,
+                   volumes: List[VolumeMount]) -> Dict[str, VolumeTransferPlan]:
+        """Resolve every volume to a transfer method"""
+        target_host_info = HostInfo(
+            hostname=request.target_host,
+            ssh_user=request.ssh_user,
+            ssh_port=request.ssh_port
+        )
+        plans: Dict[str, VolumeTransferPlan] = {}
+        fallback_reasons: Dict[str, str] = {}
+
+        zfs_reason = await self._zfs_unavailable_reason(request, target_host_info)
+        if zfs_reason:
+            logger.info(f"Not using ZFS replication: {zfs_reason}")
+        else:
+            target_capabilities = await self.host_service.check_host_capabilities(target_host_info)
+            replications = await self.replication_service.plan_replications(
+                volumes, target_host_info, request.target_base_path
+            )
+            for replication in replications.values():
+                incompatibility = await self._pool_incompatibility(
+                    replication, target_host_info, target_capabilities.zfs_pools
+                )
+                if incompatibility:
+                    logger.warning(f"Not replicating {replication.source_dataset}: {incompatibility}")
+                    self._unmark_dataset(volumes, replication.volume_source)
+                    fallback_reasons[replication.volume_source] = incompatibility
+                    continue
+
+                base = await self.replication_service.find_common_base(replication, target_host_info)
+                plans[replication.volume_source] = VolumeTransferPlan(
+                    volume_source=replication.volume_source,
+                    method=TransferMethod.ZFS_INCREMENTAL if base else TransferMethod.ZFS_SEND,
+                    reason=f"target already has {base}" if base else "dataset on both ends",
+                    replication=replication,
+                    incremental_base=base
+                )
+
+        for volume in volumes:
+            if volume.source in plans:
+                continue
+            plan = plans[volume.source] = VolumeTransferPlan(
+                volume_source=volume.source,
+                method=TransferMethod.RSYNC,
+                reason=(fallback_reasons.get(volume.source) or zfs_reason
+                        or "not a ZFS dataset mountpoint on both ends")
+            )
+            plan.method = await self.file_transfer_method(request, volume, plan)
+
+        for plan in plans.values():
+            logger.info(f"Transfer plan for {plan.volume_source}: {plan.method.value} ({plan.reason})")
+        return plans
+
+    async def file_transfer_method(self, request: ContainerMigrationRequest, volume: VolumeMount,
+                                   plan: Optional[VolumeTransferPlan] = None) -> TransferMethod:
+        """Method for a volume copied file by file, re-evaluated before each pass.
+
+        The tree profile is kept in the volume's plan, so the tree is walked at most once.
+        """
+        if is_local_host(request.source_host) and is_local_host(request.target_host):
+            return TransferMethod.LOCAL_COPY
+        target_path = f"{request.target_base_path}/{volume.source.split('/')[-1]}"
+        method, profile = await self.transfer_ops.choose_file_transfer_method(
+            volume.source, request.target_host, target_path, request.ssh_user, request.ssh_port,
+            profile=plan.tree_profile if plan else None
+        )
+        if plan is not None:
+            plan.tree_profile = profile
+        return method
+
+    async def _zfs_unavailable_reason(self, request: ContainerMigrationRequest,
+                                      target_host_info: HostInfo) -> Optional[str]:
+        """Why ZFS replication cannot be used for this migration at all, if it cannot"""
+        if request.force_rsync:
+            return "rsync forced by request"
+        if not is_local_host(request.source_host):
+            return "ZFS replication needs a local source"
+        if is_local_host(request.target_host):
+            return "source and target are the same host"
+
+        returncode, _, _ = await self.transfer_ops.run_command(["zfs", "version"])
+        if returncode != 0:
+            return "ZFS not available on the source"
+
+        target_capabilities = await self.host_service.check_host_capabilities(target_host_info)
+        if not target_capabilities.zfs_available:
+            return f"ZFS not available on {request.target_host}"
+        return None
+
+    async def _pool_incompatibility(self, replication: DatasetReplication, target_host_info: HostInfo,
+                                    target_pools: List[str]) -> Optional[str]:
+        """Why the target pool cannot receive this dataset's stream, if it cannot"""
+        source_pool = replication.source_dataset.split('/')[0]
+        target_pool = replication.target_dataset.split('/')[0]
+        if target_pools and target_pool not in target_pools:
+            return f"pool {target_pool} not found on {target_host_info.hostname}"
+
+        source_features = await self.transfer_ops._get_pool_features(
+            None, source_pool, features=STREAM_FEATURES)
+        target_features = await self.transfer_ops._get_pool_features(
+            target_host_info.hostname, target_pool,
+            target_host_info.ssh_user, target_host_info.ssh_port, features=STREAM_FEATURES)
+        missing = [
+            feature for feature in STREAM_FEATURES
+            if source_features.get(feature) == "active"
+            and target_features.get(feature) not in ("enabled", "active")
+        ]
+        if missing:
+            return f"{target_host_info.hostname}:{target_pool} lacks {', '.join(missing)}"
+        return None
+
+    @staticmethod
+    def _unmark_dataset(volumes: List[VolumeMount], volume_source: str):
+        """Undo plan_replications marking a volume as dataset backed"""
+        for volume in volumes:
+            if volume.source == volume_source:
+                volume.is_dataset = False
+                volume.dataset_path = None
@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from ..config import get_config
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class VolumeTransferJob:
+    """A single volume transfer to run through the pool"""
+    key: str
+    host: str
+    run: Callable[[], Awaitable[bool]]
+    method: str = ""
+
+
+@dataclass
+class VolumeTransferResult:
+    """Outcome of a volume transfer"""
+    key: str
+    state: str
+    method: str = ""
+    error: Optional[str] = None
+    duration_seconds: float = 0.0
+
+    @property
+    def success(self) -> bool:
+        return self.state == "completed"
+
+    def to_dict(self) -> Dict:
+        return {
+            "state": self.state,
+            "method": self.method,
+            "error": self.error,
+            "duration_seconds": round(self.duration_seconds, 1),
+        }
+
+
+VolumeUpdateCallback = Callable[[VolumeTransferResult], Awaitable[None]]
+
+
+class VolumeTransferPool:
+    """Runs volume transfers concurrently under global and per-host limits.
+
+    One pool is shared by all migrations so the limits hold across them. A
+    failed transfer cancels the rest of its batch (fail fast).
+    """
+
+    def __init__(self, max_concurrent: int, max_per_host: int):
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_per_host = max(1, max_per_host)
+        self._global_slots = asyncio.Semaphore(self.max_concurrent)
+        self._host_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def _host_semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._host_slots:
+            self._host_slots[host] = asyncio.Semaphore(self.max_per_host)
+        return self._host_slots[host]
+
+    async def run(self, jobs: List[VolumeTransferJob],
+                  on_update: Optional[VolumeUpdateCallback] = None) -> Dict[str, VolumeTransferResult]:
+        """Run a batch of jobs, returning a result per job key"""
+        results = {job.key: VolumeTransferResult(job.key, "pending", job.method) for job in jobs}
+        for result in results.values():
+            await self._notify(on_update, result)
+
+        tasks = {asyncio.create_task(self._run_job(job, results[job.key], on_update)): job for job in jobs}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if any(not results[tasks[task].key].success for task in done):
+                    break
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        for task in pending:
+            result = results[tasks[task].key]
+            if result.state in ("pending", "running"):
+                result.state = "cancelled"
+                await self._notify(on_update, result)
+
+        failed = [r.key for r in results.values() if r.state == "failed"]
+        if failed:
+            logger.error(f"Volume transfers failed for: {', '.join(failed)}")
+        return results
+
+    async def _run_job(self, job: VolumeTransferJob, result: VolumeTransferResult,
+                       on_update: Optional[VolumeUpdateCallback]):
+        """Run one job once a per-host and a global slot are free"""
+        # Take the host slot first so jobs queued behind a busy host do not
+        # hold global slots that transfers to other hosts could use
+        async with self._host_semaphore(job.host), self._global_slots:
+            result.state = "running"
+            await self._notify(on_update, result)
+            started = time.monotonic()
+            try:
+                success = await job.run()
+                result.state = "completed" if success else "failed"
+                if not success:
+                    result.error = f"Transfer of {job.key} failed"
+            except asyncio.CancelledError:
+                result.state = "cancelled"
+                raise
+            except Exception as e:
+                result.state = "failed"
+                result.error = str(e)
+            finally:
+                result.duration_seconds = time.monotonic() - started
+                await self._notify(on_update, result)
+
+    @staticmethod
+    async def _notify(on_update: Optional[VolumeUpdateCallback], result: VolumeTransferResult):
+        if not on_update:
+            return
+        try:
+            await on_update(result)
+        except Exception as e:
+            logger.warning(f"Volume progress callback failed: {e}")
+
+
+_volume_transfer_pool: Optional[VolumeTransferPool] = None
+
+
+def get_volume_transfer_pool() -> VolumeTransferPool:
+    """Get the volume transfer pool shared by all migrations"""
+    global _volume_transfer_pool
+    if _volume_transfer_pool is None:
+        migration_config = get_config().migration
+        _volume_transfer_pool = VolumeTransferPool(
+            migration_config.max_concurrent_volume_transfers,
+            migration_config.max_volume_transfers_per_host
+        )
+    return _volume_transfer_pool
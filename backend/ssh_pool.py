@@ -0,0 +1,284 @@
+"""
+SSH connection multiplexing for TransDock.
+
+Every remote command used to start its own ssh and pay for a TCP connection,
+key exchange and authentication (150-400 ms) before doing any work, and
+probing a host or listing a stack runs dozens of them. The pool gives each
+(host, user, port) a ControlMaster socket: the first ssh to a host becomes
+the master and stays in the background, later ones open a channel on its
+connection and start in a few milliseconds.
+
+``ssh_options`` returns the options routing an ssh through the pool. They are
+added by ``SecurityUtils.build_ssh_command`` and the ZFS command executor, so
+callers do not change. The command runners record the latency of each call
+and whether it found a master to reuse. A maintenance task checks the open
+masters with ``ssh -O check``, removes stale sockets and retires masters left
+unused for ``SSH_IDLE_SECONDS`` with ``ssh -O stop``, which lets sessions
+still running on them (long transfers) finish; ControlPersist ends them on
+its own should the API stop without retiring them.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+# Unused masters outlive the idle timeout by this much; the maintenance task
+# normally retires them first
+PERSIST_MARGIN_SECONDS = 60
+
+# ssh exits with 255 when it could not connect, any other code is the remote command's
+SSH_CONNECTION_ERROR = 255
+
+CONTROL_TIMEOUT_SECONDS = 10
+
+
+@dataclass
+class PooledConnection:
+    """A multiplexed connection to one host and its usage"""
+    hostname: str
+    ssh_user: str
+    ssh_port: int
+    control_path: str
+    # Sessions with different ssh options (known_hosts file, identity) do not share a master
+    profile: str = ""
+    commands: int = 0
+    reused: int = 0
+    failures: int = 0
+    connect_latency: float = 0.0
+    reused_latency: float = 0.0
+    max_latency: float = 0.0
+    last_used: Optional[float] = None
+    healthy: Optional[bool] = None
+    masters_retired: int = 0
+
+    @property
+    def is_open(self) -> bool:
+        """Whether a master is listening on the control socket"""
+        return os.path.exists(self.control_path)
+
+    def record(self, elapsed: float, reused: bool, returncode: int):
+        self.commands += 1
+        self.last_used = time.monotonic()
+        self.max_latency = max(self.max_latency, elapsed)
+        if reused:
+            self.reused += 1
+            self.reused_latency += elapsed
+        else:
+            self.connect_latency += elapsed
+        if returncode == SSH_CONNECTION_ERROR:
+            self.failures += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        new = self.commands - self.reused
+        return {
+            "host": self.hostname,
+            "ssh_user": self.ssh_user,
+            "ssh_port": self.ssh_port,
+            "profile": self.profile or "default",
+            "open": self.is_open,
+            "healthy": self.healthy,
+            "commands": self.commands,
+            "reused": self.reused,
+            "reuse_ratio": round(self.reused / self.commands, 3) if self.commands else 0.0,
+            "failures": self.failures,
+            "average_connect_latency_ms": round(self.connect_latency / new * 1000, 1) if new else None,
+            "average_reused_latency_ms": (
+                round(self.reused_latency / self.reused * 1000, 1) if self.reused else None),
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "idle_seconds": round(time.monotonic() - self.last_used, 1) if self.last_used else None,
+            "masters_retired": self.masters_retired,
+        }
+
+
+@dataclass
+class CommandTiming:
+    """A command started on a pooled connection"""
+    connection: PooledConnection
+    reused: bool
+    started: float
+
+
+class SSHConnectionPool:
+    """ControlMaster sockets shared by every ssh to the same host, user and port"""
+
+    def __init__(self, control_dir: Optional[str] = None, idle_seconds: Optional[int] = None,
+                 health_check_seconds: Optional[int] = None, enabled: Optional[bool] = None):
+        migration_config = get_config().migration
+        self.enabled = migration_config.ssh_multiplexing if enabled is None else enabled
+        self.control_dir = control_dir or migration_config.ssh_control_dir
+        self.idle_seconds = idle_seconds or migration_config.ssh_idle_seconds
+        self.health_check_seconds = health_check_seconds or migration_config.ssh_health_check_seconds
+        self._connections: Dict[str, PooledConnection] = {}
+        self._directory_ready = False
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    def _ensure_control_dir(self) -> bool:
+        if not self._directory_ready:
+            try:
+                os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+                os.chmod(self.control_dir, 0o700)
+                self._directory_ready = True
+            except OSError as e:
+                logger.warning(f"SSH control directory {self.control_dir} unavailable, "
+                               f"connecting without multiplexing: {e}")
+                self.enabled = False
+        return self._directory_ready
+
+    def control_path(self, hostname: str, ssh_user: str, ssh_port: int, profile: str = "") -> str:
+        # Hashed to stay well inside the socket path limit whatever the host name
+        name = hashlib.sha256(f"{profile}\0{ssh_user}@{hostname}:{ssh_port}".encode()).hexdigest()[:24]
+        return os.path.join(self.control_dir, name)
+
+    def ssh_options(self, hostname: str, ssh_user: str, ssh_port: int, profile: str = "") -> List[str]:
+        """ssh options that route a connection through the pool, none when it is disabled"""
+        if not self.enabled or not self._ensure_control_dir():
+            return []
+        path = self.control_path(hostname, ssh_user, ssh_port, profile)
+        connection = self._connections.get(path)
+        if connection is None:
+            connection = self._connections[path] = PooledConnection(
+                hostname=hostname, ssh_user=ssh_user, ssh_port=int(ssh_port),
+                control_path=path, profile=profile)
+        # Commands built here are about to run, whether or not their runner records them
+        connection.last_used = time.monotonic()
+        return [
+            "-o", "ControlMaster=auto",
+            "-o", f"ControlPath={path}",
+            "-o", f"ControlPersist={self.idle_seconds + PERSIST_MARGIN_SECONDS}",
+        ]
+
+    def connection_for(self, cmd: List[str]) -> Optional[PooledConnection]:
+        """The pooled connection an ssh command line uses, if any"""
+        if not cmd or os.path.basename(cmd[0]) != "ssh":
+            return None
+        for arg in cmd[1:]:
+            if arg.startswith("ControlPath="):
+                return self._connections.get(arg[len("ControlPath="):])
+        return None
+
+    def begin(self, cmd: List[str]) -> Optional[CommandTiming]:
+        """Note that a command is starting; None when it does not use the pool"""
+        connection = self.connection_for(cmd)
+        if connection is None:
+            return None
+        return CommandTiming(connection=connection, reused=connection.is_open, started=time.monotonic())
+
+    def end(self, timing: Optional[CommandTiming], returncode: int):
+        """Record how long a command took and whether it could connect"""
+        if timing is not None:
+            timing.connection.record(time.monotonic() - timing.started, timing.reused, returncode)
+
+    async def _control(self, connection: PooledConnection, operation: str) -> bool:
+        """Send a control request (check, stop) to a connection's master"""
+        try:
+            process = await asyncio.create_subprocess_exec(
+                "ssh", "-O", operation,
+                "-o", f"ControlPath={connection.control_path}",
+                "-p", str(connection.ssh_port),
+                f"{connection.ssh_user}@{connection.hostname}",
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.DEVNULL
+            )
+        except OSError as e:
+            logger.warning(f"Cannot run ssh -O {operation}: {e}")
+            return False
+        try:
+            return await asyncio.wait_for(process.wait(), timeout=CONTROL_TIMEOUT_SECONDS) == 0
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            return False
+
+    async def check(self, connection: PooledConnection) -> bool:
+        """Whether the master answers; a dead master's socket is removed"""
+        connection.healthy = await self._control(connection, "check")
+        if not connection.healthy:
+            logger.warning(f"SSH master for {connection.ssh_user}@{connection.hostname}:"
+                           f"{connection.ssh_port} is not responding, removing its socket")
+            try:
+                os.unlink(connection.control_path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"Cannot remove stale SSH control socket {connection.control_path}: {e}")
+        return connection.healthy
+
+    async def close(self, connection: PooledConnection):
+        """Retire a connection's master once its sessions end; the next command opens a new one"""
+        if await self._control(connection, "stop"):
+            connection.masters_retired += 1
+        connection.healthy = None
+
+    async def maintain(self):
+        """Retire idle masters and check the others"""
+        now = time.monotonic()
+        for connection in list(self._connections.values()):
+            if not connection.is_open:
+                connection.healthy = None
+                continue
+            if connection.last_used is None or now - connection.last_used >= self.idle_seconds:
+                logger.debug(f"Retiring idle SSH master for {connection.hostname}")
+                await self.close(connection)
+            else:
+                await self.check(connection)
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_seconds)
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.warning(f"SSH pool maintenance failed: {e}")
+
+    def start(self):
+        """Start checking and evicting masters in the background"""
+        if self.enabled and self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def shutdown(self):
+        """Stop the maintenance task and retire every open master"""
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        await asyncio.gather(*(self.close(connection) for connection in self._connections.values()
+                               if connection.is_open))
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-host reuse and latency of the pooled connections"""
+        connections = [connection.to_dict() for connection in self._connections.values()]
+        commands = sum(connection["commands"] for connection in connections)
+        reused = sum(connection["reused"] for connection in connections)
+        return {
+            "enabled": self.enabled,
+            "control_dir": self.control_dir,
+            "idle_seconds": self.idle_seconds,
+            "open_connections": sum(1 for connection in connections if connection["open"]),
+            "commands": commands,
+            "reused": reused,
+            "reuse_ratio": round(reused / commands, 3) if commands else 0.0,
+            "connections": connections,
+        }
+
+
+_ssh_pool: Optional[SSHConnectionPool] = None
+
+
+def get_ssh_pool() -> SSHConnectionPool:
+    """Get the SSH connection pool shared by all remote commands"""
+    global _ssh_pool
+    if _ssh_pool is None:
+        _ssh_pool = SSHConnectionPool()
+    return _ssh_pool
@@ -0,0 +1,264 @@
+"""
+In-process SSH sessions for TransDock.
+
+With ``SSH_TRANSPORT=paramiko`` remote commands run over one authenticated
+paramiko transport per (host, user, port) instead of an ``ssh`` process each.
+Every command opens a channel on the transport, which costs a round trip
+rather than a fork, an exec and a handshake; for a UI polling dozens of
+hosts that removes thousands of processes a minute.
+
+paramiko is blocking, so channels run on a thread pool bridged to asyncio.
+The channels open at once on one host are capped by ``SSH_CHANNELS_PER_HOST``
+(OpenSSH servers allow 10 sessions per connection by default). Host keys are
+checked against the same known_hosts files ssh uses and unknown hosts are
+rejected, as with ssh in batch mode; keys come from the agent, the default
+identity files or an explicit key file. Transports left unused for
+``SSH_IDLE_SECONDS`` are closed, and dead ones are replaced on next use.
+"""
+
+import asyncio
+import logging
+import os
+import select
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+import paramiko
+
+from .config import get_config
+
+logger = logging.getLogger(__name__)
+
+CONNECT_TIMEOUT_SECONDS = 10
+READ_SIZE = 64 * 1024
+
+# Exit codes matching what the ssh subprocess path reports
+SSH_CONNECTION_ERROR = 255
+TIMEOUT_EXIT_CODE = 124
+
+
+class CommandTimeout(Exception):
+    """A remote command did not finish in time"""
+
+
+@dataclass
+class PooledTransport:
+    """An authenticated transport to one host and its usage"""
+    hostname: str
+    ssh_user: str
+    ssh_port: int
+    known_hosts_file: Optional[str] = None
+    key_file: Optional[str] = None
+    client: Optional[paramiko.SSHClient] = None
+    channels: Optional[asyncio.Semaphore] = None
+    connect_lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    commands: int = 0
+    failures: int = 0
+    connects: int = 0
+    active_channels: int = 0
+    total_latency: float = 0.0
+    max_latency: float = 0.0
+    last_used: Optional[float] = None
+
+    @property
+    def is_active(self) -> bool:
+        transport = self.client.get_transport() if self.client else None
+        return transport is not None and transport.is_active()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "host": self.hostname,
+            "ssh_user": self.ssh_user,
+            "ssh_port": self.ssh_port,
+            "active": self.is_active,
+            "connects": self.connects,
+            "commands": self.commands,
+            "failures": self.failures,
+            "active_channels": self.active_channels,
+            "average_latency_ms": round(self.total_latency / self.commands * 1000, 1) if self.commands else None,
+            "max_latency_ms": round(self.max_latency * 1000, 1),
+            "idle_seconds": round(time.monotonic() - self.last_used, 1) if self.last_used else None,
+        }
+
+
+def _connect(entry: PooledTransport) -> paramiko.SSHClient:
+    client = paramiko.SSHClient()
+    client.load_system_host_keys()
+    if entry.known_hosts_file and os.path.exists(entry.known_hosts_file):
+        client.load_host_keys(entry.known_hosts_file)
+    client.set_missing_host_key_policy(paramiko.RejectPolicy())
+    try:
+        client.connect(
+            entry.hostname, port=entry.ssh_port, username=entry.ssh_user,
+            key_filename=entry.key_file, timeout=CONNECT_TIMEOUT_SECONDS,
+            banner_timeout=CONNECT_TIMEOUT_SECONDS, auth_timeout=CONNECT_TIMEOUT_SECONDS
+        )
+    except BaseException:
+        client.close()
+        raise
+    transport = client.get_transport()
+    if transport is not None:
+        transport.set_keepalive(30)
+    return client
+
+
+def _exec(transport: paramiko.Transport, command: str, timeout: Optional[float]) -> Tuple[int, bytes, bytes]:
+    """Run one command on a new channel, reading stdout and stderr as they arrive"""
+    channel = transport.open_session(timeout=CONNECT_TIMEOUT_SECONDS)
+    try:
+        channel.exec_command(command)
+        stdout, stderr = [], []
+        deadline = time.monotonic() + timeout if timeout else None
+        while True:
+            if channel.recv_ready():
+                stdout.append(channel.recv(READ_SIZE))
+            elif channel.recv_stderr_ready():
+                stderr.append(channel.recv_stderr(READ_SIZE))
+            elif channel.eof_received:
+                break
+            else:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise CommandTimeout()
+                select.select([channel], [], [], remaining)
+        return channel.recv_exit_status(), b"".join(stdout), b"".join(stderr)
+    finally:
+        channel.close()
+
+
+class SSHSessionPool:
+    """paramiko transports shared by every command to the same host, user and port"""
+
+    def __init__(self, channels_per_host: Optional[int] = None, threads: Optional[int] = None,
+                 idle_seconds: Optional[int] = None):
+        migration_config = get_config().migration
+        self.channels_per_host = max(1, channels_per_host or migration_config.ssh_channels_per_host)
+        self.idle_seconds = idle_seconds or migration_config.ssh_idle_seconds
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads or migration_config.ssh_channel_threads,
+            thread_name_prefix="ssh-channel")
+        self._transports: Dict[Tuple[str, str, int, str, str], PooledTransport] = {}
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    def _entry(self, hostname: str, ssh_user: str, ssh_port: int,
+               known_hosts_file: Optional[str], key_file: Optional[str]) -> PooledTransport:
+        key = (hostname, ssh_user, int(ssh_port), known_hosts_file or "", key_file or "")
+        entry = self._transports.get(key)
+        if entry is None:
+            entry = self._transports[key] = PooledTransport(
+                hostname=hostname, ssh_user=ssh_user, ssh_port=int(ssh_port),
+                known_hosts_file=known_hosts_file, key_file=key_file,
+                channels=asyncio.Semaphore(self.channels_per_host))
+        return entry
+
+    async def _transport(self, entry: PooledTransport) -> paramiko.Transport:
+        """The entry's live transport, connecting when there is none"""
+        async with entry.connect_lock:
+            if not entry.is_active:
+                self._close_client(entry)
+                loop = asyncio.get_running_loop()
+                entry.client = await loop.run_in_executor(self.executor, _connect, entry)
+                entry.connects += 1
+                logger.debug(f"Opened SSH transport to {entry.ssh_user}@{entry.hostname}:{entry.ssh_port}")
+            return entry.client.get_transport()
+
+    async def run(self, hostname: str, ssh_user: str, ssh_port: int, command: str,
+                  timeout: Optional[float] = None, known_hosts_file: Optional[str] = None,
+                  key_file: Optional[str] = None) -> Tuple[int, str, str]:
+        """Run a command on a host; returns (exit code, stdout, stderr) like the ssh path"""
+        entry = self._entry(hostname, ssh_user, ssh_port, known_hosts_file, key_file)
+        async with entry.channels:
+            entry.active_channels += 1
+            started = time.monotonic()
+            try:
+                transport = await self._transport(entry)
+                loop = asyncio.get_running_loop()
+                returncode, stdout, stderr = await loop.run_in_executor(
+                    self.executor, _exec, transport, command, timeout)
+                return returncode, stdout.decode(errors='replace'), stderr.decode(errors='replace')
+            except CommandTimeout:
+                return TIMEOUT_EXIT_CODE, "", f"Command timed out after {timeout} seconds"
+            except (paramiko.SSHException, OSError, EOFError) as e:
+                entry.failures += 1
+                # A broken transport is replaced by the next command
+                if not entry.is_active:
+                    self._close_client(entry)
+                logger.warning(f"SSH session to {ssh_user}@{hostname}:{ssh_port} failed: {e}")
+                return SSH_CONNECTION_ERROR, "", f"SSH session to {hostname} failed: {e}"
+            finally:
+                elapsed = time.monotonic() - started
+                entry.active_channels -= 1
+                entry.commands += 1
+                entry.total_latency += elapsed
+                entry.max_latency = max(entry.max_latency, elapsed)
+                entry.last_used = time.monotonic()
+
+    @staticmethod
+    def _close_client(entry: PooledTransport):
+        if entry.client is not None:
+            entry.client.close()
+            entry.client = None
+
+    async def maintain(self):
+        """Close transports that are idle or dead"""
+        now = time.monotonic()
+        for entry in list(self._transports.values()):
+            if entry.client is None or entry.active_channels:
+                continue
+            idle = entry.last_used is None or now - entry.last_used >= self.idle_seconds
+            if idle or not entry.is_active:
+                async with entry.connect_lock:
+                    self._close_client(entry)
+
+    async def _maintenance_loop(self):
+        while True:
+            await asyncio.sleep(max(1, self.idle_seconds // 2))
+            try:
+                await self.maintain()
+            except Exception as e:
+                logger.warning(f"SSH session pool maintenance failed: {e}")
+
+    def start(self):
+        """Start closing idle transports in the background"""
+        if self._maintenance_task is None:
+            self._maintenance_task = asyncio.create_task(self._maintenance_loop())
+
+    async def shutdown(self):
+        """Stop the maintenance task and close every transport"""
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+            try:
+                await self._maintenance_task
+            except asyncio.CancelledError:
+                pass
+            self._maintenance_task = None
+        for entry in self._transports.values():
+            self._close_client(entry)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Per-host usage of the pooled transports"""
+        return {
+            "channels_per_host": self.channels_per_host,
+            "idle_seconds": self.idle_seconds,
+            "active_transports": sum(1 for entry in self._transports.values() if entry.is_active),
+            "transports": [entry.to_dict() for entry in self._transports.values()],
+        }
+
+
+def paramiko_transport_enabled() -> bool:
+    """Whether remote commands run over in-process sessions instead of ssh processes"""
+    return get_config().migration.ssh_transport == "paramiko"
+
+
+_ssh_session_pool: Optional[SSHSessionPool] = None
+
+
+def get_ssh_session_pool() -> SSHSessionPool:
+    """Get the in-process SSH session pool shared by all remote commands"""
+    global _ssh_session_pool
+    if _ssh_session_pool is None:
+        _ssh_session_pool = SSHSessionPool()
+    return _ssh_session_pool
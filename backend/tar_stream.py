@@ -0,0 +1,103 @@
+"""
+Tar stream transfers for TransDock.
+
+rsync exchanges file lists and checksums per file, which dominates the
+transfer time of trees with hundreds of thousands of tiny files. A tar stream
+has no per-file round trips: the source writes one archive to stdout, the
+transfer engine pumps it over a single SSH channel, and ``tar -x`` unpacks it
+on the target. It cannot delete or skip files, so it suits the first full
+copy into an empty target; later delta passes stay with rsync.
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .config import get_config
+from .security_utils import SecurityUtils
+
+logger = logging.getLogger(__name__)
+
+SourceHost = Tuple[Optional[str], str, int]
+
+# Compression programs for tar -I, as (compress, decompress) commands
+TAR_CODECS: Dict[str, Tuple[str, str]] = {
+    "zstd": ("zstd -1 -T0", "zstd -d"),
+    "lz4": ("lz4 -1", "lz4 -d"),
+    "gzip": ("gzip -1", "gzip -d"),
+}
+
+
+@dataclass
+class FileTreeProfile:
+    """File count and size of a directory tree"""
+    file_count: int
+    total_bytes: int
+
+    @property
+    def average_file_bytes(self) -> float:
+        return self.total_bytes / self.file_count if self.file_count else 0.0
+
+    def favors_tar_stream(self) -> bool:
+        """Whether per-file overhead would dominate an rsync of this tree"""
+        migration_config = get_config().migration
+        return (self.file_count >= migration_config.tar_stream_min_files and
+                self.average_file_bytes <= migration_config.tar_stream_max_avg_file_kb * 1024)
+
+
+def build_tar_create_command(source_path: str, codec: Optional[str] = None,
+                             source: SourceHost = (None, "root", 22)) -> List[str]:
+    """Command writing a tar archive of source_path's contents to stdout"""
+    tar_args = ["tar", "-C", source_path, "--numeric-owner"]
+    if codec:
+        tar_args.append(f"--use-compress-program={TAR_CODECS[codec][0]}")
+    tar_args.extend(["-cf", "-", "."])
+
+    source_host, source_ssh_user, source_ssh_port = source
+    if not source_host:
+        return tar_args
+    return SecurityUtils.build_ssh_command(
+        source_host, source_ssh_user, source_ssh_port,
+        " ".join(SecurityUtils.escape_shell_argument(arg) for arg in tar_args))
+
+
+def build_tar_extract_command(target_host: str, target_path: str, ssh_user: str = "root",
+                              ssh_port: int = 22, codec: Optional[str] = None) -> List[str]:
+    """Command unpacking a tar archive from stdin into target_path on the target"""
+    tar_args = ["tar", "-C", target_path, "--numeric-owner", "-p"]
+    if codec:
+        tar_args.append(f"--use-compress-program={TAR_CODECS[codec][1]}")
+    tar_args.extend(["-xf", "-"])
+    escaped_path = SecurityUtils.escape_shell_argument(target_path)
+    remote_cmd = (f"mkdir -p {escaped_path} && " +
+                  " ".join(SecurityUtils.escape_shell_argument(arg) for arg in tar_args))
+    return SecurityUtils.build_ssh_command(target_host, ssh_user, ssh_port, remote_cmd)
+
+
+async def profile_file_tree(path: str, source: SourceHost = (None, "root", 22)) -> Optional[FileTreeProfile]:
+    """Count the regular files under path and their total size in one pass"""
+    shell_cmd = (f"find {SecurityUtils.escape_shell_argument(path)} -xdev -type f -printf '%s\\n' "
+                 f"| awk '{{n++; s+=$1}} END {{print n+0, s+0}}'")
+    source_host, source_ssh_user, source_ssh_port = source
+    if source_host:
+        cmd = SecurityUtils.build_ssh_command(source_host, source_ssh_user, source_ssh_port, shell_cmd)
+    else:
+        cmd = ["sh", "-c", shell_cmd]
+
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, stderr = await process.communicate()
+    except Exception as e:
+        logger.warning(f"Failed to profile {path}: {e}")
+        return None
+
+    parts = stdout.decode().split()
+    if process.returncode != 0 or len(parts) != 2 or not all(part.isdigit() for part in parts):
+        logger.warning(f"Failed to profile {path}: {stderr.decode(errors='replace').strip()}")
+        return None
+    return FileTreeProfile(file_count=int(parts[0]), total_bytes=int(parts[1]))
@@ -0,0 +1,430 @@
+"""
+Streaming transfer engine for TransDock.
+
+Spawns the producing and consuming side of a transfer (for example ``zfs send``
+and ``ssh ... zfs receive``) as separate processes and pumps data between them
+through a large bounded in-memory buffer. Because every byte passes through the
+pump, the engine can report live throughput and detect stalls while the
+transfer is still running instead of only learning the outcome at exit.
+
+The pump can also hash the stream as it passes. The sink command is then
+wrapped so the receiving host hashes the bytes it actually consumed, and the
+two digests are compared when the stream ends: end-to-end verification of
+the transfer without reading the data from disk again.
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+import signal
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from .bandwidth import BandwidthLease
+from .config import get_config
+from .manifest import HASH_PROGRAMS
+from .security_utils import SecurityUtils
+from .utils import format_bytes
+
+logger = logging.getLogger(__name__)
+
+# The wrapped sink prints its digest of the stream on a stdout line starting with this
+STREAM_DIGEST_PREFIX = "transdock-stream-digest "
+
+# sh run on the receiving host: tee the stream into a FIFO hashed in the
+# background while the consumer reads it, keeping the consumer's exit status.
+# {program} is the hash program, {consumer} the original command line.
+STREAM_DIGEST_WRAPPER = (
+    'fifo=$(mktemp -u) && mkfifo -m 600 "$fifo" || exit 125; '
+    '{{ digest=$({program} < "$fifo") && echo "{prefix}${{digest%% *}}"; }} & '
+    'tee -- "$fifo" | {consumer}; rc=$?; wait $!; rm -f -- "$fifo"; exit $rc'
+)
+
+
+def stream_digest_algorithm() -> Optional[str]:
+    """The configured algorithm for in-flight stream digests, None when disabled or unknown"""
+    algorithm = get_config().migration.stream_digest_algorithm
+    if not algorithm:
+        return None
+    if algorithm not in HASH_PROGRAMS:
+        logger.warning(f"Unsupported stream digest algorithm {algorithm}, streams are not hashed")
+        return None
+    return algorithm
+
+
+def wrap_sink_with_digest(consumer: str, algorithm: str) -> str:
+    """Shell command running consumer on stdin while the same bytes are hashed"""
+    wrapper = STREAM_DIGEST_WRAPPER.format(
+        program=HASH_PROGRAMS[algorithm], prefix=STREAM_DIGEST_PREFIX, consumer=consumer)
+    # Whatever the login shell, the wrapper itself runs in sh
+    return f"sh -c {SecurityUtils.escape_shell_argument(wrapper)}"
+
+
+def parse_sink_digest(sink_stdout: str) -> Optional[str]:
+    for line in sink_stdout.splitlines():
+        if line.startswith(STREAM_DIGEST_PREFIX):
+            return line[len(STREAM_DIGEST_PREFIX):].strip()
+    return None
+
+
+@dataclass
+class TransferMetrics:
+    """Live metrics for a streaming transfer"""
+    bytes_transferred: int = 0
+    estimated_total_bytes: Optional[int] = None
+    instantaneous_bps: float = 0.0
+    average_bps: float = 0.0
+    buffered_bytes: int = 0
+    stalled: bool = False
+    stall_count: int = 0
+    longest_stall_seconds: float = 0.0
+    resume_count: int = 0
+    # Digest of the last stream attempt and whether the receiver's matched it
+    stream_digest_algorithm: Optional[str] = None
+    stream_digest: Optional[str] = None
+    stream_digest_verified: Optional[bool] = None
+    started_at: float = field(default_factory=time.monotonic)
+    last_activity_at: float = field(default_factory=time.monotonic)
+    finished_at: Optional[float] = None
+
+    @property
+    def elapsed_seconds(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(0.0, end - self.started_at)
+
+    @property
+    def eta_seconds(self) -> Optional[float]:
+        if not self.estimated_total_bytes or self.average_bps <= 0:
+            return None
+        remaining = max(0, self.estimated_total_bytes - self.bytes_transferred)
+        return remaining / self.average_bps
+
+    @property
+    def percent_complete(self) -> Optional[float]:
+        if not self.estimated_total_bytes:
+            return None
+        return min(100.0, self.bytes_transferred / self.estimated_total_bytes * 100)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Serialize metrics for status reporting"""
+        return {
+            "bytes_transferred": self.bytes_transferred,
+            "bytes_transferred_human": format_bytes(self.bytes_transferred),
+            "estimated_total_bytes": self.estimated_total_bytes,
+            "percent_complete": self.percent_complete,
+            "instantaneous_bps": round(self.instantaneous_bps, 1),
+            "average_bps": round(self.average_bps, 1),
+            "average_rate_human": f"{format_bytes(int(self.average_bps))}/s",
+            "eta_seconds": round(self.eta_seconds, 1) if self.eta_seconds is not None else None,
+            "buffered_bytes": self.buffered_bytes,
+            "stalled": self.stalled,
+            "stall_count": self.stall_count,
+            "longest_stall_seconds": round(self.longest_stall_seconds, 1),
+            "resume_count": self.resume_count,
+            "stream_digest_algorithm": self.stream_digest_algorithm,
+            "stream_digest": self.stream_digest,
+            "stream_digest_verified": self.stream_digest_verified,
+            "elapsed_seconds": round(self.elapsed_seconds, 1),
+            "finished": self.finished_at is not None,
+        }
+
+
+ProgressCallback = Callable[[TransferMetrics], Awaitable[None]]
+
+
+@dataclass
+class StreamResult:
+    """Outcome of a pumped transfer"""
+    success: bool
+    metrics: TransferMetrics
+    source_returncode: Optional[int] = None
+    sink_returncode: Optional[int] = None
+    source_stderr: str = ""
+    sink_stdout: str = ""
+    sink_stderr: str = ""
+    error: Optional[str] = None
+
+    @property
+    def error_message(self) -> str:
+        """Best available description of why the transfer failed"""
+        if self.error:
+            return self.error
+        parts = []
+        if self.source_returncode:
+            parts.append(f"source exited {self.source_returncode}: {self.source_stderr.strip()}")
+        if self.sink_returncode:
+            parts.append(f"sink exited {self.sink_returncode}: {self.sink_stderr.strip()}")
+        return "; ".join(parts)
+
+
+class StreamBuffer:
+    """FIFO of chunks bounded by the bytes it holds, however large each chunk is.
+
+    Reads from a pipe return whatever is ready (typically 64 KiB, not the
+    requested chunk size), so counting chunks would bound memory far below
+    the configured buffer size.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(1, capacity)
+        self.size = 0
+        self._chunks: deque = deque()
+        self._closed = False
+        self._changed = asyncio.Condition()
+
+    async def put(self, chunk: bytes):
+        """Append a chunk, waiting for room; a chunk larger than the buffer waits for it to empty"""
+        async with self._changed:
+            await self._changed.wait_for(
+                lambda: self.size == 0 or self.size + len(chunk) <= self.capacity)
+            self._chunks.append(chunk)
+            self.size += len(chunk)
+            self._changed.notify_all()
+
+    async def close(self):
+        """Mark the end of the stream once the buffered chunks are read"""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+    async def get(self) -> Optional[bytes]:
+        """The next chunk, None at the end of the stream"""
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._chunks or self._closed)
+            if not self._chunks:
+                return None
+            chunk = self._chunks.popleft()
+            self.size -= len(chunk)
+            self._changed.notify_all()
+            return chunk
+
+
+class StreamPump:
+    """Pump bytes from a source process to a sink process through a bounded buffer.
+
+    The buffer decouples the two sides: when the receiver blocks (e.g. on a ZFS
+    txg sync) the sender keeps filling the buffer instead of stalling the pipe.
+    With ``hash_algorithm`` the bytes written to the sink are hashed, and the
+    sink command must come from ``wrap_sink_with_digest`` with the same
+    algorithm; the transfer fails if the digests differ.
+    """
+
+    def __init__(self,
+                 buffer_size: Optional[int] = None,
+                 chunk_size: Optional[int] = None,
+                 stall_timeout: Optional[float] = None,
+                 progress_interval: float = 1.0,
+                 progress_callback: Optional[ProgressCallback] = None,
+                 metrics: Optional[TransferMetrics] = None,
+                 bandwidth_lease: Optional[BandwidthLease] = None,
+                 hash_algorithm: Optional[str] = None):
+        migration_config = get_config().migration
+        self.buffer_size = buffer_size or migration_config.transfer_buffer_size_mb * 1024 * 1024
+        self.chunk_size = chunk_size or migration_config.transfer_chunk_size_kb * 1024
+        self.stall_timeout = stall_timeout or migration_config.transfer_stall_timeout_seconds
+        self.progress_interval = progress_interval
+        self.progress_callback = progress_callback
+        self.metrics = metrics or TransferMetrics()
+        self.bandwidth_lease = bandwidth_lease
+        self.hash_algorithm = hash_algorithm
+        self._hasher = None
+        self._last_sample: Optional[tuple] = None
+
+    async def run(self, source_cmd: List[str], sink_cmd: List[str]) -> StreamResult:
+        """Run source and sink processes and pump data between them"""
+        self.metrics.finished_at = None
+        self.metrics.last_activity_at = time.monotonic()
+        self._hasher = hashlib.new(self.hash_algorithm) if self.hash_algorithm else None
+        self.metrics.stream_digest_algorithm = self.hash_algorithm
+        self.metrics.stream_digest = None
+        self.metrics.stream_digest_verified = None
+
+        source = await asyncio.create_subprocess_exec(
+            *source_cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=self.chunk_size,
+            start_new_session=True
+        )
+        try:
+            sink = await asyncio.create_subprocess_exec(
+                *sink_cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True
+            )
+        except Exception:
+            await self._terminate(source)
+            raise
+
+        buffer = StreamBuffer(self.buffer_size)
+
+        source_stderr_task = asyncio.create_task(source.stderr.read())
+        sink_stdout_task = asyncio.create_task(sink.stdout.read())
+        sink_stderr_task = asyncio.create_task(sink.stderr.read())
+        reader = asyncio.create_task(self._read_source(source, buffer))
+        writer = asyncio.create_task(self._write_sink(sink, buffer))
+        monitor = asyncio.create_task(self._monitor())
+
+        pump_error = None
+        try:
+            await asyncio.gather(reader, writer)
+        except (BrokenPipeError, ConnectionResetError) as e:
+            pump_error = f"Receiving side closed the stream early: {e}"
+        except asyncio.CancelledError:
+            pump_error = "Transfer cancelled"
+            raise
+        except Exception as e:
+            pump_error = f"Stream pump failed: {e}"
+        finally:
+            for task in (reader, writer, monitor):
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(reader, writer, monitor, return_exceptions=True)
+            if pump_error:
+                await self._terminate(source, drain_stdout=True)
+                await self._terminate(sink)
+
+        source_returncode = await source.wait()
+        sink_returncode = await sink.wait()
+        source_stderr, sink_stdout, sink_stderr = await asyncio.gather(
+            source_stderr_task, sink_stdout_task, sink_stderr_task
+        )
+
+        success = pump_error is None and source_returncode == 0 and sink_returncode == 0
+        sink_stdout = sink_stdout.decode(errors='replace')
+        if success and self._hasher:
+            pump_error = self._verify_digest(parse_sink_digest(sink_stdout))
+            success = pump_error is None
+
+        self.metrics.finished_at = time.monotonic()
+        self.metrics.buffered_bytes = 0
+        self._update_rates(final=True)
+        await self._notify()
+
+        return StreamResult(
+            success=success,
+            metrics=self.metrics,
+            source_returncode=source_returncode,
+            sink_returncode=sink_returncode,
+            source_stderr=source_stderr.decode(errors='replace'),
+            sink_stdout=sink_stdout,
+            sink_stderr=sink_stderr.decode(errors='replace'),
+            error=pump_error
+        )
+
+    async def _read_source(self, source: asyncio.subprocess.Process, buffer: StreamBuffer):
+        """Read chunks from the source process into the buffer"""
+        while True:
+            chunk = await source.stdout.read(self.chunk_size)
+            if not chunk:
+                break
+            await buffer.put(chunk)
+            self.metrics.buffered_bytes = buffer.size
+        await buffer.close()
+
+    async def _write_sink(self, sink: asyncio.subprocess.Process, buffer: StreamBuffer):
+        """Drain the buffer into the sink process"""
+        loop = asyncio.get_running_loop()
+        while True:
+            chunk = await buffer.get()
+            if chunk is None:
+                break
+            self.metrics.buffered_bytes = buffer.size
+            if self.bandwidth_lease:
+                await self.bandwidth_lease.throttle(len(chunk))
+            # hashlib releases the GIL on large buffers, so the chunk is
+            # hashed in a thread while it is written
+            hashing = loop.run_in_executor(None, self._hasher.update, chunk) if self._hasher else None
+            sink.stdin.write(chunk)
+            await sink.stdin.drain()
+            if hashing:
+                await hashing
+            self._record_progress(len(chunk))
+        sink.stdin.close()
+        await sink.stdin.wait_closed()
+
+    def _verify_digest(self, sink_digest: Optional[str]) -> Optional[str]:
+        """Compare the pumped stream's digest with the receiver's; an error message if they differ"""
+        self.metrics.stream_digest = self._hasher.hexdigest()
+        if sink_digest is None:
+            self.metrics.stream_digest_verified = False
+            return "Receiving side did not report a stream digest"
+        self.metrics.stream_digest_verified = sink_digest == self.metrics.stream_digest
+        if not self.metrics.stream_digest_verified:
+            return (f"Stream digest mismatch: sent {self.hash_algorithm}:{self.metrics.stream_digest}, "
+                    f"received {sink_digest}")
+        logger.info(f"Stream verified end to end: {self.hash_algorithm}:{self.metrics.stream_digest}")
+        return None
+
+    def _record_progress(self, nbytes: int):
+        """Account bytes delivered to the sink"""
+        now = time.monotonic()
+        if self.metrics.stalled:
+            stall_duration = now - self.metrics.last_activity_at
+            self.metrics.longest_stall_seconds = max(self.metrics.longest_stall_seconds, stall_duration)
+            self.metrics.stalled = False
+            logger.info(f"Transfer resumed after {stall_duration:.1f}s stall")
+        self.metrics.bytes_transferred += nbytes
+        self.metrics.last_activity_at = now
+
+    async def _monitor(self):
+        """Periodically refresh rates, detect stalls and publish metrics"""
+        while True:
+            await asyncio.sleep(self.progress_interval)
+            self._update_rates()
+            idle = time.monotonic() - self.metrics.last_activity_at
+            if idle >= self.stall_timeout:
+                if not self.metrics.stalled:
+                    self.metrics.stalled = True
+                    self.metrics.stall_count += 1
+                    logger.warning(
+                        f"Transfer stalled: no data delivered for {idle:.0f}s "
+                        f"({format_bytes(self.metrics.buffered_bytes)} buffered)")
+                self.metrics.longest_stall_seconds = max(self.metrics.longest_stall_seconds, idle)
+            await self._notify()
+
+    def _update_rates(self, final: bool = False):
+        """Recompute instantaneous and average throughput"""
+        now = time.monotonic()
+        if self._last_sample and not final:
+            sample_time, sample_bytes = self._last_sample
+            interval = now - sample_time
+            if interval > 0:
+                self.metrics.instantaneous_bps = (self.metrics.bytes_transferred - sample_bytes) / interval
+        elif final:
+            self.metrics.instantaneous_bps = 0.0
+        self._last_sample = (now, self.metrics.bytes_transferred)
+
+        elapsed = self.metrics.elapsed_seconds
+        if elapsed > 0:
+            self.metrics.average_bps = self.metrics.bytes_transferred / elapsed
+
+    async def _notify(self):
+        """Invoke the progress callback, never letting it break the transfer"""
+        if not self.progress_callback:
+            return
+        try:
+            await self.progress_callback(self.metrics)
+        except Exception as e:
+            logger.warning(f"Transfer progress callback failed: {e}")
+
+    @staticmethod
+    async def _terminate(process: asyncio.subprocess.Process, drain_stdout: bool = False):
+        """Kill a process and its children if it is still running"""
+        if process.returncode is None:
+            # Each side runs in its own session so shell wrappers and their
+            # children die together and release the pipes
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        if drain_stdout:
+            # Nobody reads this pipe any more; consume it so EOF is observed
+            # and the process can be reaped
+            await process.stdout.read()
+        await process.wait()
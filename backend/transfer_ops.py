@@ -1,14 +1,48 @@
 import logging
 import os
+import shlex
 from typing import List, Dict, Tuple, Optional
 import asyncio
 from .models import VolumeMount, TransferMethod
 from .security_utils import SecurityUtils, SecurityValidationError, RsyncConfig
+from .transfer_engine import (
+    StreamPump, TransferMetrics, ProgressCallback, stream_digest_algorithm, wrap_sink_with_digest
+)
+from .bandwidth import get_bandwidth_allocator
+from .parallel_rsync import RSYNC_VANISHED_FILES, ShardedRsync, build_rsync_argv
+from .rsync_progress import RSYNC_PROGRESS_ARGS, RsyncProgress, RsyncProgressCallback, run_rsync
+from .compression_planner import CompressionDecision
+from .direct_stream import (
+    DirectStream, build_direct_command, can_stream_directly, parse_tar_totals, parse_zfs_send_progress
+)
+from .manifest import ManifestDiff, build_manifest_command, diff_manifests
+from .merkle import MerkleDiff, build_merkle_command, diff_trees
+from .tar_stream import (TAR_CODECS, FileTreeProfile, build_tar_create_command, build_tar_extract_command,
+                         profile_file_tree)
+from .utils import format_bytes
+from .ssh_pool import get_ssh_pool
+from .zfs_diff import expand_directories, read_zfs_diff
+from .config import get_config
 
 logger = logging.getLogger(__name__)
 
 
 class TransferOperations:
+    # Pool features needed to receive --compressed blocks of an algorithm;
+    # algorithms not listed (gzip, lzjb, zle) are always supported
+    COMPRESSION_FEATURES = {
+        "on": "feature@lz4_compress",
+        "lz4": "feature@lz4_compress",
+        "zstd": "feature@zstd_compress",
+    }
+    SEND_FEATURES = [
+        "feature@encryption",
+        "feature@embedded_data",
+        "feature@large_blocks",
+        "feature@lz4_compress",
+        "feature@zstd_compress",
+    ]
+
     def __init__(self):
         self.temp_mount_base = "/tmp/transdock_mounts"
 
@@ -16,6 +50,8 @@ class TransferOperations:
             self, cmd: List[str], cwd: Optional[str] = None) -> Tuple[int, str, str]:
         """Run a command asynchronously"""
         try:
+            ssh_pool = get_ssh_pool()
+            timing = ssh_pool.begin(cmd)
             process = await asyncio.create_subprocess_exec(
                 *cmd,
                 stdout=asyncio.subprocess.PIPE,
@@ -26,6 +62,7 @@ class TransferOperations:
             # Ensure returncode is never None by defaulting to 1 if it somehow
             # is
             returncode = process.returncode if process.returncode is not None else 1
+            ssh_pool.end(timing, returncode)
             return returncode, stdout.decode(), stderr.decode()
         except Exception as e:
             logger.error(f"Command failed: {' '.join(cmd)} - {e}")
@@ -75,8 +112,16 @@ class TransferOperations:
             target_host: str,
             target_dataset: str,
             ssh_user: str = "root",
-            ssh_port: int = 22) -> bool:
-        """Transfer data using ZFS send/receive"""
+            ssh_port: int = 22,
+            progress_callback: Optional[ProgressCallback] = None,
+            incremental_base: Optional[str] = None,
+            send_flags: Optional[List[str]] = None) -> bool:
+        """Transfer data using ZFS send/receive through the streaming pump.
+
+        With ``incremental_base`` (a snapshot or bookmark already present on the
+        target) only the changes since that point are sent. ``send_flags`` are
+        negotiated from both ends when not given.
+        """
         logger.info(
             f"Transferring {snapshot_name} via ZFS send to {target_host}:{target_dataset}")
 
@@ -91,60 +136,407 @@ class TransferOperations:
             if '@' not in snapshot_name or len(snapshot_name) > 256:
                 raise SecurityValidationError(
                     f"Invalid snapshot name: {snapshot_name}")
+            if incremental_base and ('@' not in incremental_base and '#' not in incremental_base):
+                raise SecurityValidationError(
+                    f"Invalid incremental base: {incremental_base}")
         except SecurityValidationError as e:
             logger.error(f"Security validation failed: {e}")
             return False
 
-        # Create target dataset on remote system if it doesn't exist
-        try:
-            # First create parent datasets with -p flag
-            zfs_create_cmd = SecurityUtils.validate_zfs_command_args(
-                "create", "-p", target_dataset)
-            create_cmd_str = " ".join(zfs_create_cmd)
-            create_cmd = SecurityUtils.build_ssh_command(
-                target_host, ssh_user, ssh_port, create_cmd_str)
-
-            returncode, stdout, stderr = await self.run_command(create_cmd)
-            if returncode != 0 and "dataset already exists" not in stderr:
-                logger.warning(
-                    f"Failed to create target dataset {target_dataset}: {stderr}")
-                # Continue anyway - maybe the dataset will be created by the
-                # receive command
-        except SecurityValidationError as e:
-            logger.warning(f"Failed to validate dataset creation command: {e}")
+        # A full stream creates the dataset itself, so only its parents may
+        # exist beforehand; an incremental stream needs the dataset already
+        parent_dataset = target_dataset.rsplit('/', 1)[0] if '/' in target_dataset else None
+        if parent_dataset and not incremental_base:
+            try:
+                zfs_create_cmd = SecurityUtils.validate_zfs_command_args(
+                    "create", "-p", parent_dataset)
+                create_cmd_str = " ".join(zfs_create_cmd)
+                create_cmd = SecurityUtils.build_ssh_command(
+                    target_host, ssh_user, ssh_port, create_cmd_str)
+
+                returncode, stdout, stderr = await self.run_command(create_cmd)
+                if returncode != 0 and "dataset already exists" not in stderr:
+                    logger.warning(
+                        f"Failed to create parent dataset {parent_dataset}: {stderr}")
+            except SecurityValidationError as e:
+                logger.warning(f"Failed to validate dataset creation command: {e}")
+
+        if send_flags is None:
+            send_flags = await self.negotiate_send_flags(
+                snapshot_name.split('@')[0], target_host, target_dataset, ssh_user, ssh_port)
 
         # Send the snapshot using secure command construction
+        if incremental_base:
+            # Bookmarks only support -i; from a snapshot, -I also carries any
+            # intermediate snapshots so both sides keep the same lineage
+            send_flag = "-i" if '#' in incremental_base else "-I"
+            send_args = [*send_flags, send_flag, incremental_base, snapshot_name]
+            # Roll back any changes made on the mounted target since the base
+            receive_args = ["-F", target_dataset]
+        else:
+            send_args = [*send_flags, snapshot_name]
+            receive_args = [target_dataset]
+
+        success = await self._stream_zfs_send(
+            send_args, receive_args, target_host, target_dataset, ssh_user, ssh_port,
+            progress_callback=progress_callback
+        )
+        if success:
+            logger.info(f"Successfully transferred {snapshot_name} via ZFS send")
+        return success
+
+    async def negotiate_send_flags(
+            self,
+            source_dataset: str,
+            target_host: str,
+            target_dataset: str,
+            ssh_user: str = "root",
+            ssh_port: int = 22,
+            source: Tuple[Optional[str], str, int] = (None, "root", 22)) -> List[str]:
+        """Pick send flags that keep blocks in their on-disk form.
+
+        Encrypted datasets are sent ``--raw``; compressed ones ``--compressed``
+        when the target pool can store that algorithm. ``--embed`` and
+        ``--large-block`` are added when the target pool has the features.
+        """
+        properties = await self._get_source_send_properties(source_dataset, source)
+        features = await self._get_pool_features(
+            target_host, target_dataset.split('/')[0], ssh_user, ssh_port)
+
+        def target_supports(feature: str) -> bool:
+            return features.get(feature) in ("enabled", "active")
+
+        flags = []
+        encryption = properties.get("encryption", "off")
+        compression = properties.get("compression", "off")
+
+        if encryption not in ("off", "-"):
+            # Raw streams carry blocks still encrypted and compressed
+            if target_supports("feature@encryption"):
+                flags.append("--raw")
+            else:
+                logger.warning(
+                    f"{source_dataset} is encrypted but {target_host} lacks feature@encryption; "
+                    f"sending decrypted")
+        else:
+            if compression not in ("off", "-"):
+                required_feature = self.COMPRESSION_FEATURES.get(compression.split('-')[0])
+                if required_feature is None or target_supports(required_feature):
+                    flags.append("--compressed")
+            if target_supports("feature@embedded_data"):
+                flags.append("--embed")
+
+        recordsize = properties.get("recordsize", "")
+        if recordsize.isdigit() and int(recordsize) > 128 * 1024 \
+                and target_supports("feature@large_blocks"):
+            flags.append("--large-block")
+
+        logger.info(
+            f"Send flags for {source_dataset} -> {target_host}:{target_dataset}: "
+            f"{' '.join(flags) or '(none)'} "
+            f"(compression={compression}, encryption={encryption}, recordsize={recordsize or '?'})")
+        return flags
+
+    async def _get_source_send_properties(
+            self, dataset: str,
+            source: Tuple[Optional[str], str, int] = (None, "root", 22)) -> Dict[str, str]:
+        """Read the dataset properties that decide the send flags"""
+        properties = {}
+        source_host, source_ssh_user, source_ssh_port = source
+        # encryption is queried on its own: releases without native
+        # encryption reject the whole property list otherwise
+        for property_list in ("compression,recordsize", "encryption"):
+            try:
+                get_cmd = SecurityUtils.validate_zfs_command_args(
+                    "get", "-H", "-p", "-o", "property,value", property_list, dataset)
+            except SecurityValidationError as e:
+                logger.warning(f"Cannot read properties of {dataset}: {e}")
+                return properties
+            if source_host:
+                cmd = SecurityUtils.build_ssh_command(
+                    source_host, source_ssh_user, source_ssh_port, " ".join(get_cmd))
+            else:
+                cmd = shlex.split(" ".join(get_cmd))
+
+            returncode, stdout, _ = await self.run_command(cmd)
+            if returncode != 0:
+                continue
+            for line in stdout.splitlines():
+                parts = line.split('\t')
+                if len(parts) == 2:
+                    properties[parts[0]] = parts[1].strip()
+        return properties
+
+    async def _get_pool_features(self, host: Optional[str], pool: str,
+                                 ssh_user: str = "root", ssh_port: int = 22,
+                                 features: Optional[List[str]] = None) -> Dict[str, str]:
+        """Read feature flags of a pool, locally when host is None.
+
+        Defaults to the send-related features.
+        """
+        feature_list = ",".join(features or self.SEND_FEATURES)
         try:
-            zfs_send_cmd = SecurityUtils.validate_zfs_command_args(
-                "send", snapshot_name)
-            zfs_receive_cmd = SecurityUtils.validate_zfs_command_args(
-                "receive", target_dataset)
+            SecurityUtils.validate_dataset_name(pool)
+            if host:
+                cmd = SecurityUtils.build_ssh_command(
+                    host, ssh_user, ssh_port,
+                    f"zpool get -H -o property,value {feature_list} {SecurityUtils.escape_shell_argument(pool)}")
+            else:
+                cmd = ["zpool", "get", "-H", "-o", "property,value", feature_list, pool]
+        except SecurityValidationError as e:
+            logger.warning(f"Cannot read pool features of {pool}: {e}")
+            return {}
 
-            receive_cmd_str = " ".join(zfs_receive_cmd)
-            ssh_cmd = SecurityUtils.build_ssh_command(
-                target_host, ssh_user, ssh_port, receive_cmd_str)
+        returncode, stdout, stderr = await self.run_command(cmd)
+        if returncode != 0:
+            logger.warning(f"Failed to read pool features of {host or 'localhost'}:{pool}: {stderr.strip()}")
+            return {}
+
+        result = {}
+        for line in stdout.splitlines():
+            parts = line.split('\t')
+            if len(parts) == 2:
+                result[parts[0]] = parts[1].strip()
+        return result
+
+    @staticmethod
+    def _validate_send_args(send_args: List[str], resume_token: Optional[str] = None) -> List[str]:
+        """Validate a zfs send command line, resuming from resume_token if given.
+
+        With a token, send_args only carries flags: the token names the
+        snapshot and the offset to resume from.
+        """
+        if resume_token:
+            return [*SecurityUtils.validate_zfs_command_args("send", *send_args, "-t"),
+                    SecurityUtils.validate_zfs_resume_token(resume_token)]
+        return SecurityUtils.validate_zfs_command_args("send", *send_args)
+
+    def _zfs_send_command(self, send_args: List[str], source_host: Optional[str] = None,
+                          source_ssh_user: str = "root", source_ssh_port: int = 22,
+                          resume_token: Optional[str] = None) -> List[str]:
+        """Build the zfs send argv, wrapped in ssh when the source is remote"""
+        zfs_send_cmd = self._validate_send_args(send_args, resume_token)
+        if source_host:
+            return SecurityUtils.build_ssh_command(
+                source_host, source_ssh_user, source_ssh_port, " ".join(zfs_send_cmd))
+        # The send side is exec'd directly, so undo the shell quoting
+        return shlex.split(" ".join(zfs_send_cmd))
 
-            cmd = [
-                "sh", "-c",
-                f"{' '.join(zfs_send_cmd)} | {' '.join(ssh_cmd)}"
-            ]
+    async def _stream_zfs_send(
+            self,
+            send_args: List[str],
+            receive_args: List[str],
+            target_host: str,
+            target_dataset: str,
+            ssh_user: str = "root",
+            ssh_port: int = 22,
+            progress_callback: Optional[ProgressCallback] = None,
+            source_host: Optional[str] = None,
+            source_ssh_user: str = "root",
+            source_ssh_port: int = 22) -> bool:
+        """Pump a zfs send stream into a resumable receive on the target.
+
+        The receive runs with ``-s`` so an interrupted stream leaves resumable
+        state behind; failed attempts are retried with exponential backoff,
+        from the target's ``receive_resume_token`` when there is one and from
+        the start otherwise. State left by an earlier run is resumed when it
+        belongs to the same snapshot. One metrics object is shared by all
+        attempts so progress accumulates across resumes.
+
+        With a remote source that can reach the target itself, the stream runs
+        directly between the two hosts instead of through this one.
+        """
+        migration_config = get_config().migration
+        source = (source_host, source_ssh_user, source_ssh_port)
+
+        # Partial state from an earlier transfer of the same snapshot is picked
+        # up where it stopped; state for any other snapshot would make a fresh
+        # receive fail
+        resume_token = await self.get_receive_resume_token(
+            target_host, target_dataset, ssh_user, ssh_port)
+        if resume_token and await self.resume_token_matches(resume_token, send_args[-1], source):
+            logger.info(f"Resuming interrupted receive of {send_args[-1]} on {target_host}:{target_dataset}")
+        elif resume_token:
+            logger.warning(f"Discarding interrupted receive state on {target_host}:{target_dataset}")
+            await self.abort_interrupted_receive(target_host, target_dataset, ssh_user, ssh_port)
+            resume_token = None
+
+        # Relayed streams are hashed as they pass and again on the target
+        digest_algorithm = stream_digest_algorithm()
+        try:
+            receive_cmd = SecurityUtils.validate_zfs_command_args("receive", "-s", *receive_args)
+            receive_line = " ".join(receive_cmd)
+            sink_cmd = SecurityUtils.build_ssh_command(
+                target_host, ssh_user, ssh_port,
+                wrap_sink_with_digest(receive_line, digest_algorithm) if digest_algorithm else receive_line)
         except SecurityValidationError as e:
             logger.error(f"Security validation failed for ZFS commands: {e}")
             return False
 
-        returncode, stdout, stderr = await self.run_command(cmd)
+        metrics = TransferMetrics(
+            estimated_total_bytes=await self.estimate_send_size(*send_args, source=source))
+        max_attempts = max(1, migration_config.zfs_resume_max_attempts)
+        direct = await can_stream_directly(source, target_host, ssh_user, ssh_port)
+        if direct:
+            logger.info(f"Streaming {target_dataset} directly from {source_host} to {target_host}")
 
-        if returncode != 0:
-            logger.error(f"ZFS send failed for {snapshot_name}: {stderr}")
+        for attempt in range(1, max_attempts + 1):
+            args = [] if resume_token else send_args
+            try:
+                if direct:
+                    # -v -P reports the bytes sent so far on stderr every second
+                    producer = self._validate_send_args(["-v", "-P", *args], resume_token)
+                    stream = DirectStream(parse_zfs_send_progress, progress_callback=progress_callback,
+                                          metrics=metrics)
+                    result = await stream.run(build_direct_command(
+                        source, producer, target_host, ssh_user, ssh_port, receive_line))
+                else:
+                    source_cmd = self._zfs_send_command(args, *source, resume_token=resume_token)
+                    async with get_bandwidth_allocator().lease(target_host) as lease:
+                        pump = StreamPump(progress_callback=progress_callback, metrics=metrics,
+                                          bandwidth_lease=lease, hash_algorithm=digest_algorithm)
+                        result = await pump.run(source_cmd, sink_cmd)
+                if result.success:
+                    logger.info(
+                        f"ZFS stream to {target_host}:{target_dataset} complete: "
+                        f"{format_bytes(metrics.bytes_transferred)} at "
+                        f"{format_bytes(int(metrics.average_bps))}/s"
+                        f"{f' after {metrics.resume_count} resumes' if metrics.resume_count else ''}")
+                    return True
+                error = result.error_message
+            except SecurityValidationError as e:
+                logger.error(f"Security validation failed for ZFS commands: {e}")
+                return False
+            except Exception as e:
+                error = str(e)
+
+            logger.warning(
+                f"ZFS stream to {target_host}:{target_dataset} failed "
+                f"(attempt {attempt}/{max_attempts}): {error}")
+            if attempt == max_attempts:
+                break
+
+            # A stream that failed before the receive wrote anything (ssh
+            # could not connect, early reset) leaves no token; start over
+            resume_token = await self.get_receive_resume_token(
+                target_host, target_dataset, ssh_user, ssh_port)
+
+            delay = min(migration_config.zfs_resume_backoff_seconds * 2 ** (attempt - 1),
+                        migration_config.zfs_resume_max_backoff_seconds)
+            if resume_token:
+                logger.info(f"Resuming ZFS stream to {target_host}:{target_dataset} in {delay}s")
+                metrics.resume_count += 1
+            else:
+                logger.info(f"No resume token on {target_host}:{target_dataset}, "
+                            f"restarting ZFS stream in {delay}s")
+            await asyncio.sleep(delay)
+
+        logger.error(f"ZFS stream to {target_host}:{target_dataset} failed after {max_attempts} attempts")
+        return False
+
+    async def get_receive_resume_token(self, target_host: str, target_dataset: str,
+                                       ssh_user: str = "root", ssh_port: int = 22) -> Optional[str]:
+        """Read the resume token left by an interrupted ``zfs receive -s``"""
+        try:
+            get_cmd = SecurityUtils.validate_zfs_command_args(
+                "get", "-H", "-o", "value", "receive_resume_token", target_dataset)
+            cmd = SecurityUtils.build_ssh_command(
+                target_host, ssh_user, ssh_port, " ".join(get_cmd))
+        except SecurityValidationError as e:
+            logger.error(f"Security validation failed: {e}")
+            return None
+
+        returncode, stdout, _ = await self.run_command(cmd)
+        token = stdout.strip()
+        if returncode != 0 or not token or token == "-":
+            return None
+        return token
+
+    async def resume_token_matches(self, resume_token: str, snapshot: str,
+                                   source: Tuple[Optional[str], str, int] = (None, "root", 22)) -> bool:
+        """Whether a resume token continues a receive of this snapshot.
+
+        ``zfs send -nv -t`` decodes the token on the source; its toguid must
+        equal the guid of the snapshot being sent. Anything that cannot be
+        checked counts as a mismatch.
+        """
+        source_host, source_ssh_user, source_ssh_port = source
+        try:
+            decode_cmd = self._zfs_send_command(["-n", "-v"], *source, resume_token=resume_token)
+            guid_cmd = SecurityUtils.validate_zfs_command_args(
+                "get", "-H", "-p", "-o", "value", "guid", snapshot)
+            if source_host:
+                guid_cmd = SecurityUtils.build_ssh_command(
+                    source_host, source_ssh_user, source_ssh_port, " ".join(guid_cmd))
+            else:
+                guid_cmd = shlex.split(" ".join(guid_cmd))
+        except SecurityValidationError as e:
+            logger.warning(f"Cannot check resume token against {snapshot}: {e}")
+            return False
+
+        (decode_rc, decode_out, decode_err), (guid_rc, guid_out, _) = await asyncio.gather(
+            self.run_command(decode_cmd), self.run_command(guid_cmd))
+        if decode_rc != 0 or guid_rc != 0:
+            return False
+
+        # The token contents are an nvlist dump with a "toguid = 0x..." line
+        token_guid = None
+        for line in (decode_out + "\n" + decode_err).splitlines():
+            fields = line.split()
+            if len(fields) == 3 and fields[0] == "toguid" and fields[1] == "=":
+                try:
+                    token_guid = int(fields[2], 0)
+                except ValueError:
+                    return False
+        try:
+            return token_guid is not None and token_guid == int(guid_out.strip())
+        except ValueError:
             return False
 
-        logger.info(f"Successfully transferred {snapshot_name} via ZFS send")
+    async def abort_interrupted_receive(self, target_host: str, target_dataset: str,
+                                        ssh_user: str = "root", ssh_port: int = 22) -> bool:
+        """Discard the partial state of an interrupted receive"""
+        try:
+            abort_cmd = SecurityUtils.validate_zfs_command_args("receive", "-A", target_dataset)
+            cmd = SecurityUtils.build_ssh_command(
+                target_host, ssh_user, ssh_port, " ".join(abort_cmd))
+        except SecurityValidationError as e:
+            logger.error(f"Security validation failed: {e}")
+            return False
+
+        returncode, _, stderr = await self.run_command(cmd)
+        if returncode != 0:
+            logger.warning(f"Failed to abort interrupted receive on {target_dataset}: {stderr}")
+            return False
         return True
 
+    async def estimate_send_size(self, *send_args: str,
+                                 source: Tuple[Optional[str], str, int] = (None, "root", 22)) -> Optional[int]:
+        """Estimate the size of a ZFS send stream with a dry run"""
+        try:
+            cmd = self._zfs_send_command(["-n", "-P", *send_args], *source)
+        except SecurityValidationError as e:
+            logger.debug(f"Cannot estimate send size: {e}")
+            return None
+
+        returncode, stdout, stderr = await self.run_command(cmd)
+        if returncode != 0:
+            return None
+
+        # Parsable dry-run output ends with "size\t<bytes>"; older releases
+        # print it to stderr instead of stdout
+        for line in reversed((stdout + "\n" + stderr).splitlines()):
+            fields = line.split()
+            if len(fields) == 2 and fields[0] == "size" and fields[1].isdigit():
+                return int(fields[1])
+        return None
+
     async def transfer_via_rsync(self, source_path: str, target_host: str,
                                  target_path: str, ssh_user: str = "root",
-                                 ssh_port: int = 22) -> bool:
-        """Transfer data using rsync"""
+                                 ssh_port: int = 22,
+                                 progress_callback: Optional[RsyncProgressCallback] = None,
+                                 compression: Optional[CompressionDecision] = None) -> bool:
+        """Transfer data using rsync, sharded over parallel processes for large trees"""
         logger.info(
             f"Transferring {source_path} via rsync to {target_host}:{target_path}")
 
@@ -163,30 +555,179 @@ class TransferOperations:
         if parent_dir:
             await self.create_target_directories(target_host, [parent_dir], ssh_user, ssh_port)
 
-        # Build secure rsync command using new RsyncConfig
-        try:
-            config = RsyncConfig(
-                source=f"{source_path}/",
-                hostname=target_host,
-                username=ssh_user,
-                port=ssh_port,
-                target=f"{target_path}/",
-                additional_args=["--delete"]
+        compression_args = compression.rsync_args() if compression else []
+
+        sharded = ShardedRsync()
+        shards = await sharded.plan(source_path)
+        if shards:
+            success = await sharded.run(
+                shards, source_path, target_host, target_path, ssh_user, ssh_port,
+                progress_callback=progress_callback, extra_args=compression_args
             )
-            cmd = SecurityUtils.build_rsync_command(config)
+            if success:
+                logger.info(f"Successfully transferred {source_path} via {len(shards)} parallel rsync shards")
+            return success
+
+        async with get_bandwidth_allocator().lease(target_host, fixed=True) as lease:
+            # Build secure rsync command using new RsyncConfig
+            try:
+                config = RsyncConfig(
+                    source=f"{source_path}/",
+                    hostname=target_host,
+                    username=ssh_user,
+                    port=ssh_port,
+                    target=f"{target_path}/",
+                    additional_args=["--delete", *RSYNC_PROGRESS_ARGS, *compression_args, *lease.rsync_args()]
+                )
+                cmd = SecurityUtils.build_rsync_command(config)
+            except SecurityValidationError as e:
+                logger.error(f"Failed to build secure rsync command: {e}")
+                return False
+
+            returncode, stderr = await run_rsync(cmd, progress_callback)
+
+        if returncode == RSYNC_VANISHED_FILES:
+            # Expected on a pass over a live tree; the next pass or the final copy catches up
+            logger.warning(f"Some files of {source_path} vanished during rsync: {stderr.strip()}")
+        elif returncode != 0:
+            logger.error(f"rsync failed for {source_path}: {stderr}")
+            return False
+
+        logger.info(f"Successfully transferred {source_path} via rsync")
+        return True
+
+    async def transfer_via_tar_stream(self, source_path: str, target_host: str,
+                                      target_path: str, ssh_user: str = "root",
+                                      ssh_port: int = 22,
+                                      progress_callback: Optional[ProgressCallback] = None,
+                                      source_host: Optional[str] = None,
+                                      source_ssh_user: str = "root",
+                                      source_ssh_port: int = 22,
+                                      codec: Optional[str] = None) -> bool:
+        """Stream a tar archive of source_path into target_path through the transfer engine.
+
+        Files are added or overwritten but never deleted, so this is meant for
+        the first copy into an empty target.
+        """
+        logger.info(f"Transferring {source_path} via tar stream to {target_host}:{target_path}")
+        source = (source_host, source_ssh_user, source_ssh_port)
+        codec = codec if codec is not None else get_config().migration.tar_stream_compression or None
+
+        try:
+            source_path = SecurityUtils.sanitize_path(source_path, allow_absolute=True)
+            target_path = SecurityUtils.sanitize_path(target_path, allow_absolute=True)
+            if codec and codec not in TAR_CODECS:
+                raise SecurityValidationError(f"Unsupported tar stream codec: {codec}")
+            source_cmd = build_tar_create_command(source_path, codec, source)
+            sink_cmd = build_tar_extract_command(target_host, target_path, ssh_user, ssh_port, codec)
         except SecurityValidationError as e:
-            logger.error(f"Failed to build secure rsync command: {e}")
+            logger.error(f"Security validation failed for tar stream: {e}")
             return False
 
-        returncode, stdout, stderr = await self.run_command(cmd)
+        profile = await profile_file_tree(source_path, source)
+        metrics = TransferMetrics(estimated_total_bytes=profile.total_bytes if profile and not codec else None)
+
+        if await can_stream_directly(source, target_host, ssh_user, ssh_port):
+            # tar has no running byte count; --totals reports it at the end
+            tar_args = build_tar_create_command(source_path, codec)
+            tar_args.insert(1, "--totals")
+            producer = [SecurityUtils.escape_shell_argument(arg) for arg in tar_args]
+            logger.info(f"Streaming {source_path} directly from {source_host} to {target_host}")
+            stream = DirectStream(parse_tar_totals, progress_callback=progress_callback, metrics=metrics)
+            try:
+                result = await stream.run(build_direct_command(
+                    source, producer, target_host, ssh_user, ssh_port, sink_cmd[-1]))
+            except Exception as e:
+                logger.error(f"Tar stream of {source_path} failed to start: {e}")
+                return False
+        else:
+            async with get_bandwidth_allocator().lease(target_host) as lease:
+                pump = StreamPump(progress_callback=progress_callback, metrics=metrics, bandwidth_lease=lease)
+                try:
+                    result = await pump.run(source_cmd, sink_cmd)
+                except Exception as e:
+                    logger.error(f"Tar stream of {source_path} failed to start: {e}")
+                    return False
+
+        if not result.success:
+            logger.error(f"Tar stream of {source_path} to {target_host}:{target_path} failed: {result.error_message}")
+            return False
+
+        logger.info(
+            f"Successfully transferred {source_path} via tar stream: "
+            f"{format_bytes(metrics.bytes_transferred)} at {format_bytes(int(metrics.average_bps))}/s")
+        return True
+
+    async def transfer_via_local_copy(self, source_path: str, target_path: str,
+                                      progress_callback: Optional[RsyncProgressCallback] = None) -> bool:
+        """Copy a volume to another path on this host with a local rsync, without SSH"""
+        logger.info(f"Copying {source_path} to {target_path} locally")
+
+        try:
+            source_path = SecurityUtils.sanitize_path(source_path, allow_absolute=True)
+            target_path = SecurityUtils.sanitize_path(target_path, allow_absolute=True)
+        except SecurityValidationError as e:
+            logger.error(f"Path validation failed: {e}")
+            return False
 
+        try:
+            os.makedirs(target_path, exist_ok=True)
+        except OSError as e:
+            logger.error(f"Failed to create {target_path}: {e}")
+            return False
+
+        cmd = ["rsync", "-aH", "--numeric-ids", "--delete", *RSYNC_PROGRESS_ARGS,
+               f"{source_path}/", f"{target_path}/"]
+        returncode, stderr = await run_rsync(cmd, progress_callback)
         if returncode != 0:
-            logger.error(f"rsync failed for {source_path}: {stderr}")
+            logger.error(f"Local copy failed for {source_path}: {stderr}")
             return False
 
-        logger.info(f"Successfully transferred {source_path} via rsync")
+        logger.info(f"Successfully copied {source_path} to {target_path}")
         return True
 
+    async def choose_file_transfer_method(self, source_path: str, target_host: str,
+                                          target_path: str, ssh_user: str = "root",
+                                          ssh_port: int = 22,
+                                          source: Tuple[Optional[str], str, int] = (None, "root", 22),
+                                          profile: Optional[FileTreeProfile] = None
+                                          ) -> Tuple[TransferMethod, Optional[FileTreeProfile]]:
+        """Pick rsync or a tar stream for a volume without a ZFS path.
+
+        Tar wins for trees of many small files, as long as the target is empty
+        and nothing has to be deleted or skipped. The tree is only walked when
+        no profile from an earlier call is given; the profile used is returned
+        with the method so callers can keep it.
+        """
+        # Checked first: it is one cheap round trip, profiling walks the whole tree
+        if not await self.is_remote_directory_empty(target_host, target_path, ssh_user, ssh_port):
+            return TransferMethod.RSYNC, profile
+
+        if profile is None:
+            profile = await profile_file_tree(source_path, source)
+        if not profile or not profile.favors_tar_stream():
+            return TransferMethod.RSYNC, profile
+
+        logger.info(
+            f"Using tar stream for {source_path}: {profile.file_count} files averaging "
+            f"{format_bytes(int(profile.average_file_bytes))}")
+        return TransferMethod.TAR_STREAM, profile
+
+    async def is_remote_directory_empty(self, target_host: str, target_path: str,
+                                        ssh_user: str = "root", ssh_port: int = 22) -> bool:
+        """Check that a remote directory is missing or has no entries"""
+        try:
+            escaped_path = SecurityUtils.escape_shell_argument(target_path)
+            cmd = SecurityUtils.build_ssh_command(
+                target_host, ssh_user, ssh_port,
+                f"[ ! -d {escaped_path} ] || [ -z \"$(ls -A {escaped_path})\" ]")
+        except SecurityValidationError as e:
+            logger.error(f"Security validation failed: {e}")
+            return False
+
+        returncode, _, _ = await self.run_command(cmd)
+        return returncode == 0
+
     async def mount_snapshot_for_rsync(
             self, snapshot_name: str) -> Optional[str]:
         """Mount a ZFS snapshot for rsync transfer"""
@@ -282,6 +823,111 @@ class TransferOperations:
         logger.info(f"Cleaned up rsync mount {mount_point}")
         return True
 
+    async def transfer_via_zfs_diff(
+            self,
+            base_snapshot: str,
+            snapshot_name: str,
+            mountpoint: str,
+            target_host: str,
+            target_path: str,
+            ssh_user: str = "root",
+            ssh_port: int = 22,
+            progress_callback: Optional[RsyncProgressCallback] = None,
+            compression: Optional[CompressionDecision] = None) -> bool:
+        """Bring a target synced from base_snapshot up to snapshot_name.
+
+        Only the paths zfs diff reports are touched: removed and renamed-away
+        paths are deleted on the target, then the changed ones are copied from
+        the mounted snapshot with rsync ``--files-from``.
+        """
+        try:
+            target_path = SecurityUtils.sanitize_path(target_path, allow_absolute=True)
+        except SecurityValidationError as e:
+            logger.error(f"Path validation failed: {e}")
+            return False
+
+        delta = await read_zfs_diff(base_snapshot, snapshot_name, mountpoint)
+        if delta.error:
+            logger.error(delta.error)
+            return False
+        logger.info(
+            f"zfs diff {base_snapshot} -> {snapshot_name}: {delta.modified} modified, "
+            f"{delta.created} created, {delta.removed} removed, {delta.renamed} renamed")
+
+        if delta.delete and not await self._delete_remote_paths(
+                target_host, target_path, delta.delete, ssh_user, ssh_port):
+            return False
+
+        if not delta.transfer and not delta.renamed_directories:
+            if progress_callback:
+                await progress_callback(RsyncProgress(rsync_percent=100, changed_files=0, changed_bytes=0))
+            return True
+
+        mount_point = await self.mount_snapshot_for_rsync(snapshot_name)
+        if not mount_point:
+            return False
+
+        try:
+            paths = delta.transfer
+            if delta.renamed_directories:
+                paths = paths + await asyncio.get_running_loop().run_in_executor(
+                    None, expand_directories, mount_point, delta.renamed_directories)
+            compression_args = compression.rsync_args() if compression else []
+
+            async with get_bandwidth_allocator().lease(target_host, fixed=True) as lease:
+                try:
+                    cmd = build_rsync_argv(
+                        mount_point, target_host, target_path, ssh_user, ssh_port,
+                        ["--from0", "--files-from=-", *RSYNC_PROGRESS_ARGS, *compression_args,
+                         *lease.rsync_args()],
+                        delete=False
+                    )
+                except SecurityValidationError as e:
+                    logger.error(f"Failed to build secure rsync command: {e}")
+                    return False
+                returncode, stderr = await run_rsync(
+                    cmd, progress_callback, b"".join(path + b"\0" for path in paths))
+        finally:
+            await self.cleanup_rsync_mount(mount_point, snapshot_name)
+
+        if returncode != 0:
+            logger.error(f"rsync of the zfs diff delta of {snapshot_name} failed: {stderr}")
+            return False
+
+        logger.info(f"Transferred {len(paths)} changed paths of {snapshot_name} to {target_host}:{target_path}")
+        return True
+
+    async def _delete_remote_paths(self, target_host: str, target_path: str, paths: List[bytes],
+                                   ssh_user: str = "root", ssh_port: int = 22) -> bool:
+        """Remove paths relative to target_path on the target, read NUL delimited from stdin"""
+        try:
+            cmd = SecurityUtils.build_ssh_command(
+                target_host, ssh_user, ssh_port,
+                f"cd -- {SecurityUtils.escape_shell_argument(target_path)} && xargs -0 -r rm -rf --")
+        except SecurityValidationError as e:
+            logger.error(f"Security validation failed: {e}")
+            return False
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.PIPE,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate(b"".join(path + b"\0" for path in paths))
+        except Exception as e:
+            logger.error(f"Failed to delete removed paths on {target_host}: {e}")
+            return False
+
+        if process.returncode != 0:
+            logger.error(
+                f"Failed to delete removed paths under {target_host}:{target_path}: "
+                f"{stderr.decode(errors='replace').strip()}")
+            return False
+        logger.info(f"Deleted {len(paths)} removed paths under {target_host}:{target_path}")
+        return True
+
     async def transfer_volume_data(
             self,
             volume: VolumeMount,
@@ -293,7 +939,9 @@ class TransferOperations:
             ssh_port: int = 22,
             source_host: Optional[str] = None,
             source_ssh_user: str = "root",
-            source_ssh_port: int = 22) -> bool:
+            source_ssh_port: int = 22,
+            progress_callback: Optional[ProgressCallback] = None,
+            rsync_progress_callback: Optional[RsyncProgressCallback] = None) -> bool:
         """Transfer a volume's data based on the chosen method"""
 
         if transfer_method == TransferMethod.ZFS_SEND:
@@ -312,15 +960,25 @@ class TransferOperations:
                 )
             # Local source ZFS send
             return await self.transfer_via_zfs_send(
-                snapshot_name, target_host, target_dataset, ssh_user, ssh_port
+                snapshot_name, target_host, target_dataset, ssh_user, ssh_port,
+                progress_callback=progress_callback
             )
         
+        if transfer_method == TransferMethod.TAR_STREAM and source_host:
+            # Remote source tar stream, relayed through this host
+            return await self.transfer_via_tar_stream(
+                volume.source, target_host, target_path, ssh_user, ssh_port,
+                progress_callback=progress_callback, source_host=source_host,
+                source_ssh_user=source_ssh_user, source_ssh_port=source_ssh_port
+            )
+
         # RSYNC
         if source_host:
             # Remote source rsync
             return await self.transfer_via_remote_rsync(
                 volume.source, source_host, source_ssh_user, source_ssh_port,
-                target_host, target_path, ssh_user, ssh_port
+                target_host, target_path, ssh_user, ssh_port,
+                progress_callback=rsync_progress_callback
             )
         # Local source rsync - mount the snapshot and rsync
         mount_point = await self.mount_snapshot_for_rsync(snapshot_name)
@@ -328,8 +986,14 @@ class TransferOperations:
             return False
 
         try:
+            if transfer_method == TransferMethod.TAR_STREAM:
+                return await self.transfer_via_tar_stream(
+                    mount_point, target_host, target_path, ssh_user, ssh_port,
+                    progress_callback=progress_callback
+                )
             success = await self.transfer_via_rsync(
-                mount_point, target_host, target_path, ssh_user, ssh_port
+                mount_point, target_host, target_path, ssh_user, ssh_port,
+                progress_callback=rsync_progress_callback
             )
             return success
         finally:
@@ -362,58 +1026,68 @@ class TransferOperations:
     async def verify_transfer(self, source_path: str, target_host: str,
                               target_path: str, ssh_user: str = "root",
                               ssh_port: int = 22) -> bool:
-        """Verify that the transfer was successful by comparing file counts"""
+        """Verify that the transfer was successful by comparing file manifests"""
+        diff = await self.verify_transfer_manifest(source_path, target_host, target_path, ssh_user, ssh_port)
+        return diff.matched
+
+    async def verify_transfer_manifest(self, source_path: str, target_host: str,
+                                       target_path: str, ssh_user: str = "root",
+                                       ssh_port: int = 22,
+                                       hash_algorithm: Optional[str] = None,
+                                       source: Tuple[Optional[str], str, int] = (None, "root", 22)
+                                       ) -> ManifestDiff:
+        """Diff path, size, mtime and mode (and optionally content hash) of every file on both sides"""
         try:
-            # Validate inputs before using in shell commands
             SecurityUtils.validate_hostname(target_host)
             SecurityUtils.validate_username(ssh_user)
             SecurityUtils.validate_port(ssh_port)
-            source_path = SecurityUtils.sanitize_path(
-                source_path, allow_absolute=True)
-            target_path = SecurityUtils.sanitize_path(
-                target_path, allow_absolute=True)
-            # Count files in source - use shell=True to handle pipe
-            source_count_cmd = f"find {SecurityUtils.escape_shell_argument(source_path)} -type f | wc -l"
-            process = await asyncio.create_subprocess_shell(
-                source_count_cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            stdout, stderr = await process.communicate()
-            returncode = process.returncode if process.returncode is not None else 1
-
-            if returncode != 0:
-                logger.error(
-                    f"Failed to count source files: {stderr.decode()}")
-                return False
-
-            source_count = int(stdout.decode().strip())
-
-            # Count files on target via SSH
-            count_cmd = f"find {SecurityUtils.escape_shell_argument(target_path)} -type f | wc -l"
-            ssh_cmd = SecurityUtils.build_ssh_command(
-                target_host, ssh_user, ssh_port, count_cmd)
-
-            returncode, stdout, stderr = await self.run_command(ssh_cmd)
-            if returncode != 0:
-                logger.error(f"Failed to count target files: {stderr}")
-                return False
-
-            target_count = int(stdout.strip())
-
-            # Compare counts
-            if source_count == target_count:
-                logger.info(
-                    f"Transfer verification successful: {source_count} files")
-                return True
-            else:
-                logger.error(
-                    f"Transfer verification failed: {source_count} source files != {target_count} target files")
-                return False
+            source_cmd = build_manifest_command(source_path, hash_algorithm, source)
+            target_cmd = build_manifest_command(target_path, hash_algorithm, (target_host, ssh_user, ssh_port))
+        except SecurityValidationError as e:
+            logger.error(f"Security validation failed: {e}")
+            return ManifestDiff(hash_algorithm=hash_algorithm, error=str(e))
 
-        except Exception as e:
-            logger.error(f"Transfer verification failed: {e}")
-            return False
+        diff = await diff_manifests(source_cmd, target_cmd, hash_algorithm)
+        if diff.error:
+            logger.error(f"Transfer verification of {source_path} failed: {diff.error}")
+        elif diff.matched:
+            logger.info(
+                f"Transfer verification successful: {diff.files_compared} files, "
+                f"{format_bytes(diff.bytes_compared)}")
+        else:
+            logger.error(
+                f"Transfer verification failed for {target_host}:{target_path}: "
+                f"{diff.missing_count} missing, {diff.extra_count} extra, "
+                f"{diff.mismatched_count + diff.hash_mismatched_count} mismatched")
+        return diff
+
+    async def compare_trees(self, source_path: str, target_host: str,
+                            target_path: str, ssh_user: str = "root",
+                            ssh_port: int = 22, hash_algorithm: str = "sha256",
+                            source: Tuple[Optional[str], str, int] = (None, "root", 22)
+                            ) -> MerkleDiff:
+        """Compare file contents on both sides by hash tree, exchanging only differing directories"""
+        try:
+            SecurityUtils.validate_hostname(target_host)
+            SecurityUtils.validate_username(ssh_user)
+            SecurityUtils.validate_port(ssh_port)
+            source_cmd = build_merkle_command(source_path, hash_algorithm, source)
+            target_cmd = build_merkle_command(target_path, hash_algorithm, (target_host, ssh_user, ssh_port))
+        except SecurityValidationError as e:
+            logger.error(f"Security validation failed: {e}")
+            return MerkleDiff(hash_algorithm=hash_algorithm, error=str(e))
+
+        diff = await diff_trees(source_cmd, target_cmd, hash_algorithm)
+        if diff.error:
+            logger.error(f"Tree comparison of {source_path} failed: {diff.error}")
+        elif diff.identical:
+            logger.info(f"{target_host}:{target_path} is identical to {source_path}")
+        else:
+            logger.info(
+                f"{target_host}:{target_path} differs from {source_path} after comparing "
+                f"{diff.directories_compared} directories: {len(diff.changed)} changed, "
+                f"{len(diff.missing)} missing, {len(diff.extra)} extra")
+        return diff
 
     async def rsync_transfer(
             self,
@@ -501,46 +1175,30 @@ class TransferOperations:
             SecurityUtils.validate_username(target_ssh_user)
             SecurityUtils.validate_port(target_ssh_port)
             
-            # Build the ZFS send command on source host
-            zfs_send_cmd = f"zfs send {SecurityUtils.escape_shell_argument(snapshot_name)}"
-            
-            # Build the ZFS receive command on target host
-            zfs_recv_cmd = f"zfs recv {SecurityUtils.escape_shell_argument(target_dataset)}"
-            
-            # Build the full command: ssh source "zfs send" | ssh target "zfs recv"
-            source_ssh_cmd = SecurityUtils.build_ssh_command(
-                source_host, source_ssh_user, source_ssh_port, zfs_send_cmd
-            )
-            target_ssh_cmd = SecurityUtils.build_ssh_command(
-                target_host, target_ssh_user, target_ssh_port, zfs_recv_cmd
-            )
-            
-            # Combine the commands with a pipe
-            full_cmd = source_ssh_cmd + ["|"] + target_ssh_cmd
-            
-            # Execute the command
-            process = await asyncio.create_subprocess_shell(
-                " ".join(full_cmd),
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            returncode = process.returncode if process.returncode is not None else 1
-            
-            if returncode != 0:
-                logger.error(f"Remote ZFS send failed: {stderr.decode()}")
-                return False
-            
-            logger.info(f"Successfully transferred {snapshot_name} from {source_host} to {target_host}")
-            return True
-            
+            SecurityUtils.validate_dataset_name(target_dataset)
+            if '@' not in snapshot_name or len(snapshot_name) > 256:
+                raise SecurityValidationError(
+                    f"Invalid snapshot name: {snapshot_name}")
         except SecurityValidationError as e:
             logger.error(f"Security validation failed for remote ZFS send: {e}")
             return False
-        except Exception as e:
-            logger.error(f"Remote ZFS send failed: {e}")
-            return False
+
+        send_flags = await self.negotiate_send_flags(
+            snapshot_name.split('@')[0], target_host, target_dataset,
+            target_ssh_user, target_ssh_port,
+            source=(source_host, source_ssh_user, source_ssh_port)
+        )
+
+        # Relay ssh source "zfs send" into ssh target "zfs receive"
+        success = await self._stream_zfs_send(
+            [*send_flags, snapshot_name], [target_dataset], target_host, target_dataset,
+            target_ssh_user, target_ssh_port,
+            source_host=source_host, source_ssh_user=source_ssh_user,
+            source_ssh_port=source_ssh_port
+        )
+        if success:
+            logger.info(f"Successfully transferred {snapshot_name} from {source_host} to {target_host}")
+        return success
     
     async def transfer_via_remote_rsync(
             self,
@@ -551,7 +1209,9 @@ class TransferOperations:
             target_host: str,
             target_path: str,
             target_ssh_user: str = "root",
-            target_ssh_port: int = 22) -> bool:
+            target_ssh_port: int = 22,
+            progress_callback: Optional[RsyncProgressCallback] = None,
+            compression: Optional[CompressionDecision] = None) -> bool:
         """Transfer data using rsync between two remote hosts."""
         logger.info(
             f"Transferring {source_path} from {source_host} to {target_host}:{target_path} via rsync")
@@ -574,27 +1234,40 @@ class TransferOperations:
                 target_host, [os.path.dirname(safe_target_path)], target_ssh_user, target_ssh_port
             )
 
-            # Build the rsync command to be executed on the source host
-            rsync_cmd_str = (
-                f"rsync -avzP --delete "
-                f"-e '{SecurityUtils.escape_shell_argument(f'ssh -p {target_ssh_port}')}' "
-                f"{SecurityUtils.escape_shell_argument(f'{safe_source_path}/')} "
-                f"{SecurityUtils.escape_shell_argument(f'{target_ssh_user}@{target_host}:{safe_target_path}/')}"
-            )
-            
-            # Build the outer SSH command to run rsync on the source host
-            cmd = SecurityUtils.build_ssh_command(
-                source_host,
-                source_ssh_user,
-                source_ssh_port,
-                rsync_cmd_str
-            )
-            
+            source = (source_host, source_ssh_user, source_ssh_port)
+            compression_args = compression.rsync_args() if compression else []
+            sharded = ShardedRsync()
+            shards = await sharded.plan(safe_source_path, source=source)
+            if shards:
+                success = await sharded.run(
+                    shards, safe_source_path, target_host, safe_target_path,
+                    target_ssh_user, target_ssh_port, source=source,
+                    progress_callback=progress_callback, extra_args=compression_args
+                )
+                if success:
+                    logger.info(
+                        f"Successfully transferred {safe_source_path} from {source_host} to {target_host} "
+                        f"via {len(shards)} parallel rsync shards")
+                return success
+
         except SecurityValidationError as e:
             logger.error(f"Security validation failed: {e}")
             return False
 
-        returncode, stdout, stderr = await self.run_command(cmd)
+        async with get_bandwidth_allocator().lease(target_host, fixed=True) as lease:
+            try:
+                # Build the rsync command to be executed on the source host
+                cmd = build_rsync_argv(
+                    safe_source_path, target_host, safe_target_path,
+                    target_ssh_user, target_ssh_port,
+                    [*RSYNC_PROGRESS_ARGS, *compression_args, *lease.rsync_args()],
+                    source=source
+                )
+            except SecurityValidationError as e:
+                logger.error(f"Security validation failed: {e}")
+                return False
+
+            returncode, stderr = await run_rsync(cmd, progress_callback)
 
         if returncode != 0:
             logger.error(
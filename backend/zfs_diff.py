@@ -0,0 +1,173 @@
+"""
+zfs diff driven file lists for TransDock.
+
+An rsync delta pass over a live tree stats every file on both sides to find
+the few that changed. When the source is a ZFS dataset, ``zfs diff`` between
+the snapshot the previous pass copied from and a new one lists exactly the
+changed, created, removed and renamed paths, read from the dataset's object
+changes rather than a tree walk. The output is parsed as it streams into the
+paths to copy from the new snapshot (fed to rsync with ``--files-from``) and
+the paths to remove on the target, which rsync cannot delete on its own when
+it only sees a file list.
+"""
+
+import asyncio
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from .security_utils import SecurityUtils, SecurityValidationError
+
+logger = logging.getLogger(__name__)
+
+# zfs diff writes bytes outside printable ASCII, spaces and backslashes as
+# a backslash and four octal digits
+ESCAPED_BYTE = re.compile(rb'\\([0-7]{4})')
+
+# Change types: modified, created, removed, renamed
+CHANGE_TYPES = {b"M", b"+", b"-", b"R"}
+
+# File type column of zfs diff -F
+DIRECTORY = b"/"
+
+
+def unescape_path(path: bytes) -> bytes:
+    return ESCAPED_BYTE.sub(lambda match: bytes([int(match.group(1), 8) & 0xFF]), path)
+
+
+def _relative(path: bytes, mountpoint: bytes) -> Optional[bytes]:
+    """Path relative to the dataset mountpoint, None for the root or paths outside it"""
+    prefix = mountpoint.rstrip(b"/") + b"/"
+    if not path.startswith(prefix):
+        return None
+    relative = path[len(prefix):].rstrip(b"/")
+    if not relative or b".." in relative.split(b"/"):
+        return None
+    return relative
+
+
+@dataclass
+class ZfsDiffDelta:
+    """Paths that changed between two snapshots of a dataset, relative to its mountpoint"""
+    # Files, links and directories to copy from the newer snapshot
+    transfer: List[bytes] = field(default_factory=list)
+    # Renamed directories whose whole contents must be copied under the new name
+    renamed_directories: List[bytes] = field(default_factory=list)
+    # Paths to remove from the target before copying
+    delete: List[bytes] = field(default_factory=list)
+    modified: int = 0
+    created: int = 0
+    removed: int = 0
+    renamed: int = 0
+    error: Optional[str] = None
+
+    @property
+    def empty(self) -> bool:
+        return not self.transfer and not self.renamed_directories and not self.delete
+
+    def add(self, change: bytes, file_type: bytes, relative: bytes, new_relative: Optional[bytes]):
+        if change == b"M":
+            self.modified += 1
+            self.transfer.append(relative)
+        elif change == b"+":
+            self.created += 1
+            self.transfer.append(relative)
+        elif change == b"-":
+            self.removed += 1
+            self.delete.append(relative)
+        elif change == b"R":
+            self.renamed += 1
+            self.delete.append(relative)
+            if new_relative is None:
+                return
+            if file_type == DIRECTORY:
+                # Only the rename is logged; the entries inside did not change
+                self.renamed_directories.append(new_relative)
+            else:
+                self.transfer.append(new_relative)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "modified": self.modified,
+            "created": self.created,
+            "removed": self.removed,
+            "renamed": self.renamed,
+            "paths_to_transfer": len(self.transfer),
+            "renamed_directories": len(self.renamed_directories),
+            "paths_to_delete": len(self.delete),
+            "error": self.error,
+        }
+
+
+def parse_zfs_diff_line(line: bytes, mountpoint: bytes, delta: ZfsDiffDelta):
+    """Add one line of ``zfs diff -H -F`` output to the delta"""
+    fields = line.rstrip(b"\n").split(b"\t")
+    if len(fields) < 3 or fields[0] not in CHANGE_TYPES:
+        return
+    change, file_type, path = fields[0], fields[1], unescape_path(fields[2])
+    relative = _relative(path, mountpoint)
+    new_relative = None
+    if change == b"R":
+        if len(fields) < 4:
+            return
+        new_relative = _relative(unescape_path(fields[3]), mountpoint)
+        if relative is None and new_relative is None:
+            return
+        if relative is None:
+            # Moved in from outside the dataset: a plain creation here
+            delta.add(b"+", file_type, new_relative, None)
+            return
+    elif relative is None:
+        # The dataset root itself; its attributes do not need a pass of their own
+        return
+    delta.add(change, file_type, relative, new_relative)
+
+
+async def read_zfs_diff(base_snapshot: str, snapshot: str, mountpoint: str) -> ZfsDiffDelta:
+    """Run zfs diff between two snapshots and parse its output as it arrives"""
+    delta = ZfsDiffDelta()
+    try:
+        cmd = SecurityUtils.validate_zfs_command_args("diff", "-H", "-F", base_snapshot, snapshot)
+    except SecurityValidationError as e:
+        delta.error = str(e)
+        return delta
+
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    stderr_task = asyncio.create_task(process.stderr.read())
+    mountpoint_bytes = os.fsencode(mountpoint)
+    try:
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                break
+            parse_zfs_diff_line(line, mountpoint_bytes, delta)
+        returncode = await process.wait()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+        raise
+
+    stderr = (await stderr_task).decode(errors='replace').strip()
+    if returncode != 0:
+        delta.error = f"zfs diff {base_snapshot} {snapshot} failed (exit {returncode}): {stderr[-2000:]}"
+    return delta
+
+
+def expand_directories(root: str, directories: List[bytes]) -> List[bytes]:
+    """Every entry beneath the given directories of root, the directories included"""
+    paths = []
+    root_bytes = os.fsencode(root)
+    for directory in directories:
+        paths.append(directory)
+        for parent, dirnames, filenames in os.walk(os.path.join(root_bytes, directory)):
+            relative_parent = os.path.relpath(parent, root_bytes)
+            paths.extend(os.path.join(relative_parent, name) for name in dirnames + filenames)
+    return paths
@@ -19,6 +19,37 @@ class CommandResult:
             self.success = self.returncode == 0
 
 
+class CommandStream(ABC):
+    """Output lines of a running command, read as they arrive.
+
+    Use as an async context manager and iterate it for stdout lines without
+    their newline. Once the lines are exhausted ``result`` holds the exit
+    status and stderr (its stdout is empty). Leaving the context early stops
+    the command.
+    """
+    
+    result: Optional[CommandResult] = None
+    
+    async def __aenter__(self) -> 'CommandStream':
+        return self
+    
+    async def __aexit__(self, exc_type, exc, traceback) -> None:
+        await self.close()
+    
+    def __aiter__(self) -> 'CommandStream':
+        return self
+    
+    @abstractmethod
+    async def __anext__(self) -> str:
+        """Next line of output"""
+        pass
+    
+    @abstractmethod
+    async def close(self) -> None:
+        """Stop the command if it is still running"""
+        pass
+
+
 class ICommandExecutor(ABC):
     """Interface for command execution with validation"""
     
@@ -32,6 +63,11 @@ class ICommandExecutor(ABC):
         """Execute system command with validation"""
         pass
 
+    @abstractmethod
+    def execute_stream(self, command: str, *args: str) -> CommandStream:
+        """Execute system command with validation, streaming its output"""
+        pass
+
     @abstractmethod
     async def execute_remote(self, host: str, command: List[str], 
                            ssh_config: Optional['SSHConfig'] = None) -> CommandResult:
@@ -5,11 +5,92 @@ import asyncio
 import logging
 import os
 import hashlib
-import subprocess
 from pathlib import Path
 from typing import List, Optional
-from ..core.interfaces.command_executor import ICommandExecutor, CommandResult
+from ..core.interfaces.command_executor import ICommandExecutor, CommandResult, CommandStream
 from ..core.value_objects.ssh_config import SSHConfig
+from ...known_hosts import get_known_hosts_index, scan_host_key
+from ...ssh_pool import get_ssh_pool
+from ...ssh_sessions import get_ssh_session_pool, paramiko_transport_enabled
+
+
+# Longest single output line a stream accepts; total output is not limited
+MAX_STREAM_LINE_BYTES = 1024 * 1024
+
+# stderr kept from a streamed command
+MAX_STREAM_STDERR_BYTES = 64 * 1024
+
+
+class ProcessCommandStream(CommandStream):
+    """Lines of a local process's stdout, read as the process writes them.
+
+    Nothing is buffered beyond the pipe and one line, so a consumer that
+    parses slowly holds the process back instead of letting output pile up.
+    """
+    
+    def __init__(self, command: List[str], idle_timeout: Optional[float], logger: logging.Logger,
+                 error: Optional[str] = None):
+        self.command = command
+        self.idle_timeout = idle_timeout
+        self.logger = logger
+        self.result = CommandResult(success=False, returncode=1, stdout="", stderr=error) if error else None
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+    
+    async def _start(self) -> None:
+        self.logger.debug(f"Streaming command: {' '.join(self.command)}")
+        self._process = await asyncio.create_subprocess_exec(
+            *self.command,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=MAX_STREAM_LINE_BYTES
+        )
+        self._stderr_task = asyncio.create_task(self._read_stderr())
+    
+    async def _read_stderr(self) -> bytes:
+        kept = b""
+        while True:
+            chunk = await self._process.stderr.read(65536)
+            if not chunk:
+                return kept
+            kept = (kept + chunk)[-MAX_STREAM_STDERR_BYTES:]
+    
+    async def __anext__(self) -> str:
+        if self.result is not None:
+            raise StopAsyncIteration
+        try:
+            if self._process is None:
+                await self._start()
+            line = await asyncio.wait_for(self._process.stdout.readline(), timeout=self.idle_timeout)
+        except asyncio.TimeoutError:
+            await self._stop(124, f"Command produced no output for {self.idle_timeout} seconds")
+            raise StopAsyncIteration
+        except (OSError, ValueError) as e:
+            # ValueError: a line longer than MAX_STREAM_LINE_BYTES
+            await self._stop(1, f"Command execution failed: {str(e)}")
+            raise StopAsyncIteration
+        
+        if not line:
+            returncode = await self._process.wait()
+            stderr = (await self._stderr_task).decode('utf-8', errors='replace').strip()
+            if returncode != 0:
+                self.logger.warning(f"Command failed with exit code {returncode}: {stderr}")
+            self.result = CommandResult(returncode=returncode, stdout="", stderr=stderr)
+            raise StopAsyncIteration
+        return line.decode('utf-8', errors='replace').rstrip('\n')
+    
+    async def _stop(self, returncode: int, message: str) -> None:
+        if self._process is not None and self._process.returncode is None:
+            self._process.kill()
+            await self._process.wait()
+        if self._stderr_task is not None and not self._stderr_task.done():
+            self._stderr_task.cancel()
+        self.result = CommandResult(success=False, returncode=returncode, stdout="", stderr=message)
+    
+    async def close(self) -> None:
+        if self.result is None:
+            await self._stop(1, "Command stopped before its output was read")
 
 
 class CommandExecutor(ICommandExecutor):
@@ -22,6 +103,7 @@ class CommandExecutor(ICommandExecutor):
         # Set up known_hosts file path
         self.known_hosts_file = known_hosts_file or os.path.expanduser("~/.ssh/known_hosts")
         self._ensure_ssh_directory()
+        self.known_hosts = get_known_hosts_index(self.known_hosts_file)
         
         # Allowed ZFS commands for security
         self._allowed_zfs_commands = {
@@ -54,7 +136,7 @@ class CommandExecutor(ICommandExecutor):
             self.logger.error(f"Failed to set up SSH directory: {e}")
             raise
     
-    def _get_host_key(self, host: str, port: int = 22) -> Optional[str]:
+    async def _get_host_key(self, host: str, port: int = 22) -> Optional[str]:
         """
         Get the host key for verification before connecting.
         
@@ -63,26 +145,14 @@ class CommandExecutor(ICommandExecutor):
             port: SSH port (default 22)
             
         Returns:
-            Host key string if available, None otherwise
+            Host key lines if available, None otherwise
         """
         try:
-            # Use ssh-keyscan to get the host key
-            cmd = ["ssh-keyscan", "-p", str(port), host]
-            process = asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            # Note: This is a synchronous operation for key scanning
-            # In production, you might want to make this async
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0 and result.stdout.strip():
-                return result.stdout.strip()
-            else:
-                self.logger.warning(f"Failed to get host key for {host}:{port}")
-                return None
+            key_lines = await scan_host_key(host, port)
+            if key_lines:
+                return "\n".join(key_lines)
+            self.logger.warning(f"Failed to get host key for {host}:{port}")
+            return None
                 
         except Exception as e:
             self.logger.error(f"Error getting host key for {host}:{port}: {e}")
@@ -100,30 +170,12 @@ class CommandExecutor(ICommandExecutor):
             True if host is known, False otherwise
         """
         try:
-            if not Path(self.known_hosts_file).exists():
-                return False
-                
-            with open(self.known_hosts_file, 'r') as f:
-                content = f.read()
-                
-            # Check for various host formats in known_hosts
-            host_patterns = [
-                host,  # hostname
-                f"[{host}]:{port}" if port != 22 else host,  # [hostname]:port
-                f"{host}:{port}" if port != 22 else host,   # hostname:port
-            ]
-            
-            for pattern in host_patterns:
-                if pattern in content:
-                    return True
-                    
-            return False
-            
+            return self.known_hosts.knows(host, port)
         except Exception as e:
             self.logger.error(f"Error checking known hosts: {e}")
             return False
     
-    def add_host_key(self, host: str, port: int = 22, auto_accept: bool = False) -> bool:
+    async def add_host_key(self, host: str, port: int = 22, auto_accept: bool = False) -> bool:
         """
         Add host key to known_hosts file.
         
@@ -140,7 +192,7 @@ class CommandExecutor(ICommandExecutor):
                 self.logger.info(f"Host {host}:{port} is already known")
                 return True
                 
-            host_key = self._get_host_key(host, port)
+            host_key = await self._get_host_key(host, port)
             if not host_key:
                 self.logger.error(f"Could not retrieve host key for {host}:{port}")
                 return False
@@ -155,8 +207,7 @@ class CommandExecutor(ICommandExecutor):
                 return False
             
             # Add the key to known_hosts
-            with open(self.known_hosts_file, 'a') as f:
-                f.write(f"{host_key}\n")
+            self.known_hosts.add(host_key.split("\n"))
                 
             self.logger.info(f"Added host key for {host}:{port} to known_hosts")
             return True
@@ -191,6 +242,20 @@ class CommandExecutor(ICommandExecutor):
         full_command = [command] + list(args)
         return await self._execute_command(full_command)
     
+    def execute_stream(self, command: str, *args: str) -> CommandStream:
+        """Execute system command with validation, yielding its output lines as they arrive.
+        
+        zfs subcommands are checked like execute_zfs. The command's timeout
+        applies to each wait for a line rather than to the whole command, so
+        long listings are not cut off while they keep producing output.
+        """
+        if command not in self._allowed_system_commands:
+            return ProcessCommandStream([], None, self.logger, error=f"System command '{command}' not allowed")
+        if command == "zfs" and (not args or args[0] not in self._allowed_zfs_commands):
+            subcommand = args[0] if args else ""
+            return ProcessCommandStream([], None, self.logger, error=f"ZFS command '{subcommand}' not allowed")
+        return ProcessCommandStream([command, *args], self.timeout, self.logger)
+    
     async def execute_remote(self, host: str, command: List[str], 
                            ssh_config: SSHConfig, auto_accept_hostkey: bool = False) -> CommandResult:
         """
@@ -211,7 +276,7 @@ class CommandExecutor(ICommandExecutor):
                 self.logger.warning(f"Host {host}:{ssh_config.port} is not in known_hosts")
                 
                 if auto_accept_hostkey:
-                    if not self.add_host_key(host, ssh_config.port, auto_accept=True):
+                    if not await self.add_host_key(host, ssh_config.port, auto_accept=True):
                         return CommandResult(
                             success=False,
                             returncode=1,
@@ -232,6 +297,9 @@ class CommandExecutor(ICommandExecutor):
                         )
                     )
             
+            if paramiko_transport_enabled():
+                return await self._execute_session(host, command, ssh_config)
+            
             # Build secure SSH command
             ssh_cmd = [
                 "ssh",
@@ -247,11 +315,21 @@ class CommandExecutor(ICommandExecutor):
             if ssh_config.key_file:
                 ssh_cmd.extend(["-i", ssh_config.key_file])
             
+            # Share a connection only with sessions that verify the host the same way
+            ssh_pool = get_ssh_pool()
+            ssh_cmd[1:1] = ssh_pool.ssh_options(
+                host, ssh_config.user, ssh_config.port,
+                profile=f"{self.known_hosts_file}:{ssh_config.key_file or ''}"
+            )
+            
             ssh_cmd.append(host)
             ssh_cmd.extend(command)
             
             self.logger.debug(f"Executing secure SSH command to {host}:{ssh_config.port}")
-            return await self._execute_command(ssh_cmd)
+            timing = ssh_pool.begin(ssh_cmd)
+            result = await self._execute_command(ssh_cmd)
+            ssh_pool.end(timing, result.returncode)
+            return result
             
         except Exception as e:
             self.logger.error(f"Remote execution failed: {e}")
@@ -262,6 +340,25 @@ class CommandExecutor(ICommandExecutor):
                 stderr=f"Remote execution failed: {str(e)}"
             )
     
+    async def _execute_session(self, host: str, command: List[str], ssh_config: SSHConfig) -> CommandResult:
+        """Run a remote command on a pooled in-process SSH session."""
+        self.logger.debug(f"Executing command over SSH session to {host}:{ssh_config.port}")
+        # ssh joins its command arguments with spaces; do the same
+        returncode, stdout, stderr = await get_ssh_session_pool().run(
+            host, ssh_config.user, ssh_config.port, " ".join(command),
+            timeout=self.timeout, known_hosts_file=self.known_hosts_file,
+            key_file=ssh_config.key_file
+        )
+        stdout, stderr = stdout.strip(), stderr.strip()
+        if returncode != 0:
+            self.logger.warning(f"Command failed with exit code {returncode}: {stderr}")
+        return CommandResult(
+            success=returncode == 0,
+            returncode=returncode,
+            stdout=stdout,
+            stderr=stderr
+        )
+    
     async def _execute_command(self, command: List[str]) -> CommandResult:
         """Execute command with proper error handling."""
         try:
@@ -93,21 +93,22 @@ class DatasetService:
                     ))
                 command_args.append(validated_pool)
             
-            result = await self._executor.execute_zfs(*command_args)
+            # Parse datasets as zfs lists them
+            datasets = []
+            async with self._executor.execute_stream("zfs", *command_args) as lines:
+                async for line in lines:
+                    dataset = self._parse_dataset_line(line)
+                    if dataset:
+                        datasets.append(dataset)
             
-            if not result.success:
+            if not lines.result.success:
                 return Result.failure(DatasetException(
-                    f"Failed to list datasets: {result.stderr}",
+                    f"Failed to list datasets: {lines.result.stderr}",
                     error_code="DATASET_LIST_FAILED"
                 ))
             
-            # Parse dataset list
-            datasets_result = await self._parse_dataset_list(result.stdout)
-            if datasets_result.is_failure:
-                return Result.failure(datasets_result.error)
-            
-            self._logger.info(f"Successfully listed {len(datasets_result.value)} datasets")
-            return Result.success(datasets_result.value)
+            self._logger.info(f"Successfully listed {len(datasets)} datasets")
+            return Result.success(datasets)
             
         except Exception as e:
             self._logger.error(f"Unexpected error listing datasets: {e}")
@@ -404,21 +405,21 @@ class DatasetService:
     async def _get_dataset_properties(self, name: DatasetName) -> Result[Dict[str, str], DatasetException]:
         """Get all properties for a dataset."""
         try:
-            result = await self._executor.execute_zfs("get", "-H", "-o", "property,value", "all", str(name))
-            
-            if not result.success:
+            properties = {}
+            async with self._executor.execute_stream(
+                    "zfs", "get", "-H", "-o", "property,value", "all", str(name)) as lines:
+                async for line in lines:
+                    if line.strip():
+                        parts = line.split('\t')
+                        if len(parts) >= 2:
+                            properties[parts[0]] = parts[1]
+            
+            if not lines.result.success:
                 return Result.failure(DatasetException(
-                    f"Failed to get properties: {result.stderr}",
+                    f"Failed to get properties: {lines.result.stderr}",
                     error_code="DATASET_PROPERTIES_FAILED"
                 ))
             
-            properties = {}
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    parts = line.split('\t')
-                    if len(parts) >= 2:
-                        properties[parts[0]] = parts[1]
-            
             return Result.success(properties)
             
         except Exception as e:
@@ -487,47 +488,10 @@ class DatasetService:
         """Parse list of datasets from ZFS output."""
         try:
             datasets = []
-            lines = output.strip().split('\n')
-            
-            for line in lines:
-                if not line.strip():
-                    continue
-                
-                parts = line.split('\t')
-                if len(parts) < 6:
-                    continue
-                
-                try:
-                    name = DatasetName.from_string(parts[0])
-                    used = SizeValue.from_zfs_string(parts[1]) if parts[1] != '-' else None
-                    available = SizeValue.from_zfs_string(parts[2]) if parts[2] != '-' else None
-                    
-                    # Parse creation time
-                    creation_time = None
-                    if parts[3] != '-':
-                        try:
-                            creation_time = datetime.fromtimestamp(int(parts[3]))
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    properties = {
-                        'mounted': parts[4],
-                        'mountpoint': parts[5]
-                    }
-                    
-                    dataset = Dataset(
-                        name=name,
-                        properties=properties,
-                        used=used,
-                        available=available,
-                        creation_time=creation_time
-                    )
-                    
+            for line in output.strip().split('\n'):
+                dataset = self._parse_dataset_line(line)
+                if dataset:
                     datasets.append(dataset)
-                    
-                except Exception as e:
-                    self._logger.warning(f"Failed to parse dataset line: {line}, error: {e}")
-                    continue
             
             return Result.success(datasets)
             
@@ -537,6 +501,45 @@ class DatasetService:
                 error_code="DATASET_LIST_PARSE_FAILED"
             ))
     
+    def _parse_dataset_line(self, line: str) -> Optional[Dataset]:
+        """Parse one line of dataset list output; None for blank or malformed lines."""
+        if not line.strip():
+            return None
+        
+        parts = line.split('\t')
+        if len(parts) < 6:
+            return None
+        
+        try:
+            name = DatasetName.from_string(parts[0])
+            used = SizeValue.from_zfs_string(parts[1]) if parts[1] != '-' else None
+            available = SizeValue.from_zfs_string(parts[2]) if parts[2] != '-' else None
+            
+            # Parse creation time
+            creation_time = None
+            if parts[3] != '-':
+                try:
+                    creation_time = datetime.fromtimestamp(int(parts[3]))
+                except (ValueError, TypeError):
+                    pass
+            
+            properties = {
+                'mounted': parts[4],
+                'mountpoint': parts[5]
+            }
+            
+            return Dataset(
+                name=name,
+                properties=properties,
+                used=used,
+                available=available,
+                creation_time=creation_time
+            )
+            
+        except Exception as e:
+            self._logger.warning(f"Failed to parse dataset line: {line}, error: {e}")
+            return None
+    
     async def _parse_usage_info(self, output: str) -> Result[Dict[str, Any], DatasetException]:
         """Parse usage information from ZFS output."""
         try:
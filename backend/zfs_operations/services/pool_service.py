@@ -92,22 +92,22 @@ class PoolService:
         try:
             self._logger.info("Listing all pools")
             
-            # Execute zpool list command
-            result = await self._executor.execute_system("zpool", "list", "-H", "-o", "name,size,alloc,free,ckpoint,expandsz,frag,cap,dedup,health,altroot")
+            # Execute zpool list command, parsing pools as they are listed
+            pools = []
+            async with self._executor.execute_stream("zpool", "list", "-H", "-o", "name,size,alloc,free,ckpoint,expandsz,frag,cap,dedup,health,altroot") as lines:
+                async for line in lines:
+                    pool = self._parse_pool_line(line)
+                    if pool:
+                        pools.append(pool)
             
-            if not result.success:
+            if not lines.result.success:
                 return Result.failure(PoolException(
-                    f"Failed to list pools: {result.stderr}",
+                    f"Failed to list pools: {lines.result.stderr}",
                     error_code="POOL_LIST_FAILED"
                 ))
             
-            # Parse pool list
-            pools_result = await self._parse_pool_list(result.stdout)
-            if pools_result.is_failure:
-                return Result.failure(pools_result.error)
-            
-            self._logger.info(f"Successfully listed {len(pools_result.value)} pools")
-            return Result.success(pools_result.value)
+            self._logger.info(f"Successfully listed {len(pools)} pools")
+            return Result.success(pools)
             
         except Exception as e:
             self._logger.error(f"Unexpected error listing pools: {e}")
@@ -388,22 +388,22 @@ class PoolService:
             if validation_result.is_failure:
                 return Result.failure(validation_result.error)
             
-            # Execute history command
-            result = await self._executor.execute_system("zpool", "history", "-l", pool_name)
+            # Execute history command, parsing events as they are read
+            history = []
+            async with self._executor.execute_stream("zpool", "history", "-l", pool_name) as lines:
+                async for line in lines:
+                    event = self._parse_history_line(line)
+                    if event:
+                        history.append(event)
             
-            if not result.success:
+            if not lines.result.success:
                 return Result.failure(PoolException(
-                    f"Failed to get pool history: {result.stderr}",
+                    f"Failed to get pool history: {lines.result.stderr}",
                     error_code="POOL_HISTORY_FAILED"
                 ))
             
-            # Parse history output
-            history_data = await self._parse_pool_history(result.stdout)
-            if history_data.is_failure:
-                return Result.failure(history_data.error)
-            
             self._logger.info(f"Successfully retrieved history for pool: {pool_name}")
-            return Result.success(history_data.value)
+            return Result.success(history)
             
         except Exception as e:
             self._logger.error(f"Unexpected error getting pool history {pool_name}: {e}")
@@ -452,21 +452,20 @@ class PoolService:
     async def _get_pool_properties(self, pool_name: str) -> Result[Dict[str, Any], PoolException]:
         """Get pool properties."""
         try:
-            result = await self._executor.execute_system("zpool", "get", "-H", "all", pool_name)
-            
-            if not result.success:
+            properties = {}
+            async with self._executor.execute_stream("zpool", "get", "-H", "all", pool_name) as lines:
+                async for line in lines:
+                    if line.strip():
+                        parts = line.split('\t')
+                        if len(parts) >= 3:
+                            properties[parts[1]] = parts[2]
+            
+            if not lines.result.success:
                 return Result.failure(PoolException(
-                    f"Failed to get pool properties: {result.stderr}",
+                    f"Failed to get pool properties: {lines.result.stderr}",
                     error_code="POOL_PROPERTIES_FAILED"
                 ))
             
-            properties = {}
-            for line in result.stdout.strip().split('\n'):
-                if line.strip():
-                    parts = line.split('\t')
-                    if len(parts) >= 3:
-                        properties[parts[1]] = parts[2]
-            
             return Result.success(properties)
             
         except Exception as e:
@@ -726,30 +725,10 @@ class PoolService:
         """Parse list of pools from zpool list output."""
         try:
             pools = []
-            lines = output.strip().split('\n')
-            
-            for line in lines:
-                if not line.strip():
-                    continue
-                
-                parts = line.split('\t')
-                if len(parts) < 11:
-                    continue
-                
-                try:
-                    pool = Pool(
-                        name=parts[0],
-                        state=PoolState.ONLINE,  # Default, will be updated by status check
-                        size=SizeValue.from_zfs_string(parts[1]),
-                        allocated=SizeValue.from_zfs_string(parts[2]),
-                        free=SizeValue.from_zfs_string(parts[3])
-                    )
-                    
+            for line in output.strip().split('\n'):
+                pool = self._parse_pool_line(line)
+                if pool:
                     pools.append(pool)
-                    
-                except Exception as e:
-                    self._logger.warning(f"Failed to parse pool line: {line}, error: {e}")
-                    continue
             
             return Result.success(pools)
             
@@ -759,6 +738,28 @@ class PoolService:
                 error_code="POOL_LIST_PARSE_FAILED"
             ))
     
+    def _parse_pool_line(self, line: str) -> Optional[Pool]:
+        """Parse one line of zpool list output; None for blank or malformed lines."""
+        if not line.strip():
+            return None
+        
+        parts = line.split('\t')
+        if len(parts) < 11:
+            return None
+        
+        try:
+            return Pool(
+                name=parts[0],
+                state=PoolState.ONLINE,  # Default, will be updated by status check
+                size=SizeValue.from_zfs_string(parts[1]),
+                allocated=SizeValue.from_zfs_string(parts[2]),
+                free=SizeValue.from_zfs_string(parts[3])
+            )
+            
+        except Exception as e:
+            self._logger.warning(f"Failed to parse pool line: {line}, error: {e}")
+            return None
+    
     async def _parse_iostat_output(self, output: str) -> Result[Dict[str, Any], PoolException]:
         """Parse zpool iostat output."""
         try:
@@ -797,15 +798,10 @@ class PoolService:
         """Parse pool history output."""
         try:
             history = []
-            lines = output.strip().split('\n')
-            
-            for line in lines:
-                if line.strip() and not line.startswith('History'):
-                    # Basic parsing - would need more sophisticated parsing for full history
-                    history.append({
-                        'timestamp': datetime.now(),
-                        'event': line.strip()
-                    })
+            for line in output.strip().split('\n'):
+                event = self._parse_history_line(line)
+                if event:
+                    history.append(event)
             
             return Result.success(history)
             
@@ -815,6 +811,16 @@ class PoolService:
                 error_code="POOL_HISTORY_PARSE_FAILED"
             ))
     
+    def _parse_history_line(self, line: str) -> Optional[Dict[str, Any]]:
+        """Parse one line of zpool history output; None for blank and header lines."""
+        if not line.strip() or line.startswith('History'):
+            return None
+        # Basic parsing - would need more sophisticated parsing for full history
+        return {
+            'timestamp': datetime.now(),
+            'event': line.strip()
+        }
+    
     # === Additional methods for router compatibility ===
     
     async def get_zfs_iostat(self, 
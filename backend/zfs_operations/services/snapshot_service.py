@@ -151,22 +151,22 @@ class SnapshotService:
                     ))
                 command_args.append(str(dataset_name))
             
-            # Execute command
-            result = await self._executor.execute_zfs(*command_args)
+            # Execute command, parsing snapshots as zfs lists them
+            snapshots = []
+            async with self._executor.execute_stream("zfs", *command_args) as lines:
+                async for line in lines:
+                    snapshot = self._parse_snapshot_line(line)
+                    if snapshot:
+                        snapshots.append(snapshot)
             
-            if not result.success:
+            if not lines.result.success:
                 return Result.failure(SnapshotException(
-                    f"Failed to list snapshots: {result.stderr}",
+                    f"Failed to list snapshots: {lines.result.stderr}",
                     error_code="SNAPSHOT_LIST_FAILED"
                 ))
             
-            # Parse snapshot list
-            snapshots_result = await self._parse_snapshot_list(result.stdout)
-            if snapshots_result.is_failure:
-                return Result.failure(snapshots_result.error)
-            
-            self._logger.info(f"Successfully listed {len(snapshots_result.value)} snapshots")
-            return Result.success(snapshots_result.value)
+            self._logger.info(f"Successfully listed {len(snapshots)} snapshots")
+            return Result.success(snapshots)
             
         except Exception as e:
             self._logger.error(f"Unexpected error listing snapshots: {e}")
@@ -450,8 +450,8 @@ class SnapshotService:
                     f"Invalid dataset name: {dataset_name}"
                 ))
             
-            # Validate snapshot name
-            validated_snapshot = self._validator.validate_snapshot_name(snapshot_name)
+            # Validate snapshot name (the validator expects the full dataset@snapshot form)
+            validated_snapshot = self._validator.validate_snapshot_name(f"{dataset_name}@{snapshot_name}")
             if not validated_snapshot:
                 return Result.failure(ValidationException(
                     f"Invalid snapshot name: {snapshot_name}"
@@ -616,56 +616,10 @@ class SnapshotService:
         """Parse list of snapshots from ZFS output."""
         try:
             snapshots = []
-            lines = output.strip().split('\n')
-            
-            for line in lines:
-                if not line.strip():
-                    continue
-                
-                parts = line.split('\t')
-                if len(parts) < 5:
-                    continue
-                
-                try:
-                    # Parse snapshot name (format: dataset@snapshot)
-                    full_name = parts[0]
-                    if '@' not in full_name:
-                        continue
-                    
-                    dataset_str, snapshot_name = full_name.split('@', 1)
-                    dataset_name = DatasetName.from_string(dataset_str)
-                    
-                    # Parse other fields
-                    used = SizeValue.from_zfs_string(parts[1]) if parts[1] != '-' else SizeValue(0)
-                    referenced = SizeValue.from_zfs_string(parts[2]) if parts[2] != '-' else SizeValue(0)
-                    
-                    # Parse creation time
-                    creation_time = None
-                    if parts[3] != '-':
-                        try:
-                            creation_time = datetime.fromtimestamp(int(parts[3]))
-                        except (ValueError, TypeError):
-                            pass
-                    
-                    # Parse clones
-                    clones = []
-                    if parts[4] != '-':
-                        clones = [clone.strip() for clone in parts[4].split(',') if clone.strip()]
-                    
-                    snapshot = Snapshot(
-                        name=snapshot_name,
-                        dataset=dataset_name,
-                        creation_time=creation_time or datetime.now(),
-                        used=used,
-                        referenced=referenced,
-                        clones=clones
-                    )
-                    
+            for line in output.strip().split('\n'):
+                snapshot = self._parse_snapshot_line(line)
+                if snapshot:
                     snapshots.append(snapshot)
-                    
-                except Exception as e:
-                    self._logger.warning(f"Failed to parse snapshot line: {line}, error: {e}")
-                    continue
             
             return Result.success(snapshots)
             
@@ -673,4 +627,52 @@ class SnapshotService:
             return Result.failure(SnapshotException(
                 f"Failed to parse snapshot list: {str(e)}",
                 error_code="SNAPSHOT_LIST_PARSE_FAILED"
-            )) 
\ No newline at end of file
+            ))
+    
+    def _parse_snapshot_line(self, line: str) -> Optional[Snapshot]:
+        """Parse one line of snapshot list output; None for blank or malformed lines."""
+        if not line.strip():
+            return None
+        
+        parts = line.split('\t')
+        if len(parts) < 5:
+            return None
+        
+        try:
+            # Parse snapshot name (format: dataset@snapshot)
+            full_name = parts[0]
+            if '@' not in full_name:
+                return None
+            
+            dataset_str, snapshot_name = full_name.split('@', 1)
+            dataset_name = DatasetName.from_string(dataset_str)
+            
+            # Parse other fields
+            used = SizeValue.from_zfs_string(parts[1]) if parts[1] != '-' else SizeValue(0)
+            referenced = SizeValue.from_zfs_string(parts[2]) if parts[2] != '-' else SizeValue(0)
+            
+            # Parse creation time
+            creation_time = None
+            if parts[3] != '-':
+                try:
+                    creation_time = datetime.fromtimestamp(int(parts[3]))
+                except (ValueError, TypeError):
+                    pass
+            
+            # Parse clones
+            clones = []
+            if parts[4] != '-':
+                clones = [clone.strip() for clone in parts[4].split(',') if clone.strip()]
+            
+            return Snapshot(
+                name=snapshot_name,
+                dataset=dataset_name,
+                creation_time=creation_time or datetime.now(),
+                used=used,
+                referenced=referenced,
+                clones=clones
+            )
+            
+        except Exception as e:
+            self._logger.warning(f"Failed to parse snapshot line: {line}, error: {e}")
+            return None
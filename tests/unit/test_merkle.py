@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from backend.merkle import MerkleDiff, build_merkle_command, diff_trees
+
+
+def unlisted_tree(root_digest: str):
+    """A tree session reporting root_digest that answers every listing with no children"""
+    return ["sh", "-c", f"printf 'ready\\t{root_digest}\\n'; "
+            "while IFS= read -r line; do [ -n \"$line\" ] || echo .; done"]
+
+
+def make_tree(root, directories: int, tag: str):
+    """One file per directory whose content depends on tag, plus a shared file"""
+    for i in range(directories):
+        directory = root / f"d{i}"
+        directory.mkdir()
+        (directory / "f").write_text(f"{tag}{i}")
+    (root / "same file").write_text("same")
+
+
+class TestMerkleDiff:
+    """Test comparing trees by hash tree."""
+
+    def test_identical_requires_equal_root_digests(self):
+        """A diff without listed differences is only identical when the roots match."""
+        assert MerkleDiff("sha256", source_digest="a", target_digest="a").identical
+        assert not MerkleDiff("sha256", source_digest="a", target_digest="b").identical
+        assert not MerkleDiff("sha256").identical
+
+    async def test_identical_trees(self, tmp_path):
+        make_tree(tmp_path, 10, "a")
+        diff = await diff_trees(build_merkle_command(str(tmp_path)), build_merkle_command(str(tmp_path)))
+        assert diff.error is None
+        assert diff.identical
+        assert diff.directories_compared == 0
+
+    @pytest.mark.slow
+    async def test_many_differing_directories(self, tmp_path):
+        """A level with more ids than fit in one argument is still listed completely."""
+        source, target = tmp_path / "source", tmp_path / "target"
+        source.mkdir()
+        target.mkdir()
+        make_tree(source, 25000, "a")
+        make_tree(target, 25000, "b")
+
+        diff = await diff_trees(build_merkle_command(str(source)), build_merkle_command(str(target)))
+
+        assert diff.error is None
+        assert not diff.identical
+        assert len(diff.changed) == 25000
+        assert "d0/f" in diff.changed
+        assert not diff.missing and not diff.extra
+
+    async def test_differing_digest_without_differing_children_is_an_error(self):
+        """Lost listings must not make differing trees look identical."""
+        diff = await diff_trees(unlisted_tree("aaaa"), unlisted_tree("bbbb"))
+        assert diff.error is not None
+        assert not diff.identical
+
+    async def test_failed_build_is_reported(self, tmp_path):
+        make_tree(tmp_path, 3, "a")
+        missing = os.path.join(str(tmp_path), "missing")
+        diff = await diff_trees(build_merkle_command(str(tmp_path)), build_merkle_command(missing))
+        assert diff.error is not None
+        assert not diff.identical